@@ -0,0 +1,47 @@
+import logging
+import struct
+import timeit
+
+import numpy as np
+
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.svp_handler import SvpHandler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+sizes = [100, 1000, 10000, 50000]
+repeats = 5
+
+
+def looped_sis5_points(depths: np.ndarray, speeds: np.ndarray) -> bytes:
+    """the former encoding: one struct.pack per point, concatenated"""
+    svp = b""
+    for count in range(depths.size):
+        svp += struct.pack("<2fI2f", depths[count], speeds[count], 0, 0.0, 0.0)
+    return svp
+
+
+def looped_sis4_points(depths: np.ndarray, speeds: np.ndarray) -> bytes:
+    """the former encoding: one struct.pack per point, concatenated"""
+    svp = b""
+    for count in range(depths.size):
+        svp += struct.pack("<II", int(depths[count] / 0.01), int(speeds[count] * 10))
+    return svp
+
+
+handler = SvpHandler(store=DatagramStore())
+
+for size in sizes:
+    depths = np.linspace(0.0, 6000.0, size)
+    speeds = np.linspace(1540.0, 1480.0, size)
+
+    encoders = [
+        ("SIS5", looped_sis5_points, lambda: handler._create_sis5_ssp(depths=depths, speeds=speeds)),
+        ("SIS4", looped_sis4_points, lambda: handler._create_sis4_ssp(depths=depths, speeds=speeds)),
+    ]
+    for name, looped, vectorized in encoders:
+        t_looped = min(timeit.repeat(lambda: looped(depths, speeds), number=1, repeat=repeats))
+        t_vectorized = min(timeit.repeat(vectorized, number=1, repeat=repeats))
+        logger.info("%s %6d samples -> looped: %9.3f ms, vectorized: %7.3f ms (x%.0f)"
+                    % (name, size, t_looped * 1000.0, t_vectorized * 1000.0, t_looped / t_vectorized))
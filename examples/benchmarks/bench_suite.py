@@ -0,0 +1,192 @@
+"""Offline benchmark suite, on synthetic files
+
+It measures the datagram readers, the end-to-end replay over loopback, and the encoding of the sound speed profiles.
+The results are stored as JSON and, when a baseline is passed, compared with it (non-zero exit code on regressions).
+
+    python bench_suite.py --output current.json --baseline previous.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+from hyo2.kng import __version__
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.kng_all import KngAll
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+from hyo2.kng.lib.svp_handler import SvpHandler
+from hyo2.kng.lib.threads.replay_thread import ReplayThread
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def bench_read(path: str, reader_class, repeats: int) -> float:
+    """datagrams/s of the header reader over the whole file"""
+    file_size = os.path.getsize(path)
+
+    def read() -> int:
+        count = 0
+        with open(path, "rb") as fid:
+            while fid.tell() < file_size:
+                if reader_class().read(fid, file_size) != reader_class.Flags.VALID:
+                    raise RuntimeError("invalid datagram in %s" % path)
+                count += 1
+        return count
+
+    count = read()
+    return count / min(timeit.repeat(read, number=1, repeat=repeats))
+
+
+def bench_replay(path: str, use_sis5: bool, timeout: float = 300.0) -> float:
+    """datagrams/s replayed as fast as possible by a replay thread to a loopback receiver
+
+    A RuntimeError is raised when the replay does not complete within the timeout [s].
+    """
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 22)
+    rx.bind(("127.0.0.1", 0))
+    rx.settimeout(0.2)
+    received = [0]
+    done = threading.Event()
+
+    def drain() -> None:
+        while not done.is_set():
+            try:
+                rx.recv(2 ** 16)
+                received[0] += 1
+
+            except socket.timeout:
+                continue
+
+    t_rx = threading.Thread(target=drain, daemon=True)
+    t_rx.start()
+
+    replay = ReplayThread(store=DatagramStore(), files=[path], port_out=rx.getsockname()[1], ip_out="127.0.0.1",
+                          use_sis5=use_sis5, pacing=ReplayPacer.Modes.TIMESTAMP, replay_speed=0.0, loops=1,
+                          batch_size=64)
+    start = time.perf_counter()
+    deadline = start + timeout
+    replay.start()
+    try:
+        while not replay.playlist.finished:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("replay of %s not completed in %.0f s" % (path, timeout))
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        count = replay.stats()["datagrams"]
+
+    finally:
+        replay.stop()
+        replay.join()
+
+        done.set()
+        t_rx.join()
+        rx.close()
+    logger.info("replay: %d datagrams sent, %d received" % (count, received[0]))
+    return count / elapsed
+
+
+def bench_ssp(use_sis5: bool, samples: int, repeats: int) -> float:
+    """profiles/s encoded from depth and sound speed arrays"""
+    import numpy as np
+
+    handler = SvpHandler(store=DatagramStore())
+    depths = np.linspace(0.0, 6000.0, samples)
+    speeds = np.linspace(1540.0, 1480.0, samples)
+    if use_sis5:
+        encode = lambda: handler._create_sis5_ssp(depths=depths, speeds=speeds)  # noqa: E731
+    else:
+        encode = lambda: handler._create_sis4_ssp(depths=depths, speeds=speeds)  # noqa: E731
+    number = 100
+    return number / min(timeit.repeat(encode, number=number, repeat=repeats))
+
+
+def run(size: int, repeats: int) -> dict:
+    folder = tempfile.mkdtemp()
+    try:
+        generator = KngGenerator(seed=0, ping_rate=10.0)
+        all_path = os.path.join(folder, "bench.all")
+        kmall_path = os.path.join(folder, "bench.kmall")
+        generator.write(all_path, size=size)
+        generator.write(kmall_path, size=size)
+
+        results = dict()
+        results["read_all"] = {"value": bench_read(all_path, KngAll, repeats), "unit": "dg/s"}
+        results["read_kmall"] = {"value": bench_read(kmall_path, KngKmall, repeats), "unit": "dg/s"}
+        results["replay_all"] = {"value": bench_replay(all_path, use_sis5=False), "unit": "dg/s"}
+        results["replay_kmall"] = {"value": bench_replay(kmall_path, use_sis5=True), "unit": "dg/s"}
+        for samples in [100, 10000]:
+            results["ssp_sis5_%d" % samples] = {"value": bench_ssp(True, samples, repeats), "unit": "profiles/s"}
+            results["ssp_sis4_%d" % samples] = {"value": bench_ssp(False, samples, repeats), "unit": "profiles/s"}
+        return results
+
+    finally:
+        shutil.rmtree(folder)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """log the ratios with the baseline, and return the number of regressions (all the values are rates)"""
+    regressions = 0
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = result["value"] / reference["value"]
+        regressed = ratio < (1.0 - tolerance)
+        regressions += int(regressed)
+        logger.info("%-16s %12.1f vs. %12.1f %s (x%.2f)%s"
+                    % (name, result["value"], reference["value"], result["unit"], ratio,
+                       " <- REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite, on synthetic files")
+    parser.add_argument("--size", type=float, default=20.0, help="size of each synthetic file [MB]")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of each timing (the best is kept)")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown flagged as regression")
+    args = parser.parse_args()
+
+    results = run(size=int(args.size * 1024 ** 2), repeats=args.repeats)
+    for name, result in results.items():
+        logger.info("%-16s %12.1f %s" % (name, result["value"], result["unit"]))
+
+    with open(args.output, "w") as fod:
+        json.dump({
+            "meta": {
+                "version": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "size": args.size,
+            },
+            "results": results,
+        }, fod, indent=2)
+    logger.info("results stored in %s" % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as fid:
+            baseline = json.load(fid)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions > 0:
+            logger.warning("%d regressions" % regressions)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
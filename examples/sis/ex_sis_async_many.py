@@ -0,0 +1,35 @@
+import asyncio
+import logging
+import os
+from hyo2.abc2.lib.testing import Testing
+from hyo2.abc2.lib.logging import set_logging
+from hyo2.kng.lib.sis_async import SisAsync
+
+set_logging(ns_list=['hyo2.kng'])
+logger = logging.getLogger(__name__)
+
+data_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+testing = Testing(root_folder=data_folder)
+test_files = testing.download_test_files(ext=".kmall")
+
+ip_out = "localhost"
+nr_sounders = 4
+
+
+async def main():
+    # one event loop hosting several emulated sounders, each one with its own ports
+    sounders = list()
+    for i in range(nr_sounders):
+        sis = SisAsync(port_in=4001 + i, port_out=16103 + i, ip_out=ip_out, use_sis5=True)
+        sis.set_files(test_files)
+        sounders.append(asyncio.create_task(sis.run()))
+
+    await asyncio.sleep(10)
+    for sounder in sounders:
+        sounder.cancel()
+    await asyncio.gather(*sounders, return_exceptions=True)
+    logger.debug("all the emulated sounders stopped")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,8 +1,6 @@
 import logging
 import os
 
-from hyo2.abc2.lib.package.pkg_info import PkgInfo
-
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
@@ -10,21 +8,30 @@ name = "Kng"
 __version__ = "1.3.1"
 __author__ = "gmasetti@ccom.unh.edu"
 
-pkg_info = PkgInfo(
-    name=name,
-    version=__version__,
-    author="Giuseppe Masetti",
-    author_email="gmasetti@ccom.unh.edu",
-    lic="LGPLv3",
-    lic_url="https://www.hydroffice.org/license/",
-    path=os.path.abspath(os.path.dirname(__file__)),
-    url="https://www.hydroffice.org/sis_emu/",
-    manual_url="https://www.hydroffice.org/manuals/kng/index.html",
-    support_email="sis_emu@hydroffice.org",
-    latest_url="https://www.hydroffice.org/latest/sis_emu.txt",
-    deps_dict={
-        "hyo2.abc2": "hyo2.abc2",
-        "PySide6": "PySide6",
-        "numpy": "numpy"
-    }
-)
+
+def __getattr__(attr: str):
+    # the package info requires hyo2.abc2: it is only built on first access, so that the library loads fast
+    if attr == "pkg_info":
+        from hyo2.abc2.lib.package.pkg_info import PkgInfo
+
+        global pkg_info
+        pkg_info = PkgInfo(
+            name=name,
+            version=__version__,
+            author="Giuseppe Masetti",
+            author_email="gmasetti@ccom.unh.edu",
+            lic="LGPLv3",
+            lic_url="https://www.hydroffice.org/license/",
+            path=os.path.abspath(os.path.dirname(__file__)),
+            url="https://www.hydroffice.org/sis_emu/",
+            manual_url="https://www.hydroffice.org/manuals/kng/index.html",
+            support_email="sis_emu@hydroffice.org",
+            latest_url="https://www.hydroffice.org/latest/sis_emu.txt",
+            deps_dict={
+                "hyo2.abc2": "hyo2.abc2",
+                "PySide6": "PySide6",
+                "numpy": "numpy"
+            }
+        )
+        return pkg_info
+    raise AttributeError("module %r has no attribute %r" % (__name__, attr))
@@ -5,6 +5,7 @@ from PySide6 import QtCore, QtGui, QtWidgets
 
 from hyo2.abc2.app.qt_progress import QtProgress
 from hyo2.kng.app.sis_emu import app_info
+from hyo2.kng.lib.replay_pacer import ReplayPacer
 from hyo2.kng.lib.sis import Sis
 
 logger = logging.getLogger(__name__)
@@ -170,6 +171,19 @@ class ControlPanel(QtWidgets.QWidget):
         self.set_timing.valueChanged.connect(self.on_replay_timing)
         hbox.addWidget(self.set_timing)
 
+        # pacing
+        hbox = QtWidgets.QHBoxLayout()
+        vbox.addLayout(hbox)
+        text_pacing = QtWidgets.QLabel("Pacing:")
+        hbox.addWidget(text_pacing)
+        text_pacing.setMinimumWidth(self.sis_settings_dist)
+        self.set_pacing = QtWidgets.QComboBox()
+        self.set_pacing.addItems(["Fixed timing", "Timestamps x0.5", "Timestamps x1", "Timestamps x10",
+                                  "As fast as possible"])
+        self.set_pacing.setToolTip('Space datagrams by the fixed timing or by their original timestamps')
+        hbox.addWidget(self.set_pacing)
+        hbox.addStretch()
+
         # verbose
         hbox = QtWidgets.QHBoxLayout()
         vbox.addLayout(hbox)
@@ -218,6 +232,7 @@ class ControlPanel(QtWidgets.QWidget):
         self.set_output_ip.setEnabled(enable)
         self.set_output_port.setEnabled(enable)
         self.set_verbose.setEnabled(enable)
+        self.set_pacing.setEnabled(enable)
         self.set_replay_mrz.setEnabled(enable)
         self.set_replay_ssm.setEnabled(enable)
         self.button_add_files.setEnabled(enable)
@@ -355,10 +370,11 @@ class ControlPanel(QtWidgets.QWidget):
         input_port = int(self.set_input_port.text())
         output_ip = self.set_output_ip.text()
         output_port = int(self.set_output_port.text())
+        pacing, replay_speed = self._pacing_settings()
         self.sis = Sis(port_in=input_port, port_out=output_port, ip_out=output_ip,
                        replay_timing=self._replay_timing, use_sis5=self.sis_5.isChecked(),
                        verbose=self.set_verbose.isChecked(), replay_ssm=self.set_replay_ssm.isChecked(),
-                       replay_mrz=self.set_replay_mrz.isChecked())
+                       replay_mrz=self.set_replay_mrz.isChecked(), pacing=pacing, replay_speed=replay_speed)
         logger.debug('created new simulator')
 
         file_list = list()
@@ -422,6 +438,23 @@ class ControlPanel(QtWidgets.QWidget):
 
         logger.debug("changed timing: %.4f" % self._replay_timing)
 
+    def _pacing_settings(self) -> tuple:
+        value = self.set_pacing.currentIndex()
+
+        if value == 1:
+            return ReplayPacer.Modes.TIMESTAMP, 0.5
+
+        elif value == 2:
+            return ReplayPacer.Modes.TIMESTAMP, 1.0
+
+        elif value == 3:
+            return ReplayPacer.Modes.TIMESTAMP, 10.0
+
+        elif value == 4:
+            return ReplayPacer.Modes.TIMESTAMP, 0.0
+
+        return ReplayPacer.Modes.FIXED, 1.0
+
     def update_gui(self):
         if self.sis is None:
             self.viewer.clear()
@@ -0,0 +1,5 @@
+import sys
+
+from hyo2.kng.lib.cli import main
+
+sys.exit(main())
@@ -0,0 +1,231 @@
+"""Headless SIS emulator
+
+Example:
+    python -m hyo2.kng.lib --port-out 16103 --pacing timestamp --loops 1 --exit-at-end file.kmall
+
+The settings are taken from the flags or from a TOML/JSON config file (using the flag names, with underscores, as
+keys), the flags taking precedence. The route table of the "table" reply mode is only set in the config file, as
+a "routes" table mapping the sender "ip:port" (or "ip") to the reply [ip, port]. While running, a JSON line with
+the throughput stats is printed every stats interval.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+from hyo2.kng.lib.reply_router import ReplyRouter
+from hyo2.kng.lib.sis import Sis
+from hyo2.kng.lib.sis_async import SisAsync
+
+logger = logging.getLogger(__name__)
+
+defaults = {
+    "files": list(),
+    "engine": "thread",
+    "port_in": 4001,
+    "port_out": 26103,
+    "ip_out": "localhost",
+    "sis4": False,
+    "pacing": "fixed",
+    "timing": 1.0,
+    "speed": 1.0,
+    "no_ssm": False,
+    "no_mrz": False,
+    "loops": None,
+    "shuffle": False,
+    "merge": False,
+    "batch_size": 1,
+    "max_packet_size": KngKmall.max_udp_size,
+    "cache_mb": 0.0,
+    "reply_mode": "fixed",
+    "routes": None,
+    "sounder_name": None,
+    "duration": None,
+    "exit_at_end": False,
+    "stats_interval": 1.0,
+    "metrics_port": None,
+    "metrics_ip": "127.0.0.1",
+    "instrument": False,
+    "instrument_json": None,
+    "verbose": False,
+}
+
+
+def load_config(path: str) -> dict:
+    """load the settings from a TOML or JSON file"""
+    ext = os.path.splitext(path)[-1].lower()
+    if ext == ".toml":
+        try:
+            import tomllib
+
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+
+            except ImportError:
+                raise RuntimeError("reading a TOML config requires Python 3.11 or the tomli package")
+
+        with open(path, "rb") as fid:
+            config = tomllib.load(fid)
+
+    elif ext == ".json":
+        with open(path, "r") as fid:
+            config = json.load(fid)
+
+    else:
+        raise RuntimeError("unsupported config format: %s" % path)
+
+    unknown = set(config) - set(defaults)
+    if len(unknown) > 0:
+        raise RuntimeError("unknown config keys: %s" % ", ".join(sorted(unknown)))
+    return config
+
+
+def parse_args(argv: Optional[List[str]] = None) -> dict:
+    """merge the built-in defaults, the config file and the flags"""
+    parser = argparse.ArgumentParser(prog="SISEmuCli", description="Headless SIS emulator")
+    parser.add_argument("files", nargs="*", default=None, help="the files to replay")
+    parser.add_argument("-c", "--config", help="TOML or JSON config file")
+    parser.add_argument("--engine", choices=["thread", "async"], help="emulator engine")
+    parser.add_argument("--port-in", type=int, help="port for the SVP requests")
+    parser.add_argument("--port-out", type=int, help="output port")
+    parser.add_argument("--ip-out", help="output address")
+    parser.add_argument("--sis4", action="store_true", default=None, help="emulate SIS 4 (.all/.wcd files)")
+    parser.add_argument("--pacing", choices=["fixed", "timestamp"], help="space by timing or by timestamps")
+    parser.add_argument("--timing", type=float, help="fixed timing between datagrams [s]")
+    parser.add_argument("--speed", type=float, help="timestamp speed factor (0 for as fast as possible)")
+    parser.add_argument("--no-ssm", action="store_true", default=None, help="do not replay #SSM datagrams")
+    parser.add_argument("--no-mrz", action="store_true", default=None, help="do not replay #MRZ/#SPO datagrams")
+    parser.add_argument("--loops", type=int, help="number of loops (default: forever)")
+    parser.add_argument("--shuffle", action="store_true", default=None, help="shuffle the files at each loop")
+    parser.add_argument("--merge", action="store_true", default=None, help="merge the files by timestamp")
+    parser.add_argument("--batch-size", type=int, help="datagrams sent per batch")
+    parser.add_argument("--max-packet-size", type=int, help="max UDP payload, larger datagrams are partitioned [B]")
+    parser.add_argument("--cache-mb", type=float, help="in-memory replay cache [MB]")
+    parser.add_argument("--reply-mode", choices=["fixed", "sender", "table"],
+                        help="SVP reply destination (the routes of the table mode are set in the config file)")
+    parser.add_argument("--sounder-name", help="emulated sounder name")
+    parser.add_argument("--duration", type=float, help="stop after the duration [s]")
+    parser.add_argument("--exit-at-end", action="store_true", default=None, help="stop at the end of the playlist")
+    parser.add_argument("--stats-interval", type=float, help="interval between the stats lines [s]")
+    parser.add_argument("--metrics-port", type=int, help="serve the Prometheus metrics on this port")
+    parser.add_argument("--metrics-ip", help="address of the metrics endpoint")
+    parser.add_argument("--instrument", action="store_true", default=None,
+                        help="time the stages of the hot paths, and print a summary at the end (on stderr)")
+    parser.add_argument("--instrument-json", help="JSON file for the stage timings (implies --instrument)")
+    parser.add_argument("-v", "--verbose", action="store_true", default=None, help="debug logging (on stderr)")
+    args = vars(parser.parse_args(argv))
+
+    settings = dict(defaults)
+    config = args.pop("config")
+    if config:
+        settings.update(load_config(config))
+    if len(args["files"]) == 0:
+        args["files"] = None
+    settings.update({key: value for key, value in args.items() if value is not None})
+    return settings
+
+
+def create_sis(settings: dict) -> Sis:
+    if settings["pacing"] == "timestamp":
+        pacing = ReplayPacer.Modes.TIMESTAMP
+    else:
+        pacing = ReplayPacer.Modes.FIXED
+    routes = settings["routes"]
+    if routes is not None:
+        routes = {sender: (address[0], int(address[1])) for sender, address in routes.items()}
+
+    if settings["engine"] == "async":
+        sis_class = SisAsync
+    else:
+        sis_class = Sis
+    sis = sis_class(port_in=settings["port_in"], port_out=settings["port_out"], ip_out=settings["ip_out"],
+                    replay_timing=settings["timing"], use_sis5=not settings["sis4"],
+                    replay_ssm=not settings["no_ssm"], replay_mrz=not settings["no_mrz"],
+                    verbose=settings["verbose"], pacing=pacing, replay_speed=settings["speed"],
+                    batch_size=settings["batch_size"], max_packet_size=settings["max_packet_size"],
+                    cache_budget=int(settings["cache_mb"] * 1024 ** 2),
+                    loops=settings["loops"], shuffle=settings["shuffle"], merge=settings["merge"],
+                    reply_mode=ReplyRouter.Modes[settings["reply_mode"].upper()], routes=routes,
+                    sounder_name=settings["sounder_name"], metrics_port=settings["metrics_port"],
+                    metrics_ip=settings["metrics_ip"], instrument=settings["instrument"],
+                    instrument_path=settings["instrument_json"])
+    sis.set_files(settings["files"])
+    return sis
+
+
+def print_stats(stats: dict, previous: dict, elapsed: float, interval: float, event: str) -> None:
+    line = {"event": event, "time": round(time.time(), 3), "elapsed": round(elapsed, 3)}
+    line.update(stats)
+    if interval > 0.0:
+        for key in ["datagrams", "packets", "bytes"]:
+            if key in stats:
+                line["%s_rate" % key] = round((stats[key] - previous.get(key, 0)) / interval, 1)
+    print(json.dumps(line), flush=True)
+
+
+def run(settings: dict) -> int:
+    sis = create_sis(settings)
+    interval = settings["stats_interval"]
+    duration = settings["duration"]
+
+    sis.start()
+    start = time.perf_counter()
+    last = start
+    previous = dict()
+    try:
+        while True:
+            elapsed = time.perf_counter() - start
+            wait = interval
+            if duration is not None:
+                wait = min(wait, max(duration - elapsed, 0.0))
+            if sis.terminated.wait(wait):
+                break
+
+            now = time.perf_counter()
+            stats = sis.stats()
+            print_stats(stats, previous, now - start, now - last, "stats")
+            previous = stats
+            last = now
+
+            if (duration is not None) and ((now - start) >= duration):
+                break
+            if settings["exit_at_end"] and stats.get("finished", False):
+                break
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        sis.stop()
+
+    now = time.perf_counter()
+    print_stats(sis.stats(), previous, now - start, now - last, "final")
+    if settings["instrument"] or settings["instrument_json"]:
+        print(sis.timings_summary(), file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    try:
+        settings = parse_args(argv)
+
+    except RuntimeError as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 2
+
+    logging.basicConfig(level=logging.DEBUG if settings["verbose"] else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    try:
+        return run(settings)
+
+    except RuntimeError as e:
+        logger.error("%s" % e)
+        return 1
@@ -0,0 +1,97 @@
+import array
+import logging
+import time
+from typing import Dict, Union
+
+logger = logging.getLogger(__name__)
+
+DatagramId = Union[int, bytes]
+
+
+class DatagramStats:
+    """Counters of a datagram id, as in a snapshot"""
+
+    __slots__ = ["count", "bytes", "skipped", "oversized", "corrupted", "last_time"]
+
+    def __init__(self, count: int = 0, bytes: int = 0, skipped: int = 0, oversized: int = 0, corrupted: int = 0,
+                 last_time: float = 0.0) -> None:
+        self.count = count  # transmitted datagrams
+        self.bytes = bytes  # transmitted bytes
+        self.skipped = skipped  # datagrams not transmitted (e.g., oversized but not partitionable)
+        self.oversized = oversized  # datagrams larger than the max packet size (partitioned or skipped)
+        self.corrupted = corrupted  # datagrams with invalid framing (transmitted as they are)
+        self.last_time = last_time  # timestamp of the last transmitted datagram, 0.0 if none
+
+    def __repr__(self) -> str:
+        return "DatagramStats(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+class DatagramCounters:
+    """Table of the counters of the replayed datagrams, with a row by datagram id
+
+    The rows are slots of flat arrays, assigned to the ids at first sight. A single thread (the sender) updates them
+    without locking, incrementing a sequence number before and after each update. The snapshots are taken from any
+    thread by copying the arrays, and retried when the sequence number reveals a concurrent update.
+    """
+
+    nr_fields = 5  # count, bytes, skipped, oversized, corrupted
+
+    def __init__(self, capacity: int = 16) -> None:
+        self._slots = dict()  # type: Dict[DatagramId, int]
+        self._ids = list()  # by slot
+        self._values = array.array("Q", bytes(8 * self.nr_fields * capacity))
+        self._times = array.array("d", bytes(8 * capacity))
+        self._sequence = 0  # odd while updating
+
+    def _slot(self, dg_id: DatagramId) -> int:
+        """the slot of the passed id, added if missing (only while updating)"""
+        slot = self._slots.get(dg_id)
+        if slot is None:
+            slot = len(self._ids)
+            if slot == len(self._times):
+                self._values.extend(array.array("Q", bytes(8 * self.nr_fields * slot)))
+                self._times.extend(array.array("d", bytes(8 * slot)))
+            self._ids.append(dg_id)
+            self._slots[dg_id] = slot
+        return slot
+
+    def add(self, dg_id: DatagramId, size: int, dg_time: float, sent: bool = True, oversized: bool = False,
+            corrupted: bool = False) -> None:
+        """account for a replayed datagram (from the sender thread only)"""
+        self._sequence += 1
+        slot = self._slot(dg_id)
+        values = self._values
+        base = slot * self.nr_fields
+        if sent:
+            values[base] += 1
+            values[base + 1] += size
+            self._times[slot] = dg_time
+        else:
+            values[base + 2] += 1
+        if oversized:
+            values[base + 3] += 1
+        if corrupted:
+            values[base + 4] += 1
+        self._sequence += 1
+
+    def snapshot(self) -> Dict[DatagramId, DatagramStats]:
+        """a consistent copy of the counters, by datagram id (in order of first sight)"""
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                ids = list(self._ids)
+                values = self._values[:]
+                times = self._times[:]
+                if sequence == self._sequence:
+                    break
+            time.sleep(0)  # yield to the sender
+
+        stats = dict()
+        for slot, dg_id in enumerate(ids):
+            base = slot * self.nr_fields
+            stats[dg_id] = DatagramStats(*values[base:base + self.nr_fields], last_time=times[slot])
+        return stats
+
+    def get(self, dg_id: DatagramId) -> DatagramStats:
+        """the snapshotted counters of the passed id (all zeros if never seen)"""
+        return self.snapshot().get(dg_id, DatagramStats())
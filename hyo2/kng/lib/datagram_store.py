@@ -0,0 +1,58 @@
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DatagramSlot:
+    """Latest value and bounded history of a kind of datagram
+
+    The history is an immutable tuple that each write replaces at once, so the readers take consistent snapshots
+    without locking. The writers serialize on a lock that is uncontended when there is a single writer.
+    """
+
+    def __init__(self, history: int = 16) -> None:
+        self.history = history
+        self._items = tuple()  # type: Tuple[bytes, ...]
+        self._write_lock = threading.Lock()
+
+        self.count = 0  # stored datagrams, including the ones dropped from the history
+
+    def put(self, data: bytes) -> None:
+        with self._write_lock:
+            if self.history > 1:
+                self._items = self._items[1 - self.history:] + (data, )
+            else:
+                self._items = (data, )
+            self.count += 1
+
+    @property
+    def latest(self) -> Optional[bytes]:
+        items = self._items
+        if len(items) == 0:
+            return None
+        return items[-1]
+
+    def snapshot(self) -> Tuple[bytes, ...]:
+        """the stored datagrams, from the oldest to the latest"""
+        return self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DatagramStore:
+    """Installation, runtime and sound speed profile datagrams shared by the replay and the SVP handling"""
+
+    def __init__(self, history: int = 16) -> None:
+        self.installation = DatagramSlot(history=history)
+        self.runtime = DatagramSlot(history=history)
+        self.ssp = DatagramSlot(history=history)
+
+    def info(self) -> str:
+        msg = "Stored datagrams:\n"
+        for name in ["installation", "runtime", "ssp"]:
+            slot = getattr(self, name)
+            msg += "- %s: %d/%d (total: %d)\n" % (name, len(slot), slot.history, slot.count)
+        return msg
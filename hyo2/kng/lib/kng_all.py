@@ -1,6 +1,8 @@
 import enum
+import functools
 import logging
 import struct
+from datetime import datetime, timezone
 from typing import BinaryIO
 
 logger = logging.getLogger(__name__)
@@ -73,3 +75,17 @@ class KngAll:
             return self.Flags.CORRUPTED_END_DATAGRAM
 
         return self.Flags.VALID
+
+    @classmethod
+    def all_timestamp(cls, dg_date: int, dg_time: int) -> float:
+        """return the POSIX timestamp for the passed date (YYYYMMDD) and time (msec since midnight)"""
+        return cls._all_midnight(dg_date) + dg_time / 1000.0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _all_midnight(dg_date: int) -> float:
+        try:
+            return datetime(year=dg_date // 10000, month=(dg_date // 100) % 100, day=dg_date % 100,
+                            tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            return 0.0
@@ -0,0 +1,180 @@
+import logging
+import os
+import random
+import struct
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DatagramId = Union[int, bytes]
+
+
+class KngGenerator:
+    """Deterministic writer of synthetic .all and .kmall files
+
+    A file starts with the installation, runtime and sound speed profile datagrams, followed by pings: each ping
+    emits the datagrams of the mix (id: datagrams per ping) with the same timestamp, the pings being spaced by the
+    ping rate. The files are valid for the readers (.all: STX/ETX and checksum, .kmall: matching trailing length),
+    with random payloads drawn from a seeded generator, so the same settings always produce the same bytes.
+    """
+
+    all_header_ids = [0x49, 0x52, 0x55]  # installation, runtime, sound speed profile
+    all_mix = {0x50: 1, 0x58: 1, 0x4e: 1}  # position, XYZ88, range/angle
+    kmall_header_ids = [b'#IIP', b'#IOP', b'#SVP']
+    kmall_mix = {b'#SPO': 1, b'#MRZ': 1}
+
+    body_sizes = {
+        0x4e: 2000, 0x50: 100, 0x52: 80, 0x58: 4000, 0x59: 8000, 0x6b: 30000,
+        b'#IOP': 400, b'#MRZ': 30000, b'#MWC': 60000, b'#SKM': 1200, b'#SPO': 40, b'#SSM': 600,
+    }  # payload bytes, by datagram id
+    default_body_size = 64
+
+    def __init__(self, seed: int = 0, start: float = 1708128000.0, ping_rate: float = 1.0, model: int = 2040,
+                 body_sizes: Optional[Dict[DatagramId, int]] = None, ssp_samples: int = 50) -> None:
+        self.seed = seed
+        self.start = start
+        self.ping_rate = ping_rate
+        self.model = model
+        self.ssp_samples = ssp_samples
+        self.body_sizes = dict(self.body_sizes)
+        if body_sizes:
+            self.body_sizes.update(body_sizes)
+
+        self._rng = random.Random(seed)
+        self._pool = bytes()
+
+    def reset(self) -> None:
+        """restart the random sequence from the seed"""
+        self._rng = random.Random(self.seed)
+
+    def _payload(self, size: int) -> bytes:
+        """random bytes, sliced from a pool filled on first use"""
+        if size <= 0:
+            return bytes()
+        if len(self._pool) == 0:
+            pool_size = max(2 * max(self.body_sizes.values()), 2 ** 16)
+            self._pool = random.Random(self.seed).getrandbits(8 * pool_size).to_bytes(pool_size, "little")
+        size = min(size, len(self._pool))
+        offset = self._rng.randrange(len(self._pool) - size + 1)
+        return self._pool[offset:offset + size]
+
+    def _profile(self):
+        """depths and sound speeds of a made-up profile"""
+        depths = [12000.0 * (count / (self.ssp_samples - 1)) ** 2 for count in range(self.ssp_samples)]
+        speeds = [1540.0 - 0.01 * depth if depth < 1000.0 else 1530.0 + 0.017 * (depth - 1000.0) for depth in depths]
+        return depths, speeds
+
+    # .all
+
+    def all_datagram(self, dg_id: int, timestamp: float, body: Optional[bytes] = None, counter: int = 0) -> bytes:
+        """a .all datagram with the passed body (after counter and serial), or a generated one"""
+        dt = datetime.fromtimestamp(timestamp, timezone.utc)
+        date = dt.year * 10000 + dt.month * 100 + dt.day
+        time_ms = int(round((dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6) * 1000.0))
+
+        if body is None:
+            body = self._all_body(dg_id, date, time_ms // 1000)
+        data = struct.pack("<BHIIHH", dg_id, self.model, date, time_ms, counter & 0xFFFF, 100) + body
+        checksum = sum(data) & 0xFFFF  # from the byte after STX to the one before ETX
+        return struct.pack("<IB", 1 + len(data) + 3, 2) + data + struct.pack("<BH", 3, checksum)
+
+    def _all_body(self, dg_id: int, date: int, secs: int) -> bytes:
+        if dg_id == 0x49:
+            return struct.pack("<H", 0) + b"WLZ=0.0,SMH=0,STC=0,OSCV=Emulated,PSV=1.0.0,SN=100,\x00"
+        if dg_id == 0x55:
+            depths, speeds = self._profile()
+            points = [value for depth, speed in zip(depths, speeds) for value in (int(depth / 0.01), int(speed * 10))]
+            return struct.pack("<IIHH", date, secs, len(depths), 1) + \
+                struct.pack("<%dI" % len(points), *points) + b"\x00"
+        return self._payload(self.body_sizes.get(dg_id, self.default_body_size))
+
+    # .kmall
+
+    def kmall_datagram(self, dg_id: bytes, timestamp: float, body: Optional[bytes] = None) -> bytes:
+        """a .kmall datagram with the passed body, or a generated one"""
+        time_sec = int(timestamp)
+        time_nanosec = int((timestamp - time_sec) * 1e9)
+
+        if body is None:
+            body = self._kmall_body(dg_id, time_sec)
+        length = 20 + len(body) + 4
+        return struct.pack("<I4sBBHII", length, dg_id, 1, 0, self.model, time_sec, time_nanosec) + body + \
+            struct.pack("<I", length)
+
+    def _kmall_body(self, dg_id: bytes, time_sec: int) -> bytes:
+        if dg_id == b'#IIP':
+            text = b"OSCV:Emulated,EMXV:EM%d,PU_0,SN=100,\x00" % self.model
+            return struct.pack("<3H", 6 + len(text), 0, 0) + text
+        if dg_id == b'#SVP':
+            depths, speeds = self._profile()
+            points = [value for depth, speed in zip(depths, speeds) for value in (depth, speed, 0, 0.0, 0.0)]
+            return struct.pack("<2H4BIdd", 28, len(depths), ord('S'), ord('0'), ord('0'), ord(' '), time_sec,
+                               43.13555, -70.9395) + struct.pack("<" + "2fI2f" * len(depths), *points)
+
+        size = self.body_sizes.get(dg_id, self.default_body_size)
+        if dg_id[:2] == b'#M':  # single partition
+            return struct.pack("<HH", 1, 1) + self._payload(size - 4)
+        return self._payload(size)
+
+    # files
+
+    def datagrams(self, use_sis5: bool, mix: Optional[Dict[DatagramId, int]] = None) -> Iterator[bytes]:
+        """the endless sequence of datagrams: the header ones, then the pings"""
+        self.reset()
+        if use_sis5:
+            header_ids = self.kmall_header_ids
+            mix = mix or self.kmall_mix
+        else:
+            header_ids = self.all_header_ids
+            mix = mix or self.all_mix
+
+        for dg_id in header_ids:
+            if use_sis5:
+                yield self.kmall_datagram(dg_id, self.start)
+            else:
+                yield self.all_datagram(dg_id, self.start)
+
+        ping = 0
+        while True:
+            timestamp = self.start + ping / self.ping_rate
+            for dg_id, count in mix.items():
+                for _ in range(count):
+                    if use_sis5:
+                        yield self.kmall_datagram(dg_id, timestamp)
+                    else:
+                        yield self.all_datagram(dg_id, timestamp, counter=ping)
+            ping += 1
+
+    def write(self, path: str, count: Optional[int] = None, size: Optional[int] = None,
+              mix: Optional[Dict[DatagramId, int]] = None) -> int:
+        """write a file (format from the extension) of count datagrams or size bytes, and return the datagrams"""
+        ext = os.path.splitext(path)[-1].lower()
+        if ext == ".kmall":
+            use_sis5 = True
+        elif ext in [".all", ".wcd"]:
+            use_sis5 = False
+        else:
+            raise RuntimeError("unsupported file extension: %s" % path)
+
+        with open(path, "wb") as fod:
+            written = self.write_to(fod, use_sis5=use_sis5, count=count, size=size, mix=mix)
+        logger.debug("written %s: %d datagrams" % (path, written))
+        return written
+
+    def write_to(self, fod: BinaryIO, use_sis5: bool, count: Optional[int] = None, size: Optional[int] = None,
+                 mix: Optional[Dict[DatagramId, int]] = None) -> int:
+        if (count is None) and (size is None):
+            raise RuntimeError("either the datagram count or the file size is required")
+
+        written = 0
+        written_size = 0
+        for data in self.datagrams(use_sis5=use_sis5, mix=mix):
+            if (count is not None) and (written >= count):
+                break
+            if (size is not None) and (written_size >= size):
+                break
+            fod.write(data)
+            written += 1
+            written_size += len(data)
+        return written
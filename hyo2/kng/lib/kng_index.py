@@ -0,0 +1,152 @@
+import logging
+import os
+import struct
+from typing import Iterable, Union
+
+import numpy as np
+
+from hyo2.kng.lib.kng_all import KngAll
+from hyo2.kng.lib.kng_scanner import KngScanner
+
+logger = logging.getLogger(__name__)
+
+
+class KngIndex:
+    """Datagram index of a Kongsberg data file
+
+    For each valid datagram, the index stores offset, length, id and timestamp. The offset/length pair
+    points to the bytes sent over the network (for .all/.wcd files, the initial length field is excluded).
+
+    The index is persisted as a sidecar file next to the data file, and it is invalidated when
+    the size or the modification time of the data file change.
+    """
+
+    sidecar_ext = ".kngidx"
+    magic = b"KNGIDX"
+    version = 1
+    hdr_fmt = "<6sHQqQ"  # magic, version, file size, file mtime [ns], nr. of entries
+    dtype = np.dtype([("offset", "<u8"), ("length", "<u4"), ("id", "<u4"), ("timestamp", "<f8")])
+    kmall_exts = [".kmall", ".kmwcd"]
+
+    def __init__(self, path: str, verbose: bool = False) -> None:
+        self.verbose = verbose
+        self.path = path
+        self.is_kmall = os.path.splitext(path)[-1].lower() in self.kmall_exts
+
+        self.file_size = None
+        self.file_mtime = None
+        self.entries = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def sidecar_path(self) -> str:
+        return self.path + self.sidecar_ext
+
+    def is_valid(self) -> bool:
+        """check whether the index still matches the data file"""
+        if self.file_size is None:
+            return False
+        stat = os.stat(self.path)
+        return (stat.st_size == self.file_size) and (stat.st_mtime_ns == self.file_mtime)
+
+    def load_or_build(self) -> None:
+        """make the index available by (in order): keeping the current one, loading the sidecar, building it"""
+        if self.is_valid():
+            return
+        if self.load():
+            return
+        self.build()
+        self.save()
+
+    def load(self) -> bool:
+        """load the index from the sidecar file, if present and still matching the data file"""
+        if not os.path.exists(self.sidecar_path):
+            return False
+
+        stat = os.stat(self.path)
+        hdr_size = struct.calcsize(self.hdr_fmt)
+        try:
+            with open(self.sidecar_path, "rb") as f:
+                magic, version, file_size, file_mtime, count = struct.unpack(self.hdr_fmt, f.read(hdr_size))
+                if (magic != self.magic) or (version != self.version):
+                    logger.info("unsupported index: %s" % self.sidecar_path)
+                    return False
+                if (file_size != stat.st_size) or (file_mtime != stat.st_mtime_ns):
+                    if self.verbose:
+                        logger.debug("outdated index: %s" % self.sidecar_path)
+                    return False
+                entries = np.frombuffer(f.read(count * self.dtype.itemsize), dtype=self.dtype)
+
+        except (OSError, IOError, struct.error) as e:
+            logger.info("unable to load index %s -> %s" % (self.sidecar_path, e))
+            return False
+
+        if len(entries) != count:
+            logger.info("truncated index: %s" % self.sidecar_path)
+            return False
+
+        self.entries = entries
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        if self.verbose:
+            logger.debug("loaded index: %s [datagrams: %d]" % (self.sidecar_path, len(self.entries)))
+        return True
+
+    def save(self) -> bool:
+        """persist the index as sidecar file (a read-only location just keeps the index in memory)"""
+        try:
+            with open(self.sidecar_path, "wb") as f:
+                f.write(struct.pack(self.hdr_fmt, self.magic, self.version, self.file_size, self.file_mtime,
+                                    len(self.entries)))
+                f.write(self.entries.tobytes())
+
+        except (OSError, IOError) as e:
+            logger.info("unable to save index %s -> %s" % (self.sidecar_path, e))
+            return False
+
+        return True
+
+    def build(self) -> None:
+        """scan the data file to collect the valid datagrams"""
+        stat = os.stat(self.path)
+        scanned = KngScanner(path=self.path, verbose=self.verbose).scan()
+        scanned = scanned[scanned["valid"]]
+
+        entries = np.zeros(len(scanned), dtype=self.dtype)
+        entries["length"] = scanned["length"]
+        if self.is_kmall:
+            entries["offset"] = scanned["offset"]
+            entries["id"] = np.ascontiguousarray(scanned["id"]).view("<u4")
+            entries["timestamp"] = scanned["time_sec"] + scanned["time_nanosec"] / 1e9
+        else:
+            # the initial length field is not transmitted
+            entries["offset"] = scanned["offset"] + 4
+            entries["id"] = scanned["id"]
+            dates, inverse = np.unique(scanned["date"], return_inverse=True)
+            midnights = np.array([KngAll.all_timestamp(int(date), 0) for date in dates], dtype=np.float64)
+            entries["timestamp"] = midnights[inverse] + scanned["time"] / 1000.0
+
+        self.entries = entries
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime_ns
+        logger.debug("built index: %s [datagrams: %d]" % (self.path, len(self.entries)))
+
+    def select(self, dg_ids: Iterable[Union[int, bytes]]) -> np.ndarray:
+        """return the entries for the passed datagram ids, in file order"""
+        codes = np.array([self.encode_id(dg_id) for dg_id in dg_ids], dtype="<u4")
+        return self.entries[np.isin(self.entries["id"], codes)]
+
+    @classmethod
+    def encode_id(cls, dg_id: Union[int, bytes]) -> int:
+        """encode a datagram id (an integer for .all, 4 bytes for .kmall) as stored in the index"""
+        if isinstance(dg_id, bytes):
+            return int.from_bytes(dg_id, "little")
+        return int(dg_id)
+
+    def decode_id(self, code: int) -> Union[int, bytes]:
+        """decode a datagram id as stored in the index"""
+        if self.is_kmall:
+            return int(code).to_bytes(4, "little")
+        return int(code)
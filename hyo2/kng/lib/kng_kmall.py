@@ -2,7 +2,7 @@ import enum
 import logging
 import struct
 from datetime import datetime, timedelta
-from typing import BinaryIO
+from typing import BinaryIO, List
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +13,8 @@ class KngKmall:
         UNEXPECTED_EOF = 1
         CORRUPTED_END_DATAGRAM = 2
 
+    max_udp_size = 65507  # max UDP payload over IPv4
+
     def __init__(self, verbose: bool = False) -> None:
         self.verbose = verbose
         self.length = None
@@ -49,8 +51,8 @@ class KngKmall:
 
         # try to read ETX
 
-        # Make sure we don't try to read beyond the EOF (-13 since 16 for header and 3 for ender)
-        if (file_input.tell() + (self.length - 20)) >= file_size:
+        # Make sure we don't try to read beyond the EOF (-20 since the header has been already read)
+        if (file_input.tell() + (self.length - 20)) > file_size:
             if self.verbose:
                 logger.warning("unexpected EOF > current pos: %s, datagram length: %s, file size: %s"
                                % (file_input.tell(), self.length, file_size))
@@ -73,3 +75,37 @@ class KngKmall:
     def kmall_datetime(cls, dgm_time_sec: int, dgm_time_nanosec: int = 0):
         return datetime.utcfromtimestamp(dgm_time_sec) + \
                timedelta(microseconds=(dgm_time_nanosec / 1000.0))
+
+    @classmethod
+    def kmall_timestamp(cls, dgm_time_sec: int, dgm_time_nanosec: int = 0) -> float:
+        return dgm_time_sec + dgm_time_nanosec / 1e9
+
+    @classmethod
+    def is_partitioned(cls, dg_id: bytes) -> bool:
+        """whether the datagram type carries the #MPartition struct (i.e., the multibeam datagrams)"""
+        return dg_id[:2] == b'#M'
+
+    @classmethod
+    def partition(cls, dg_data: bytes, max_size: int = max_udp_size) -> List[bytes]:
+        """split a multibeam datagram in parts of max_size bytes following the #MPartition convention
+
+        Each part has the common header (with updated length), the partition struct (numOfDgms, dgmNum),
+        a chunk of the remaining datagram data, and the trailing length.
+        """
+        hdr_size = 20 + 4  # common header + partition struct
+        chunk_size = max_size - hdr_size - 4
+        if chunk_size <= 0:
+            raise RuntimeError("invalid max partition size: %s" % max_size)
+
+        body = dg_data[hdr_size:-4]
+        nr_parts = max(1, -(-len(body) // chunk_size))
+        if nr_parts > 0xFFFF:
+            raise RuntimeError("too many partitions: %d" % nr_parts)
+
+        parts = list()
+        for dgm_num in range(nr_parts):
+            chunk = body[dgm_num * chunk_size:(dgm_num + 1) * chunk_size]
+            part_length = hdr_size + len(chunk) + 4
+            parts.append(struct.pack("<I", part_length) + dg_data[4:20] + struct.pack("<HH", nr_parts, dgm_num + 1)
+                         + chunk + struct.pack("<I", part_length))
+        return parts
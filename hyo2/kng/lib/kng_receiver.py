@@ -0,0 +1,339 @@
+"""Receiver of the replayed datagrams, to verify what the emulator delivers
+
+Example (soak run, printing a JSON stats line every 10 s):
+    python -m hyo2.kng.lib.kng_receiver --port 26103 --timing 0.01 --stats-interval 10 --expect file.kmall
+"""
+
+import argparse
+import json
+import logging
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+from hyo2.kng.lib.kng_all import KngAll
+from hyo2.kng.lib.kng_kmall import KngKmall
+
+logger = logging.getLogger(__name__)
+
+
+class KngReceiver:
+    """Receive the replayed datagrams, and measure loss, jitter and throughput
+
+    The packets are counted by datagram id. The drops are detected in two ways:
+    - against the datagrams expected from the replayed files (see expect), once the replay has completed;
+    - in the stream, from the missing partitions of the .kmall multibeam datagrams and from the gaps in the ping
+      counters of the .all ping datagrams (a backward jump is taken as a new loop).
+
+    The jitter is the smoothed deviation (as in RFC 3550) of the inter-arrival times from the configured pacing:
+    the fixed timing, or the spacing of the datagram timestamps divided by the replay speed. With the latter, the lag
+    is the delay of each arrival from the schedule given by the first datagram.
+
+    The receiver runs in a background thread (start/stop, or as a context manager in tests), or it can be fed with
+    the handle method.
+    """
+
+    # the .all datagrams with a ping counter in the header (the others have unrelated or per-type counters):
+    # depth (0x44), raw range and beam angle (0x46, 0x66, 0x4e), seabed image (0x53, 0x59), XYZ88 (0x58),
+    # water column (0x6b)
+    ping_ids = frozenset([0x44, 0x46, 0x4e, 0x53, 0x58, 0x59, 0x66, 0x6b])
+
+    def __init__(self, port: int = 26103, ip: str = "0.0.0.0", use_sis5: bool = True, timing: Optional[float] = None,
+                 speed: Optional[float] = None, verbose: bool = False) -> None:
+        self.verbose = verbose
+        self.ip = ip
+        self.port = port
+        self.use_sis5 = use_sis5
+        self.timing = timing  # fixed pacing [s]
+        self.speed = speed  # timestamp pacing
+
+        self.packets = 0
+        self.bytes = 0
+        self.malformed = 0
+        self.ids = dict()  # type: Dict[Union[int, bytes], Dict[str, int]]
+        self.expected = None  # type: Optional[Dict[Union[int, bytes], int]]
+
+        self.jitter = 0.0
+        self.max_lag = 0.0
+        self.first_arrival = None  # type: Optional[float]
+        self.last_arrival = None  # type: Optional[float]
+        self._first_time = None  # type: Optional[float]
+        self._last_time = None  # type: Optional[float]
+        self._min_interval = None  # type: Optional[float]
+        self._max_interval = 0.0
+        self._partitions = dict()  # next part and intact flag, by partitioned datagram id
+        self._ping_counters = dict()  # type: Dict[int, int]
+
+        self.sock = None  # type: Optional[socket.socket]
+        self._thread = None  # type: Optional[threading.Thread]
+        self._stop = threading.Event()
+        self._received = threading.Condition()
+
+    def start(self) -> None:
+        """Bind the port and receive in a background thread"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 22)
+        self.sock.bind((self.ip, self.port))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RX", daemon=True)
+        self._thread.start()
+        logger.debug("listening on %s:%s" % (self.ip, self.port))
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self) -> "KngReceiver":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data = self.sock.recv(2 ** 16)
+
+            except socket.timeout:
+                continue
+
+            except OSError as e:
+                logger.warning("troubles in receiving -> %s" % e)
+                continue
+
+            self.handle(data, time.perf_counter())
+
+    def wait(self, packets: int, timeout: float = 5.0) -> bool:
+        """wait until the passed number of packets have been received"""
+        with self._received:
+            return self._received.wait_for(lambda: self.packets >= packets, timeout=timeout)
+
+    def expect(self, files: Iterable[str], dg_ids: Optional[List[Union[int, bytes]]] = None, loops: int = 1,
+               replay_ssm: bool = True, replay_mrz: bool = True) -> None:
+        """set the datagrams expected from the replay of the passed files
+
+        By default, the expected ids are the ones replayed by the emulator with the passed settings.
+        """
+        from hyo2.kng.lib.kng_index import KngIndex
+
+        if dg_ids is None:
+            from hyo2.kng.lib.replay_handler import ReplayHandler
+
+            dg_ids = ReplayHandler.replayed_ids(use_sis5=self.use_sis5, replay_ssm=replay_ssm, replay_mrz=replay_mrz)
+
+        expected = dict()  # type: Dict[Union[int, bytes], int]
+        for fp in files:
+            index = KngIndex(path=fp, verbose=self.verbose)
+            index.load_or_build()
+            for code in index.select(dg_ids)["id"]:
+                dg_id = index.decode_id(int(code))
+                expected[dg_id] = expected.get(dg_id, 0) + loops
+        self.expected = expected
+
+    def handle(self, data: bytes, arrival: float) -> None:
+        """count a received packet"""
+        with self._received:
+            try:
+                if self.use_sis5:
+                    dg_id, dg_time, complete = self._kmall(data)
+                else:
+                    dg_id, dg_time, complete = self._all(data)
+
+            except struct.error:
+                self.malformed += 1
+                return
+
+            counters = self._id_counters(dg_id)
+            counters["packets"] += 1
+            counters["bytes"] += len(data)
+            if complete:
+                counters["datagrams"] += 1
+            self._timing(dg_time, arrival)
+
+            self.packets += 1
+            self.bytes += len(data)
+            self._received.notify_all()
+
+    def _id_counters(self, dg_id: Union[int, bytes]) -> Dict[str, int]:
+        counters = self.ids.get(dg_id)
+        if counters is None:
+            counters = {"packets": 0, "datagrams": 0, "bytes": 0, "gaps": 0}
+            self.ids[dg_id] = counters
+        return counters
+
+    def _kmall(self, data: bytes):
+        _, dg_id, _, _, _, time_sec, time_nanosec = struct.unpack_from("<I4sBBHII", data)
+        complete = True
+        if KngKmall.is_partitioned(dg_id):
+            nr_parts, part = struct.unpack_from("<HH", data, 20)
+            expected_part, intact = self._partitions.get(dg_id, (1, True))
+            if part == 1:
+                intact = True
+            if part > expected_part:
+                self._id_counters(dg_id)["gaps"] += part - expected_part
+                intact = False
+            elif part < expected_part:  # the last parts of the previous datagram, and the first ones of this
+                self._id_counters(dg_id)["gaps"] += max(nr_parts - expected_part + 1, 0) + part - 1
+                intact = part == 1
+            complete = (part == nr_parts) and intact  # a datagram with lost parts is not received
+            self._partitions[dg_id] = (1, True) if part == nr_parts else (part + 1, intact)
+        return dg_id, KngKmall.kmall_timestamp(time_sec, time_nanosec), complete
+
+    def _all(self, data: bytes):
+        _, dg_id, _, date, time_ms, counter = struct.unpack_from("<BBHIIH", data)
+        if dg_id not in self.ping_ids:
+            return dg_id, KngAll.all_timestamp(date, time_ms), True
+
+        last = self._ping_counters.get(dg_id)
+        if last is not None:
+            step = (counter - last) % 0x10000
+            if 1 < step < 0x8000:
+                self._id_counters(dg_id)["gaps"] += step - 1
+        self._ping_counters[dg_id] = counter
+        return dg_id, KngAll.all_timestamp(date, time_ms), True
+
+    def _timing(self, dg_time: float, arrival: float) -> None:
+        if self.last_arrival is None:
+            self.first_arrival = arrival
+            self._first_time = dg_time
+        else:
+            interval = arrival - self.last_arrival
+            if (self._min_interval is None) or (interval < self._min_interval):
+                self._min_interval = interval
+            self._max_interval = max(self._max_interval, interval)
+
+            expected = None
+            if self.timing is not None:
+                expected = self.timing
+            elif self.speed:
+                expected = (dg_time - self._last_time) / self.speed
+                lag = (arrival - self.first_arrival) - (dg_time - self._first_time) / self.speed
+                self.max_lag = max(self.max_lag, lag)
+            if expected is not None:
+                self.jitter += (abs(interval - expected) - self.jitter) / 16.0
+        self.last_arrival = arrival
+        self._last_time = dg_time
+
+    @staticmethod
+    def _id_name(dg_id: Union[int, bytes]) -> str:
+        if isinstance(dg_id, bytes):
+            return dg_id.decode(errors="replace")
+        return hex(dg_id)
+
+    def missing(self) -> Dict[Union[int, bytes], int]:
+        """the expected datagrams not received, by id"""
+        if self.expected is None:
+            return dict()
+        missing = dict()
+        for dg_id, count in self.expected.items():
+            received = self.ids.get(dg_id, {"datagrams": 0})["datagrams"]
+            if received < count:
+                missing[dg_id] = count - received
+        return missing
+
+    def stats(self) -> dict:
+        """machine-readable counters"""
+        with self._received:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        duration = 0.0
+        if self.first_arrival is not None:
+            duration = self.last_arrival - self.first_arrival
+        stats = {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "malformed": self.malformed,
+            "gaps": sum(counters["gaps"] for counters in self.ids.values()),
+            "duration": round(duration, 6),
+            "throughput": round((self.packets - 1) / duration, 1) if duration > 0.0 else 0.0,
+            "jitter_ms": round(self.jitter * 1000.0, 3),
+            "min_interval_ms": round((self._min_interval or 0.0) * 1000.0, 3),
+            "max_interval_ms": round(self._max_interval * 1000.0, 3),
+            "ids": {self._id_name(dg_id): dict(counters) for dg_id, counters in sorted(self.ids.items())},
+        }
+        if self.timing:
+            stats["requested_rate"] = round(1.0 / self.timing, 1)
+        if self.speed:
+            stats["max_lag_ms"] = round(self.max_lag * 1000.0, 3)
+        if self.expected is not None:
+            stats["expected"] = sum(self.expected.values())
+            stats["missing"] = {self._id_name(dg_id): count for dg_id, count in sorted(self.missing().items())}
+        return stats
+
+    def info(self) -> str:
+        stats = self.stats()
+        msg = "Received datagrams:\n"
+        for name, counters in stats["ids"].items():
+            msg += "- %s: %d (packets: %d, bytes: %d, gaps: %d)\n" \
+                   % (name, counters["datagrams"], counters["packets"], counters["bytes"], counters["gaps"])
+        msg += "Reception:\n"
+        msg += "- packets: %d (malformed: %d)\n" % (stats["packets"], stats["malformed"])
+        msg += "- throughput: %.1f packets/s\n" % stats["throughput"]
+        if "requested_rate" in stats:
+            msg += "- requested rate: %.1f datagrams/s\n" % stats["requested_rate"]
+        msg += "- jitter: %.3f ms\n" % stats["jitter_ms"]
+        if "max_lag_ms" in stats:
+            msg += "- max lag: %.3f ms\n" % stats["max_lag_ms"]
+        if "missing" in stats:
+            msg += "- missing: %d of %d\n" % (sum(stats["missing"].values()), stats["expected"])
+        return msg
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="SISEmuReceiver", description="Receiver of the replayed datagrams")
+    parser.add_argument("--port", type=int, default=26103, help="port to listen on")
+    parser.add_argument("--ip", default="0.0.0.0", help="address to listen on")
+    parser.add_argument("--sis4", action="store_true", help="receive SIS 4 (.all) datagrams")
+    parser.add_argument("--timing", type=float, help="configured fixed timing [s]")
+    parser.add_argument("--speed", type=float, help="configured timestamp speed factor")
+    parser.add_argument("--expect", nargs="+", default=list(), help="the replayed files")
+    parser.add_argument("--loops", type=int, default=1, help="replay loops of the expected files")
+    parser.add_argument("--no-ssm", action="store_true", help="the emulator does not replay #SSM datagrams")
+    parser.add_argument("--no-mrz", action="store_true", help="the emulator does not replay #MRZ/#SPO datagrams")
+    parser.add_argument("--duration", type=float, help="stop after the duration [s]")
+    parser.add_argument("--stats-interval", type=float, default=1.0, help="interval between the stats lines [s]")
+    parser.add_argument("-v", "--verbose", action="store_true", help="debug logging (on stderr)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    receiver = KngReceiver(port=args.port, ip=args.ip, use_sis5=not args.sis4, timing=args.timing,
+                           speed=args.speed, verbose=args.verbose)
+    if args.expect:
+        receiver.expect(args.expect, loops=args.loops, replay_ssm=not args.no_ssm, replay_mrz=not args.no_mrz)
+
+    receiver.start()
+    start = time.perf_counter()
+    try:
+        while (args.duration is None) or (time.perf_counter() - start < args.duration):
+            time.sleep(args.stats_interval if args.duration is None else
+                       max(min(args.stats_interval, args.duration - (time.perf_counter() - start)), 0.0))
+            print(json.dumps(dict(event="stats", time=round(time.time(), 3), **receiver.stats())), flush=True)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        receiver.stop()
+
+    print(json.dumps(dict(event="final", time=round(time.time(), 3), **receiver.stats())), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
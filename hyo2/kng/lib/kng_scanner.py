@@ -0,0 +1,178 @@
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class KngScanner:
+    """Bulk scanner for the datagram discovery of a whole Kongsberg data file
+
+    The file is memory-mapped and the datagram length chain is walked checking only the few bytes required to
+    stay aligned. The headers are then decoded in blocks with NumPy into a structured array, with an entry for
+    each datagram (plus an invalid entry for each position where the chain was broken and then realigned).
+
+    The offset/length fields are the ones in the file: for .all/.wcd files, the offset points to the length field.
+    """
+
+    all_hdr_dtype = np.dtype([("length", "<u4"), ("stx", "u1"), ("id", "u1"), ("model", "<u2"),
+                              ("date", "<u4"), ("time", "<u4")])
+    all_dtype = np.dtype([("offset", "<u8"), ("length", "<u4"), ("id", "u1"), ("model", "<u2"),
+                          ("date", "<u4"), ("time", "<u4"), ("valid", "?")])
+
+    kmall_hdr_dtype = np.dtype([("length", "<u4"), ("id", "S4"), ("version", "u1"), ("system_id", "u1"),
+                                ("sounder_id", "<u2"), ("time_sec", "<u4"), ("time_nanosec", "<u4")])
+    kmall_dtype = np.dtype([("offset", "<u8"), ("length", "<u4"), ("id", "S4"), ("system_id", "u1"),
+                            ("sounder_id", "<u2"), ("time_sec", "<u4"), ("time_nanosec", "<u4"), ("valid", "?")])
+    kmall_exts = [".kmall", ".kmwcd"]
+
+    block_size = 2 ** 18  # datagram headers decoded at once
+
+    def __init__(self, path: str, verbose: bool = False) -> None:
+        self.verbose = verbose
+        self.path = path
+        self.is_kmall = os.path.splitext(path)[-1].lower() in self.kmall_exts
+
+    @property
+    def dtype(self) -> np.dtype:
+        if self.is_kmall:
+            return self.kmall_dtype
+        return self.all_dtype
+
+    def scan(self) -> np.ndarray:
+        """return a structured array describing all the datagrams in the file"""
+        f_sz = os.path.getsize(self.path)
+        if f_sz == 0:
+            return np.zeros(0, dtype=self.dtype)
+
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if self.is_kmall:
+                    offsets, valids = self._walk_kmall(mm, f_sz)
+                    scanned = self._decode(mm, offsets, valids, self.kmall_hdr_dtype)
+                else:
+                    offsets, valids = self._walk_all(mm, f_sz)
+                    scanned = self._decode(mm, offsets, valids, self.all_hdr_dtype)
+            finally:
+                mm.close()
+
+        if self.verbose:
+            logger.debug("scanned %s -> datagrams: %d (invalid: %d)"
+                         % (self.path, len(scanned), np.count_nonzero(~scanned["valid"])))
+        return scanned
+
+    def _walk_all(self, mm: mmap.mmap, f_sz: int) -> tuple:
+        offsets = list()
+        valids = list()
+        unpack_length = struct.Struct("<I").unpack_from
+
+        if f_sz < 16:  # shorter than a datagram header
+            if self.verbose:
+                logger.warning("invalid Kongsberg file > size: %sB" % f_sz)
+            return offsets, valids
+
+        if mm[4] != 2:
+            if self.verbose:
+                logger.warning("invalid Kongsberg file > STX: %s" % mm[4])
+            return offsets, valids
+
+        pos = 0
+        aligned = True
+        while (pos + 16) <= f_sz:
+            length = unpack_length(mm, pos)[0]
+            end = pos + 4 + length
+
+            if (mm[pos + 4] == 2) and (mm[pos + 5] != 0):
+                if (end > f_sz) and aligned:
+                    if self.verbose:
+                        logger.warning("unexpected EOF > current pos: %s, datagram length: %s, file size: %s"
+                                       % (pos, length, f_sz))
+                    break
+
+                if (15 <= length) and (end <= f_sz) and (mm[end - 3] == 3):
+                    offsets.append(pos)
+                    valids.append(True)
+                    aligned = True
+                    pos = end
+                    continue
+
+            if aligned:
+                offsets.append(pos)
+                valids.append(False)
+                aligned = False
+
+            # realign on the next candidate STX (as moving 1 byte at the time)
+            stx = mm.find(b"\x02", pos + 5)
+            if stx < 0:
+                break
+            pos = stx - 4
+
+        return offsets, valids
+
+    def _walk_kmall(self, mm: mmap.mmap, f_sz: int) -> tuple:
+        offsets = list()
+        valids = list()
+        unpack_length = struct.Struct("<I").unpack_from
+
+        if f_sz < 20:  # shorter than a datagram header
+            if self.verbose:
+                logger.warning("invalid Kongsberg file > size: %sB" % f_sz)
+            return offsets, valids
+
+        pos = 0
+        aligned = True
+        while (pos + 20) <= f_sz:
+            length = unpack_length(mm, pos)[0]
+            end = pos + length
+
+            if mm[pos + 4] == 0x23:
+                if (end > f_sz) and aligned:
+                    if self.verbose:
+                        logger.warning("unexpected EOF > current pos: %s, datagram length: %s, file size: %s"
+                                       % (pos, length, f_sz))
+                    break
+
+                if (24 <= length) and (end <= f_sz) and (unpack_length(mm, end - 4)[0] == length):
+                    offsets.append(pos)
+                    valids.append(True)
+                    aligned = True
+                    pos = end
+                    continue
+
+            if aligned:
+                offsets.append(pos)
+                valids.append(False)
+                aligned = False
+
+            # realign on the next candidate '#' (as moving 1 byte at the time)
+            sharp = mm.find(b"#", pos + 5)
+            if sharp < 0:
+                break
+            pos = sharp - 4
+
+        return offsets, valids
+
+    def _decode(self, mm: mmap.mmap, offsets: list, valids: list, hdr_dtype: np.dtype) -> np.ndarray:
+        scanned = np.zeros(len(offsets), dtype=self.dtype)
+        if len(offsets) == 0:
+            return scanned
+
+        scanned["offset"] = offsets
+        scanned["valid"] = valids
+
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        steps = np.arange(hdr_dtype.itemsize, dtype=np.intp)
+        for start in range(0, len(offsets), self.block_size):
+            stop = min(start + self.block_size, len(offsets))
+            idx = scanned["offset"][start:stop].astype(np.intp)[:, np.newaxis] + steps
+            hdrs = buf[idx].view(hdr_dtype).ravel()
+            for name in self.dtype.names:
+                if name in hdr_dtype.names:
+                    scanned[name][start:stop] = hdrs[name]
+        del buf  # release the exported buffer before the mmap is closed
+
+        return scanned
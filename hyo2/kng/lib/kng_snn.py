@@ -0,0 +1,118 @@
+import datetime
+import enum
+import functools
+import logging
+import operator
+
+logger = logging.getLogger(__name__)
+
+
+class KngSnn:
+    """Parser of the Snn ($MVSnn) sound speed profile datagrams
+
+    The datagram is a comma-separated list: the header (id, counter, nr of samples, time, day, month, year), then
+    four fields for each sample (depth, sound speed, temperature, salinity; empty when not available) and a
+    trailer (position, comment), optionally closed by an NMEA-style XOR checksum ("*hh") of the characters
+    between '$' and '*'. The fields are split once and the samples are converted in a single pass, with NumPy
+    imported on the first parsing.
+    """
+
+    class Flags(enum.Enum):
+        VALID = 0
+        UNSUPPORTED = 1
+        BAD_CHECKSUM = 2
+        MALFORMED_HEADER = 3
+        MALFORMED_SAMPLES = 4
+
+    sample_fields = 4
+    max_samples = 100000
+
+    def __init__(self, verbose: bool = False) -> None:
+        self.verbose = verbose
+        self.id = None  # datagram id (e.g., "S12")
+        self.nr_samples = None
+        self.date = None  # YYYYMMDD
+        self.secs = None  # seconds since midnight
+        self.checksum = None  # None if the datagram has none
+
+        # NumPy arrays, by sample
+        self.depths = None
+        self.speeds = None
+        self.temperatures = None
+        self.salinities = None
+
+    @staticmethod
+    def calc_checksum(body: str) -> int:
+        """XOR of all the characters of the passed body"""
+        return functools.reduce(operator.xor, body.encode(), 0)
+
+    def parse(self, data: str) -> Flags:
+        """populate the profile data"""
+        import numpy as np
+
+        if not data.startswith("$MVS"):
+            return self.Flags.MALFORMED_HEADER
+        if "CALC" in data.split("\n", 1)[0]:
+            logger.warning("HYPACK profile")
+            return self.Flags.UNSUPPORTED
+
+        body = data[1:]
+        star = body.rfind("*")
+        if star >= 0:
+            try:
+                self.checksum = int(body[star + 1:star + 3], 16)
+
+            except ValueError:
+                return self.Flags.BAD_CHECKSUM
+
+            body = body[:star]
+            if self.calc_checksum(body) != self.checksum:
+                if self.verbose:
+                    logger.debug("invalid checksum: %02x" % self.checksum)
+                return self.Flags.BAD_CHECKSUM
+
+        fields = body.split(",")
+        if len(fields) < 7:
+            return self.Flags.MALFORMED_HEADER
+
+        try:
+            self.id = fields[0][2:].strip()
+            self.nr_samples = int(fields[2])
+            hhmmss = fields[3].strip()
+            if len(hhmmss) != 6:
+                return self.Flags.MALFORMED_HEADER
+            hours, minutes, seconds = int(hhmmss[0:2]), int(hhmmss[2:4]), int(hhmmss[4:6])
+            if (hours > 23) or (minutes > 59) or (seconds > 60):
+                return self.Flags.MALFORMED_HEADER
+            self.secs = hours * 3600 + minutes * 60 + seconds
+            date = datetime.date(day=int(fields[4]), month=int(fields[5]), year=int(fields[6]))
+            self.date = date.year * 10000 + date.month * 100 + date.day
+
+        except ValueError:
+            return self.Flags.MALFORMED_HEADER
+
+        if (self.nr_samples < 1) or (self.nr_samples > self.max_samples):
+            return self.Flags.MALFORMED_HEADER
+
+        end = 7 + self.nr_samples * self.sample_fields
+        if len(fields) < end:
+            return self.Flags.MALFORMED_SAMPLES
+
+        try:
+            samples = np.array([field.strip() or "nan" for field in fields[7:end]], dtype=np.float64)
+
+        except ValueError:
+            return self.Flags.MALFORMED_SAMPLES
+
+        samples = samples.reshape(self.nr_samples, self.sample_fields)
+        self.depths = samples[:, 0]
+        self.speeds = samples[:, 1]
+        self.temperatures = samples[:, 2]
+        self.salinities = samples[:, 3]
+        if not (np.all(np.isfinite(self.depths)) and np.all(np.isfinite(self.speeds))):
+            return self.Flags.MALFORMED_SAMPLES
+
+        return self.Flags.VALID
+
+    def __repr__(self) -> str:
+        return "<%s:%s:%s:%s:%s>" % (self.__class__.__name__, self.id, self.nr_samples, self.date, self.secs)
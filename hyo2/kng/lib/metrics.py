@@ -0,0 +1,168 @@
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Labels = Dict[str, str]
+
+
+class Histogram:
+    """Distribution of the observed values in cumulative buckets, as in the Prometheus histograms"""
+
+    default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 2.5, 5.0, 10.0)  # [s]
+
+    def __init__(self, buckets: Sequence[float] = default_buckets) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """the (upper bound, count) pairs, the last bound being +Inf"""
+        pairs = list()
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"), ), self._counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsWriter:
+    """Collect the samples of the metrics, and render them in the Prometheus text format"""
+
+    prefix = "kng_"
+
+    def __init__(self, labels: Optional[Labels] = None) -> None:
+        self.labels = labels or dict()  # added to all the samples
+        self._metrics = dict()  # type: Dict[str, Tuple[str, str, List[Tuple[str, Labels, float]]]]
+
+    def _add(self, name: str, kind: str, doc: str, suffix: str, value: float, labels: Optional[Labels]) -> None:
+        name = self.prefix + name
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = (kind, doc, list())
+            self._metrics[name] = metric
+        metric[2].append((suffix, labels or dict(), value))
+
+    def counter(self, name: str, doc: str, value: float, labels: Optional[Labels] = None) -> None:
+        self._add(name + "_total", "counter", doc, "", value, labels)
+
+    def gauge(self, name: str, doc: str, value: float, labels: Optional[Labels] = None) -> None:
+        self._add(name, "gauge", doc, "", value, labels)
+
+    def histogram(self, name: str, doc: str, histogram: Histogram, labels: Optional[Labels] = None) -> None:
+        for bound, count in histogram.cumulative():
+            bucket_labels = dict(labels or dict())
+            bucket_labels["le"] = "+Inf" if bound == float("inf") else repr(bound)
+            self._add(name, "histogram", doc, "_bucket", count, bucket_labels)
+        self._add(name, "histogram", doc, "_sum", histogram.sum, labels)
+        self._add(name, "histogram", doc, "_count", histogram.count, labels)
+
+    @staticmethod
+    def id_label(dg_id: Union[int, bytes]) -> str:
+        if isinstance(dg_id, bytes):
+            return dg_id.decode(errors="replace")
+        return hex(dg_id)
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        if len(labels) == 0:
+            return ""
+        items = ['%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                 for key, value in labels.items()]
+        return "{%s}" % ",".join(items)
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        value = float(value)
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0.0 else "-Inf"
+        return repr(value)
+
+    def render(self) -> str:
+        lines = list()
+        for name, (kind, doc, samples) in self._metrics.items():
+            lines.append("# HELP %s %s" % (name, doc))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for suffix, labels, value in samples:
+                all_labels = dict(self.labels)
+                all_labels.update(labels)
+                lines.append("%s%s%s %s"
+                             % (name, suffix, self._format_labels(all_labels), self._format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve the metrics at /metrics over HTTP, from a background thread
+
+    The collect callable returns the text to serve, and it is called at each request (i.e., at each scrape).
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, collect: Callable[[], str], port: int = 9100, ip: str = "127.0.0.1") -> None:
+        self.collect = collect
+        self.ip = ip
+        self.port = port
+        self.scrapes = 0
+
+        self._server = None  # the HTTP server (http.server is only imported when started)
+        self._thread = None  # type: Optional[threading.Thread]
+        self._lock = threading.Lock()  # stop may be called concurrently
+
+    def start(self) -> None:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                try:
+                    body = server.collect().encode()
+
+                except Exception as e:
+                    logger.warning("troubles in collecting the metrics -> %s" % e)
+                    self.send_error(500)
+                    return
+
+                server.scrapes += 1
+                self.send_response(200)
+                self.send_header("Content-Type", server.content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt: str, *args) -> None:
+                logger.debug("%s - %s" % (self.address_string(), fmt % args))
+
+        self._server = ThreadingHTTPServer((self.ip, self.port), _Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.1},
+                                        name="METRICS", daemon=True)
+        self._thread.start()
+        logger.debug("serving the metrics at http://%s:%s/metrics" % (self.ip, self.port))
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
@@ -0,0 +1,76 @@
+import logging
+import random
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Playlist:
+    """Files to be replayed, with loop count (None to loop forever) and optional shuffle at each loop
+
+    Iterating the playlist yields (loop, file index, file path) for all the loops, using constant memory.
+    In merge mode, the files of a loop are meant to be replayed together, in global timestamp order.
+    The progress cursor (loop, file index, and byte offset of the latest datagram) is moved by the consumer,
+    so that it reflects what has been transmitted rather than what has been read ahead.
+    """
+
+    def __init__(self, files: List[str], loops: Optional[int] = None, shuffle: bool = False,
+                 seed: Optional[int] = None, merge: bool = False) -> None:
+        self.files = list(files)
+        self.loops = loops
+        self.shuffle = shuffle
+        self.merge = merge
+        self._random = random.Random(seed)
+
+        # cursor
+        self.loop = 0
+        self.file_index = 0
+        self.path = None  # type: Optional[str]
+        self.offset = 0
+        self.finished = False
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[Tuple[int, int, str]]:
+        order = list(self.files)
+        loop = 0
+
+        while (len(order) > 0) and ((self.loops is None) or (loop < self.loops)):
+            if self.shuffle:
+                self._random.shuffle(order)
+
+            for file_index, path in enumerate(order):
+                yield loop, file_index, path
+
+            loop += 1
+
+    def move(self, loop: int, file_index: int, path: str) -> None:
+        """move the cursor at the beginning of a file"""
+        self.loop = loop
+        self.file_index = file_index
+        self.path = path
+        self.offset = 0
+
+    def finish(self) -> None:
+        """mark the playlist as completed"""
+        if self.loops is not None:
+            self.loop = self.loops
+        self.finished = True
+
+    def info(self) -> str:
+        if self.loops is None:
+            loops = "inf"
+        else:
+            loops = "%d" % self.loops
+        msg = "Playlist:\n"
+        if self.finished:
+            msg += "- finished: %d loops\n" % self.loop
+            return msg
+        msg += "- loop: %d/%s\n" % (self.loop + 1, loops)
+        if self.merge:
+            msg += "- files: %d merged\n" % len(self.files)
+            return msg
+        msg += "- file: %d/%d\n" % (self.file_index + 1, len(self.files))
+        msg += "- offset: %d\n" % self.offset
+        return msg
@@ -0,0 +1,103 @@
+import logging
+import threading
+from typing import Hashable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CachedDatagram = Tuple[Union[int, bytes], float, bytes, int]  # datagram id, timestamp, data, file offset
+
+
+class ReplayCache:
+    """In-memory cache of the filtered datagrams of the replayed files
+
+    A file is cached only when its filtered datagrams fit the remaining memory budget (a null budget disables
+    the cache). The space is reserved before reading the file and it is released if the read is not completed,
+    so a file that does not fit is transparently streamed from disk at each loop.
+
+    Each entry is stored with the version of its file (e.g., size and modification time): a lookup or a reservation
+    with a different version releases the outdated entry, so that a rewritten file does not hold the budget.
+    """
+
+    item_overhead = 128  # rough per-datagram memory overhead of the cached objects [B]
+
+    def __init__(self, budget: int = 0) -> None:
+        self.budget = budget
+
+        self._items = dict()  # cached datagrams, by key
+        self._sizes = dict()  # reserved memory [B], by key
+        self._versions = dict()  # file version of the reservation, by key
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    @property
+    def size(self) -> int:
+        """the reserved memory [B]"""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def _release_outdated(self, key: Hashable, version: Hashable) -> None:
+        if (key in self._versions) and (self._versions[key] != version):
+            logger.debug("outdated cache entry: %s" % (key, ))
+            self._drop(key)
+
+    def _drop(self, key: Hashable) -> None:
+        self._items.pop(key, None)
+        self._sizes.pop(key, None)
+        self._versions.pop(key, None)
+
+    def get(self, key: Hashable, version: Optional[Hashable] = None) -> Optional[List[CachedDatagram]]:
+        with self._lock:
+            self._release_outdated(key, version)
+            items = self._items.get(key)
+            if items is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return items
+
+    def reserve(self, key: Hashable, data_size: int, nr_items: int, version: Optional[Hashable] = None) -> bool:
+        """reserve space for the passed data, return False if it does not fit the remaining budget"""
+        if not self.enabled:
+            return False
+
+        size = data_size + nr_items * self.item_overhead
+        with self._lock:
+            self._release_outdated(key, version)
+            if key in self._sizes:
+                return False
+            if (sum(self._sizes.values()) + size) > self.budget:
+                logger.debug("not enough cache budget: %sB" % size)
+                return False
+            self._sizes[key] = size
+            self._versions[key] = version
+        return True
+
+    def put(self, key: Hashable, items: List[CachedDatagram]) -> None:
+        """store the datagrams for a reserved key"""
+        with self._lock:
+            if key not in self._sizes:
+                raise RuntimeError("storing without reservation: %s" % (key, ))
+            self._items[key] = items
+
+    def release(self, key: Hashable) -> None:
+        """drop the datagrams and the reservation for the passed key"""
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self._versions.clear()
+
+    def info(self) -> str:
+        msg = "Cache:\n"
+        msg += "- size: %.1f/%.1f MB\n" % (self.size / 1024 ** 2, self.budget / 1024 ** 2)
+        msg += "- hits/misses: %d/%d\n" % (self.hits, self.misses)
+        return msg
@@ -0,0 +1,216 @@
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, List, Union
+
+from hyo2.kng.lib.datagram_counters import DatagramCounters
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.kng_kmall import KngKmall
+
+if TYPE_CHECKING:
+    from hyo2.kng.lib.metrics import MetricsWriter
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayHandler:
+    """Protocol logic of the replay, independent of the transport
+
+    It selects the datagrams to replay, partitions the oversized ones, and stores a few datagrams of interest in the
+    store shared with the SVP handler.
+
+    It also measures the control latency: from a start pinging command to the first transmitted MRZ, and from a stop
+    pinging command to the last MRZ transmitted after it (null when the replay stops at once).
+    """
+
+    sis4_names = {
+        0x49: "Installation", 0x4e: "Raw", 0x50: "Nav", 0x52: "Runtime", 0x55: "Ssp", 0x58: "Xyz", 0x59: "Seabed",
+        0x6b: "Wcd",
+    }  # names of the .all datagrams in the info
+
+    def __init__(self, store: DatagramStore, use_sis5: bool = False, replay_ssm: bool = True, replay_mrz: bool = True,
+                 max_packet_size: int = KngKmall.max_udp_size) -> None:
+        self.store = store
+
+        self.use_sis5 = use_sis5
+        self.replay_ssm = replay_ssm
+        self.replay_mrz = replay_mrz
+        self.max_packet_size = max_packet_size  # larger multibeam datagrams are partitioned
+
+        self.counters = DatagramCounters()  # updated by the sender only, snapshotted by the others
+
+        self.pinging = True
+        self.start_latency = None  # [s], from a start pinging command to the first MRZ
+        self.stop_latency = None  # [s], from a stop pinging command to the last MRZ
+        self._start_command = None  # perf_counter() of the pending start pinging command
+        self._stop_command = None  # perf_counter() of the pending stop pinging command
+
+    def start_pinging(self) -> None:
+        self.pinging = True
+        self._start_command = time.perf_counter()
+        self._stop_command = None
+
+    def stop_pinging(self) -> None:
+        self.pinging = False
+        self._stop_command = time.perf_counter()
+        self._start_command = None
+        self.stop_latency = 0.0
+
+    def supported_files(self, files: List[str]) -> List[str]:
+        supported = list()
+        for fp in files:
+            fp_ext = os.path.splitext(fp)[-1].lower()
+            if self.use_sis5:
+                if fp_ext not in [".kmall"]:
+                    logger.info("SIS 5 mode -> skipping unsupported file extension: %s" % fp)
+                    continue
+            else:
+                if fp_ext not in [".all", ".wcd"]:
+                    logger.info("SIS 4 mode -> skipping unsupported file extension: %s" % fp)
+                    continue
+            supported.append(fp)
+        return supported
+
+    def filtered_ids(self) -> List[Union[int, bytes]]:
+        return self.replayed_ids(use_sis5=self.use_sis5, replay_ssm=self.replay_ssm, replay_mrz=self.replay_mrz)
+
+    @staticmethod
+    def replayed_ids(use_sis5: bool = True, replay_ssm: bool = True,
+                     replay_mrz: bool = True) -> List[Union[int, bytes]]:
+        """the ids of the datagrams replayed with the passed settings"""
+        if use_sis5:
+            # Read and send only the desired datagrams:
+            # - b'#IIP': 'Installation parameters and sensor setup'
+            # - b'#IOP': 'Runtime parameters as chosen by operator'
+            # - b'#SPO': 'Sensor (S) data for position (PO)'
+            # - b'#MRZ': 'Multibeam (M) raw range (R) and depth(Z) datagram'
+            # - b'#SVP': 'Sensor (S) data from sound velocity (V) profile (P) or CTD'
+            # - b'#SSM': 'Sound (S) Speed (S) Manager (M)'
+            filtered_datagrams = [b'#IIP', b'#IOP', b'#SVP']
+            if replay_mrz:
+                filtered_datagrams.append(b'#SPO')
+                filtered_datagrams.append(b'#MRZ')
+            if replay_ssm:
+                filtered_datagrams.append(b'#SSM')
+            return filtered_datagrams
+
+        # Read and send only the desired datagrams:
+        # - position (0x50)
+        # - XYZ88 (0x58)
+        # - sound speed profile (0x55)
+        # - runtime parameters (0x52)
+        # - installation parameters (0x49)
+        # - range/angle (0x4e) for coverage modeling.
+        # - seabed imagery (0x59)
+        # - watercolumn (0x6b)
+        return [0x4e, 0x49, 0x50, 0x52, 0x55, 0x58, 0x59, 0x6b]
+
+    def packets(self, dg_id: Union[int, bytes], dg_data: bytes, dg_time: float) -> List[bytes]:
+        """return the UDP packets to transmit for the passed datagram"""
+        if self.use_sis5:
+            packets = self._sis_5(dg_id, dg_data, dg_time)
+            # the length is both at the beginning and at the end of the datagram
+            corrupted = dg_data[:4] != dg_data[-4:]
+        else:
+            packets = self._sis_4(dg_id, dg_data, dg_time)
+            # STX and ETX (the initial length field is not transmitted)
+            corrupted = (len(dg_data) < 16) or (dg_data[0] != 0x02) or (dg_data[-3] != 0x03)
+
+        self.counters.add(dg_id, len(dg_data), dg_time, sent=len(packets) > 0,
+                          oversized=len(dg_data) > self.max_packet_size, corrupted=corrupted)
+        return packets
+
+    def _sis_5(self, dg_id: bytes, dg_data: bytes, dg_time: float) -> List[bytes]:
+        parts = None
+        if len(dg_data) > self.max_packet_size:
+            if not KngKmall.is_partitioned(dg_id):
+                logger.info("%.3f > skipping dg %s (length: %sB) > datagram cannot be partitioned"
+                            % (dg_time, dg_id, len(dg_data)))
+                return list()
+            parts = KngKmall.partition(dg_data, max_size=self.max_packet_size)
+            logger.debug("%.3f > partitioning dg %s (length: %sB) in %d parts"
+                         % (dg_time, dg_id, len(dg_data), len(parts)))
+
+        logger.debug("%.3f > sending dg %s (length: %sB)" % (dg_time, dg_id, len(dg_data)))
+
+        # Stores a few datagrams of interest in the data store:
+        if dg_id == b'#IIP':
+            self.store.installation.put(dg_data)
+        elif dg_id == b'#IOP':
+            self.store.runtime.put(dg_data)
+        elif dg_id == b'#MRZ':
+            if self._start_command is not None:
+                self.start_latency = time.perf_counter() - self._start_command
+                self._start_command = None
+            elif self._stop_command is not None:
+                self.stop_latency = time.perf_counter() - self._stop_command
+        elif dg_id == b'#SVP':
+            self.store.ssp.put(dg_data)
+
+        if parts is None:
+            return [dg_data]
+        return parts
+
+    def _sis_4(self, dg_id: int, dg_data: bytes, dg_time: float) -> List[bytes]:
+        logger.debug("%.3f > sending dg #%s(%s) (length: %sB)" % (dg_time, hex(dg_id), dg_id, len(dg_data)))
+
+        # Stores a few datagrams of interest in the data store:
+        if dg_id == 0x49:
+            self.store.installation.put(dg_data)
+        elif dg_id == 0x52:
+            self.store.runtime.put(dg_data)
+        elif dg_id == 0x55:
+            self.store.ssp.put(dg_data)
+
+        return [dg_data]
+
+    def id_name(self, dg_id: Union[int, bytes]) -> str:
+        if isinstance(dg_id, bytes):
+            return dg_id.decode(errors="replace").lstrip("#")
+        return self.sis4_names.get(dg_id, hex(dg_id))
+
+    def metrics(self, writer: "MetricsWriter") -> None:
+        for dg_id, stats in self.counters.snapshot().items():
+            labels = {"id": writer.id_label(dg_id)}
+            writer.counter("datagrams_sent", "Datagrams transmitted", stats.count, labels)
+            writer.counter("datagram_bytes_sent", "Bytes of the transmitted datagrams", stats.bytes, labels)
+            writer.counter("datagrams_skipped", "Datagrams not transmitted (e.g., oversized)", stats.skipped, labels)
+            writer.counter("datagrams_oversized", "Datagrams larger than the max packet size", stats.oversized,
+                           labels)
+            writer.counter("datagrams_corrupted", "Datagrams with invalid framing", stats.corrupted, labels)
+            if stats.count > 0:
+                writer.gauge("datagram_last_timestamp_seconds", "Timestamp of the last transmitted datagram",
+                             stats.last_time, labels)
+        writer.gauge("pinging", "Whether the replay is pinging", int(self.pinging))
+        if self.start_latency is not None:
+            writer.gauge("start_latency_seconds", "From the start pinging command to the first MRZ",
+                         self.start_latency)
+        if self.stop_latency is not None:
+            writer.gauge("stop_latency_seconds", "From the stop pinging command to the last MRZ", self.stop_latency)
+
+    def info(self) -> str:
+        snapshot = self.counters.snapshot()
+        dg_ids = sorted(self.filtered_ids(), key=self.id_name)
+        dg_ids += [dg_id for dg_id in snapshot if dg_id not in dg_ids]
+
+        msg = "Transmitted datagrams:\n"
+        for dg_id in dg_ids:
+            stats = snapshot.get(dg_id)
+            if stats is None:
+                msg += "- %s: 0\n" % self.id_name(dg_id)
+                continue
+            msg += "- %s: %d [%.1f KB]" % (self.id_name(dg_id), stats.count, stats.bytes / 1024)
+            for name in ["skipped", "oversized", "corrupted"]:
+                value = getattr(stats, name)
+                if value > 0:
+                    msg += ", %s: %d" % (name, value)
+            msg += "\n"
+
+        if self.use_sis5:
+            msg += "Control:\n"
+            msg += "- pinging: %s\n" % self.pinging
+            if self.start_latency is not None:
+                msg += "- start to first MRZ: %.3f ms\n" % (self.start_latency * 1000.0)
+            if self.stop_latency is not None:
+                msg += "- stop to last MRZ: %.3f ms\n" % (self.stop_latency * 1000.0)
+        return msg
@@ -0,0 +1,155 @@
+import enum
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from hyo2.kng.lib.metrics import MetricsWriter
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayPacer:
+    """Schedule the transmission of the replayed datagrams on absolute deadlines of the monotonic clock
+
+    In FIXED mode, the datagrams are spaced by the replay timing. In TIMESTAMP mode, each datagram is scheduled at its
+    original time offset scaled by the speed factor (a null speed means as fast as possible). The time reference is
+    reset when the datagram timestamps go backward (e.g., a new file or loop) or jump forward by more than max_gap.
+
+    Deadlines are chained (and not measured from the actual transmission), so a late datagram is followed by a burst
+    that catches up with the schedule. When the lag exceeds max_lag, the schedule is instead re-anchored to now.
+
+    The wait sleeps until spin_threshold before the deadline, then it busy-waits for sub-millisecond accuracy.
+    """
+
+    class Modes(enum.Enum):
+        FIXED = 0
+        TIMESTAMP = 1
+
+    def __init__(self, mode: Modes = Modes.FIXED, timing: float = 1.0, speed: float = 1.0,
+                 max_gap: float = 10.0, max_lag: float = 1.0, spin_threshold: float = 0.002) -> None:
+        self.mode = mode
+        self.timing = timing
+        self.speed = speed
+        self.max_gap = max_gap
+        self.max_lag = max_lag
+        self.spin_threshold = spin_threshold
+
+        self._ref_clock = None  # type: Optional[float]
+        self._ref_time = None  # type: Optional[float]
+        self._last_time = None  # type: Optional[float]
+        self._last_deadline = None  # type: Optional[float]
+
+        # statistics
+        self.count = 0
+        self.lag = 0.0
+        self.lag_resets = 0
+        self._start_clock = None  # type: Optional[float]
+        self._source_span = 0.0
+
+    def reset(self) -> None:
+        """drop the time reference"""
+        self._ref_clock = None
+        self._ref_time = None
+        self._last_time = None
+        self._last_deadline = None
+
+    def schedule(self, dg_time: float) -> float:
+        """return the deadline for the transmission of a datagram with the passed timestamp"""
+        now = time.perf_counter()
+        if self._start_clock is None:
+            self._start_clock = now
+
+        if self.mode == self.Modes.TIMESTAMP:
+            if self.speed <= 0.0:
+                deadline = now
+
+            else:
+                if (self._last_time is None) or (dg_time < self._last_time) \
+                        or ((dg_time - self._last_time) > self.max_gap):
+                    self._ref_clock = now
+                    self._ref_time = dg_time
+                else:
+                    self._source_span += dg_time - self._last_time
+                deadline = self._ref_clock + (dg_time - self._ref_time) / self.speed
+
+                if (now - deadline) > self.max_lag:
+                    self._ref_clock = now
+                    self._ref_time = dg_time
+                    self.lag_resets += 1
+                    deadline = now
+
+        else:
+            if self._last_deadline is None:
+                deadline = now
+            else:
+                deadline = self._last_deadline + self.timing
+
+                if (now - deadline) > self.max_lag:
+                    self.lag_resets += 1
+                    deadline = now
+
+        self._last_time = dg_time
+        self._last_deadline = deadline
+        return deadline
+
+    def is_due(self, deadline: float, window: float = 0.0) -> bool:
+        """whether the deadline falls within the passed window from now"""
+        return (deadline - time.perf_counter()) <= window
+
+    def wait_until(self, deadline: float, shutdown: threading.Event, window: float = 0.0) -> bool:
+        """wait until the deadline (at once, if due within the window), return False if interrupted by shutdown"""
+        now = time.perf_counter()
+        delay = deadline - now
+        if delay > window:
+            if delay > self.spin_threshold:
+                if shutdown.wait(delay - self.spin_threshold):
+                    return False
+
+            now = time.perf_counter()
+            while now < deadline:
+                now = time.perf_counter()
+
+        self.record(deadline, now)
+        return not shutdown.is_set()
+
+    def record(self, deadline: float, now: Optional[float] = None) -> None:
+        """account for the transmission of a datagram scheduled at the passed deadline"""
+        if now is None:
+            now = time.perf_counter()
+        self.count += 1
+        self.lag = now - deadline
+
+    def requested_rate(self) -> float:
+        """the datagram rate [1/s] requested by the current settings"""
+        if self.mode == self.Modes.TIMESTAMP:
+            if (self.speed <= 0.0) or (self._source_span <= 0.0):
+                return float("inf")
+            return self.count * self.speed / self._source_span
+
+        if self.timing <= 0.0:
+            return float("inf")
+        return 1.0 / self.timing
+
+    def achieved_rate(self) -> float:
+        """the datagram rate [1/s] achieved since the first scheduled datagram"""
+        if self._start_clock is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._start_clock
+        if elapsed <= 0.0:
+            return 0.0
+        return self.count / elapsed
+
+    def metrics(self, writer: "MetricsWriter") -> None:
+        writer.gauge("pacing_lag_seconds", "Delay of the latest transmission from its deadline", self.lag)
+        writer.counter("pacing_lag_resets", "Schedule re-anchorings after excessive lag", self.lag_resets)
+        writer.gauge("pacing_requested_rate", "Datagram rate requested by the pacing [1/s]", self.requested_rate())
+        writer.gauge("pacing_achieved_rate", "Datagram rate achieved since the start [1/s]", self.achieved_rate())
+
+    def info(self) -> str:
+        msg = "Pacing (%s):\n" % self.mode.name.lower()
+        msg += "- requested: %.1f dg/s\n" % self.requested_rate()
+        msg += "- achieved: %.1f dg/s\n" % self.achieved_rate()
+        msg += "- lag: %.3f ms (resets: %d)\n" % (self.lag * 1000.0, self.lag_resets)
+        return msg
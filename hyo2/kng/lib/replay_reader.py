@@ -0,0 +1,209 @@
+import collections
+import heapq
+import itertools
+import logging
+import operator
+import time
+from typing import TYPE_CHECKING, Generator, Iterator, List, Optional, Union
+
+from hyo2.kng.lib.playlist import Playlist
+from hyo2.kng.lib.replay_cache import CachedDatagram, ReplayCache
+
+if TYPE_CHECKING:
+    from hyo2.kng.lib.kng_index import KngIndex
+    from hyo2.kng.lib.metrics import MetricsWriter
+    from hyo2.kng.lib.stage_timer import StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+class FileMark:
+    """Marker for the beginning of a playlist file in the stream of read datagrams"""
+
+    __slots__ = ["loop", "file_index", "path"]
+
+    def __init__(self, loop: int, file_index: int, path: str) -> None:
+        self.loop = loop
+        self.file_index = file_index
+        self.path = path
+
+
+class ReplayReader:
+    """Read the filtered datagrams of the playlist files, from the in-memory cache (if present) or from disk
+
+    When the playlist is in merge mode, all the files of a loop are opened at once and their datagrams are
+    emitted in global timestamp order by a k-way heap merge (holding a single lookahead datagram per file).
+    """
+
+    def __init__(self, playlist: Playlist, dg_ids: List[Union[int, bytes]], cache_budget: int = 0,
+                 verbose: bool = False, timer: Optional["StageTimer"] = None) -> None:
+        self.verbose = verbose
+        self.timer = timer  # stages: index (load or build), read (seek and read of a datagram)
+        self.playlist = playlist
+        self.dg_ids = dg_ids
+
+        self.cache = ReplayCache(budget=cache_budget)
+        self._indices = dict()  # indices, by file path
+
+        self.dg_counter = 0
+        self.read_counts = collections.Counter()  # read datagrams, by id
+
+    def datagrams(self) -> Iterator[Union[FileMark, CachedDatagram]]:
+        """yield a file mark followed by the filtered datagrams for each file (or loop, if merging) of the playlist"""
+        if self.playlist.merge:
+            items = self._merged()
+        else:
+            items = self._sequential()
+
+        read_counts = self.read_counts
+        try:
+            for item in items:
+                if not isinstance(item, FileMark):
+                    read_counts[item[0]] += 1
+                yield item
+
+        finally:
+            items.close()
+
+    def _sequential(self) -> Iterator[Union[FileMark, CachedDatagram]]:
+        emitted = 0
+        for loop, file_index, fp in self.playlist:
+
+            if file_index == 0:
+                if (loop > 0) and self._is_empty_loop(emitted):
+                    return
+                emitted = 0
+                self.dg_counter = 0
+
+            index = self._index(fp)
+            if index is None:
+                continue
+
+            self.dg_counter += len(index)
+            logger.debug("open file: %s [%iKB, datagrams: %d]" % (fp, (index.file_size / 1024), len(index)))
+
+            yield FileMark(loop=loop, file_index=file_index, path=fp)
+            emitted += yield from self._datagrams(fp, index)
+
+            if self.verbose:
+                logger.debug("data loaded > datagrams: %s" % self.dg_counter)
+
+    def _merged(self) -> Iterator[Union[FileMark, CachedDatagram]]:
+        """yield a mark followed by the filtered datagrams of all the files in timestamp order, for each loop"""
+        emitted = 0
+        for loop, entries in itertools.groupby(self.playlist, key=operator.itemgetter(0)):
+            if (loop > 0) and self._is_empty_loop(emitted):
+                return
+            fps = [fp for _, _, fp in entries]
+
+            cursors = list()
+            paths = list()
+            emitted = 0
+            self.dg_counter = 0
+            for fp in fps:
+                index = self._index(fp)
+                if index is None:
+                    continue
+
+                self.dg_counter += len(index)
+                logger.debug("open file: %s [%iKB, datagrams: %d]" % (fp, (index.file_size / 1024), len(index)))
+                cursors.append(self._datagrams(fp, index))
+                paths.append(fp)
+            if len(cursors) == 0:
+                continue
+
+            yield FileMark(loop=loop, file_index=0, path=paths[0])
+            try:
+                for datagram in heapq.merge(*cursors, key=operator.itemgetter(1)):
+                    emitted += 1
+                    yield datagram
+
+            finally:
+                for cursor in cursors:
+                    cursor.close()
+
+            if self.verbose:
+                logger.debug("data loaded > datagrams: %s" % self.dg_counter)
+
+    def _is_empty_loop(self, emitted: int) -> bool:
+        """whether a whole loop emitted no datagrams, so that the next ones would spin without transmitting"""
+        if emitted > 0:
+            return False
+        logger.warning("no datagrams to replay in a whole loop -> ending the playlist")
+        return True
+
+    def _datagrams(self, fp: str, index: "KngIndex") -> Generator[CachedDatagram, None, int]:
+        """yield the filtered datagrams of a file, from the cache (if present) or from disk, and return their count"""
+        key = (fp, tuple(self.dg_ids))
+        version = (index.file_size, index.file_mtime)
+        if self.cache.enabled:
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                yield from cached
+                return len(cached)
+
+        entries = index.select(self.dg_ids)
+        caching = self.cache.reserve(key, data_size=int(entries['length'].sum()), nr_items=len(entries),
+                                     version=version)
+        collected = list()  # type: List[CachedDatagram]
+        completed = False
+
+        try:
+            f = open(fp, 'rb')
+
+        except (OSError, IOError):
+            raise RuntimeError("unable to open %s" % fp)
+
+        timer = self.timer
+        try:
+            for entry in entries:
+                if timer:
+                    start = time.perf_counter_ns()
+                offset = int(entry['offset'])
+                f.seek(offset)
+                datagram = (index.decode_id(entry['id']), float(entry['timestamp']), f.read(int(entry['length'])),
+                            offset)
+                if timer:
+                    timer.record("read", start)
+                if caching:
+                    collected.append(datagram)
+                yield datagram
+            completed = True
+            return len(entries)
+
+        finally:
+            f.close()
+            if caching:
+                if completed:
+                    self.cache.put(key, collected)
+                else:
+                    self.cache.release(key)
+
+    def _index(self, fp: str) -> Optional["KngIndex"]:
+        """return the datagram index for the passed file, loading or building it only when needed
+
+        None is returned when the file cannot be indexed, so that it is skipped without ending the replay.
+        """
+        index = self._indices.get(fp)
+        if index is None:
+            from hyo2.kng.lib.kng_index import KngIndex  # NumPy is only needed once the replay starts
+
+            index = KngIndex(path=fp, verbose=self.verbose)
+            self._indices[fp] = index
+        timer = self.timer
+        if timer:
+            start = time.perf_counter_ns()
+        try:
+            index.load_or_build()
+
+        except Exception as e:
+            logger.warning("skipping %s -> unable to index it: %s" % (fp, e))
+            return None
+
+        if timer:
+            timer.record("index", start)
+        return index
+
+    def metrics(self, writer: "MetricsWriter") -> None:
+        for dg_id, count in sorted(self.read_counts.items()):
+            writer.counter("datagrams_read", "Datagrams read from the files", count, {"id": writer.id_label(dg_id)})
@@ -0,0 +1,63 @@
+import enum
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+
+class ReplyRouter:
+    """Select the destination of the replies to an SVP request
+
+    In FIXED mode, all the replies go to the output address. In SENDER mode, each request is answered to its
+    originating address. In TABLE mode, the destination is looked up in the route table by the sender "ip:port"
+    (or just "ip"), falling back to the output address.
+
+    The requests are counted by client, keeping only the most recent clients (up to max_clients).
+    """
+
+    class Modes(enum.Enum):
+        FIXED = 0
+        SENDER = 1
+        TABLE = 2
+
+    def __init__(self, ip_out: str, port_out: int, mode: Modes = Modes.FIXED,
+                 routes: Optional[Dict[str, Address]] = None, max_clients: int = 256) -> None:
+        self.mode = mode
+        self.ip_out = ip_out
+        self.port_out = port_out
+        self.routes = dict() if routes is None else dict(routes)  # type: Dict[str, Address]
+
+        self.max_clients = max_clients
+        self.clients = OrderedDict()  # type: OrderedDict[Address, int]
+
+    def route(self, sender: Optional[Address] = None) -> Address:
+        """return the reply address for a request from the passed sender (None for local requests)"""
+        if sender is None:
+            return self.ip_out, self.port_out
+
+        sender = (sender[0], sender[1])
+        self.clients[sender] = self.clients.get(sender, 0) + 1
+        self.clients.move_to_end(sender)
+        if len(self.clients) > self.max_clients:
+            self.clients.popitem(last=False)  # the least recent client
+
+        if self.mode == self.Modes.SENDER:
+            return sender
+
+        if self.mode == self.Modes.TABLE:
+            address = self.routes.get("%s:%d" % sender)
+            if address is None:
+                address = self.routes.get(sender[0])
+            if address is not None:
+                return address[0], int(address[1])
+
+        return self.ip_out, self.port_out
+
+    def info(self) -> str:
+        msg = "Reply routing (%s):\n" % self.mode.name.lower()
+        for client, count in self.clients.items():
+            msg += "- %s:%d -> %d requests\n" % (client[0], client[1], count)
+        return msg
@@ -1,8 +1,14 @@
 import logging
 import os
 import threading
-from typing import List, Optional
-
+from typing import Dict, List, Optional
+
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.metrics import MetricsServer, MetricsWriter
+from hyo2.kng.lib.reply_router import Address, ReplyRouter
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+from hyo2.kng.lib.stage_timer import StageTimer, dump_timings, timings, timings_summary
 from hyo2.kng.lib.threads.replay_thread import ReplayThread
 from hyo2.kng.lib.threads.svp_thread import SvpThread
 
@@ -14,7 +20,13 @@ class Sis:
 
     def __init__(self, port_in: int = 4001, port_out: int = 26103, ip_out: str = "localhost",
                  replay_timing: float = 1.0, use_sis5: bool = True, replay_ssm: bool = True, replay_mrz: bool = True,
-                 verbose: bool = False):
+                 verbose: bool = False, pacing: ReplayPacer.Modes = ReplayPacer.Modes.FIXED,
+                 replay_speed: float = 1.0, batch_size: int = 1, max_packet_size: int = KngKmall.max_udp_size,
+                 cache_budget: int = 0, loops: Optional[int] = None, shuffle: bool = False, queue_size: int = 1024,
+                 merge: bool = False, reply_mode: ReplyRouter.Modes = ReplyRouter.Modes.FIXED,
+                 routes: Optional[Dict[str, Address]] = None, sounder_name: Optional[str] = None,
+                 metrics_port: Optional[int] = None, metrics_ip: str = "127.0.0.1", instrument: bool = False,
+                 instrument_path: Optional[str] = None):
 
         # user settings
         self.port_in = port_in
@@ -24,15 +36,33 @@ class Sis:
         self._replay_ssm = replay_ssm
         self._replay_mrz = replay_mrz
         self._replay_timing = replay_timing
+        self._pacing = pacing
+        self._replay_speed = replay_speed
+        self._batch_size = batch_size
+        self._max_packet_size = max_packet_size
+        self._cache_budget = cache_budget  # memory for the in-memory replay cache [B], 0 to disable it
+        self._loops = loops  # None to loop forever
+        self._shuffle = shuffle
+        self._queue_size = queue_size  # datagrams read ahead of the transmission
+        self._merge = merge  # replay all the files together, in timestamp order
+        self._reply_mode = reply_mode  # destination of the replies to the SVP requests
+        self._routes = routes  # reply addresses by sender "ip:port" or "ip", for the TABLE reply mode
+        self._sounder_name = sounder_name  # None to derive it from the replayed installation datagrams
+        self._metrics_port = metrics_port  # None to not serve the metrics over HTTP
+        self._metrics_ip = metrics_ip
+        self._instrument = instrument or (instrument_path is not None)  # per-stage timings of the hot paths
+        self._instrument_path = instrument_path  # JSON file for the stage timings, written on stop
         self.verbose = verbose
 
         # threads
         self.t_svp: Optional[SvpThread] = None
         self.t_replay: Optional[ReplayThread] = None
 
-        self.ssp = list()  # type: List[bytes]
-        self.installation = list()  # type: List[bytes]
-        self.runtime = list()  # type: List[bytes]
+        self.store = DatagramStore()
+        self.terminated = threading.Event()  # set when terminated by a $KSSIS,24 command
+        self.metrics_server = None  # type: Optional[MetricsServer]
+        self._stop_lock = threading.Lock()
+        self._stopped = False
 
         self.files = list()  # type: List[str]
 
@@ -56,34 +86,47 @@ class Sis:
             raise RuntimeError("Not valid file paths passed")
 
     def stop(self) -> None:
-        """Stop the process"""
-        self.t_svp.stop()
-        self.t_svp.join()
+        """Stop the process
 
-        self.t_replay.stop()
-        self.t_replay.join()
+        It may be called more than once and from several threads (e.g., on a $KSSIS,24 command and by the
+        application): the first call stops the threads, the others wait for it and return.
+        """
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
 
-    def start(self) -> None:
+            if self.t_svp:
+                self.t_svp.stop()
+                self.t_svp.join()
 
-        lists_lock = threading.Lock()
+            if self.t_replay:
+                self.t_replay.stop()
+                self.t_replay.join()
+
+            self._stop_metrics()
+            self._report_timings()
+
+    def start(self) -> None:
+        self._stopped = False
+        # first, so that a failure to serve the metrics does not leave the threads running
+        self._start_metrics()
 
         self.t_svp = SvpThread(
-            runtime=self.runtime,
-            installation=self.installation,
-            ssp=self.ssp,
-            lists_lock=lists_lock,
+            store=self.store,
             port_in=self.port_in,
             port_out=self.port_out,
             ip_out=self.ip_out,
             debug=self.verbose,
-            use_sis5=self.use_sis5)
+            use_sis5=self.use_sis5,
+            reply_mode=self._reply_mode,
+            routes=self._routes,
+            sounder_name=self._sounder_name,
+            instrument=self._instrument)
         self.t_svp.start()
 
         self.t_replay = ReplayThread(
-            runtime=self.runtime,
-            installation=self.installation,
-            ssp=self.ssp,
-            lists_lock=lists_lock,
+            store=self.store,
             files=self.files,
             replay_timing=self._replay_timing,
             port_out=self.port_out,
@@ -91,16 +134,78 @@ class Sis:
             use_sis5=self.use_sis5,
             debug=self.verbose,
             replay_ssm=self._replay_ssm,
-            replay_mrz=self._replay_mrz
+            replay_mrz=self._replay_mrz,
+            pacing=self._pacing,
+            replay_speed=self._replay_speed,
+            batch_size=self._batch_size,
+            max_packet_size=self._max_packet_size,
+            cache_budget=self._cache_budget,
+            loops=self._loops,
+            shuffle=self._shuffle,
+            queue_size=self._queue_size,
+            merge=self._merge,
+            instrument=self._instrument
         )
         self.t_replay.start()
 
+        self.t_svp.handler.on_start_pinging = self.t_replay.resume
+        self.t_svp.handler.on_stop_pinging = self.t_replay.pause
+        self.t_svp.handler.on_terminate = self._terminate
+
+    def _start_metrics(self) -> None:
+        if self._metrics_port is None:
+            return
+
+        server = MetricsServer(collect=self.metrics, port=self._metrics_port, ip=self._metrics_ip)
+        server.start()
+        self.metrics_server = server
+
+    def _stop_metrics(self) -> None:
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def _timers(self) -> List[StageTimer]:
+        timers = list()
+        if self.t_replay:
+            timers.extend(self.t_replay.timers())
+        if self.t_svp:
+            timers.extend(self.t_svp.timers())
+        return timers
+
+    def timings(self) -> dict:
+        """the per-stage timings, by thread (empty when not instrumented)"""
+        return timings(self._timers())
+
+    def timings_summary(self) -> str:
+        return timings_summary(self._timers())
+
+    def _report_timings(self) -> None:
+        if not self._instrument:
+            return
+        logger.info("stage timings:\n%s" % self.timings_summary())
+        if self._instrument_path:
+            dump_timings(self._timers(), self._instrument_path)
+
+    def _terminate(self) -> None:
+        logger.info("terminating on request")
+        self.terminated.set()
+        # the threads cannot be joined by the SVP thread itself
+        threading.Thread(target=self.stop, name="TERMINATE").start()
+
     def set_timing(self, timing: float) -> None:
         logger.debug('new timing: %s' % timing)
         self.t_replay.lock_data()
         self.t_replay.replay_timing = timing
         self.t_replay.unlock_data()
 
+    def set_speed(self, speed: float) -> None:
+        """set the speed factor used when pacing by timestamps (0.0 is as fast as possible)"""
+        logger.debug('new speed: %s' % speed)
+        self.t_replay.lock_data()
+        self.t_replay.replay_speed = speed
+        self.t_replay.unlock_data()
+
     def send_fake_profile(self) -> None:
         if self.t_svp:
             self.t_svp.send_fake_profile()
@@ -109,11 +214,30 @@ class Sis:
         if self.t_svp:
             self.t_svp.send_latest_received_profile()
 
+    def stats(self) -> dict:
+        """machine-readable counters"""
+        stats = dict()
+        if self.t_replay:
+            stats.update(self.t_replay.stats())
+        if self.t_svp:
+            stats["ssp_replies"] = self.t_svp.handler.ssp_count
+        return stats
+
+    def metrics(self) -> str:
+        """the counters in the Prometheus text format"""
+        writer = MetricsWriter()
+        if self.t_replay:
+            self.t_replay.metrics(writer)
+        if self.t_svp:
+            self.t_svp.handler.metrics(writer)
+        return writer.render()
+
     def info(self) -> str:
         msg = str()
         if self.t_replay:
             msg += self.t_replay.info()
         msg += "\n"
+        msg += self.store.info()
         if self.t_svp:
             msg += self.t_svp.info()
         return msg
@@ -0,0 +1,408 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from typing import Iterator, List, Optional, Union
+
+from hyo2.kng.lib.playlist import Playlist
+from hyo2.kng.lib.replay_cache import CachedDatagram
+from hyo2.kng.lib.replay_handler import ReplayHandler
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+from hyo2.kng.lib.replay_reader import FileMark, ReplayReader
+from hyo2.kng.lib.reply_router import Address, ReplyRouter
+from hyo2.kng.lib.sis import Sis
+from hyo2.kng.lib.stage_timer import StageTimer
+from hyo2.kng.lib.svp_handler import ReplyPlan, SvpHandler
+
+logger = logging.getLogger(__name__)
+
+
+class _SvpProtocol(asyncio.DatagramProtocol):
+    """Receive the SVP requests"""
+
+    def __init__(self, sis: "SisAsync") -> None:
+        self._sis = sis
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            data = data.decode('utf-8')
+
+        except UnicodeDecodeError:
+            logger.warning("unable to decode msg from %s" % (addr, ))
+            return
+
+        logger.debug("msg from %s [sz: %sB]" % (addr, len(data)))
+        timer = self._sis.timer
+        if timer:
+            start = time.perf_counter_ns()
+        plan = self._sis.svp.handle(data)
+        if timer:
+            timer.record("svp_handle", start)
+        self._sis.reply(plan, self._sis.router.route(addr))
+
+
+class _OutputProtocol(asyncio.DatagramProtocol):
+    """Track the flow control of the output transport"""
+
+    def __init__(self) -> None:
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.errors = 0
+
+    def error_received(self, exc: Exception) -> None:
+        self.errors += 1
+        logger.debug("troubles in sending -> %s" % exc)
+
+    def pause_writing(self) -> None:
+        self._writable.clear()
+
+    def resume_writing(self) -> None:
+        self._writable.set()
+
+    @property
+    def writable(self) -> bool:
+        return self._writable.is_set()
+
+    async def drain(self) -> None:
+        await self._writable.wait()
+
+
+class SisAsync(Sis):
+    """SIS simulator running on a single asyncio event loop
+
+    The SVP input and the replay output are datagram endpoints of the same loop: the replay is paced by timers and the
+    SVP replies are scheduled after their delays, so a stop cancels everything at once. The files are read in batches
+    in the default executor, one batch ahead of the transmission.
+
+    The simulator can run in a background thread (start/stop), or be awaited (run) on an existing loop that hosts
+    many emulated sounders. The batch_size and queue_size settings only apply to the threaded simulator.
+    """
+
+    read_batch = 256  # datagrams read ahead by each executor call
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.svp = None  # type: Optional[SvpHandler]
+        self.router = None  # type: Optional[ReplyRouter]
+        self.replay = None  # type: Optional[ReplayHandler]
+        self.playlist = None  # type: Optional[Playlist]
+        self._pacer = None  # type: Optional[ReplayPacer]
+        self._reader = None  # type: Optional[ReplayReader]
+        # optional per-stage timings of the loop: pace, handle (packets), send, svp_handle (reply plan)
+        self.timer = None  # type: Optional[StageTimer]
+
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._task = None  # type: Optional[asyncio.Task]
+        self._transport_in = None  # type: Optional[asyncio.DatagramTransport]
+        self._transport_out = None  # type: Optional[asyncio.DatagramTransport]
+        self._output = None  # type: Optional[_OutputProtocol]
+        self._replies = set()  # the pending reply tasks
+
+        self._thread = None  # type: Optional[threading.Thread]
+        self._ready = threading.Event()
+        # the failure to start of the background simulator, raised by start
+        self._error = None  # type: Optional[Exception]
+        self._pinging = None  # type: Optional[asyncio.Event]
+
+        self.packets = 0
+        self.bytes = 0
+
+    def start(self) -> None:
+        """Run the simulator in a background thread"""
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run_loop, name="SIS")
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._thread = None
+            raise self._error
+
+    def stop(self) -> None:
+        """Stop the simulator (the concurrent calls wait for the first one)"""
+        with self._stop_lock:
+            if self._task is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._task.cancel)
+
+                except RuntimeError:  # the loop is already closed
+                    pass
+
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+                self._report_timings()
+
+    def _run_loop(self) -> None:
+        try:
+            asyncio.run(self.run())
+
+        except asyncio.CancelledError:
+            pass
+
+        except Exception as e:
+            if not self._ready.is_set():
+                self._error = e
+            logger.error("troubles in running the simulator -> %s" % e)
+
+        finally:
+            self._ready.set()
+
+    async def run(self) -> None:
+        """Serve the SVP requests and replay the files, until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+
+        self.svp = SvpHandler(store=self.store, use_sis5=self.use_sis5, debug=self.verbose,
+                              sounder_name=self._sounder_name)
+        self.router = ReplyRouter(ip_out=self.ip_out, port_out=self.port_out, mode=self._reply_mode,
+                                  routes=self._routes)
+        self.replay = ReplayHandler(store=self.store, use_sis5=self.use_sis5, replay_ssm=self._replay_ssm,
+                                    replay_mrz=self._replay_mrz, max_packet_size=self._max_packet_size)
+        self.playlist = Playlist(files=self.replay.supported_files(self.files), loops=self._loops,
+                                 shuffle=self._shuffle, merge=self._merge)
+        self._pacer = ReplayPacer(mode=self._pacing, timing=self._replay_timing, speed=self._replay_speed)
+        self.timer = StageTimer("LOOP") if self._instrument else None
+        self._reader = ReplayReader(playlist=self.playlist, dg_ids=self.replay.filtered_ids(),
+                                    cache_budget=self._cache_budget, verbose=self.verbose,
+                                    timer=StageTimer("READ") if self._instrument else None)
+
+        self._pinging = asyncio.Event()
+        self._pinging.set()
+        self.svp.on_start_pinging = self.resume
+        self.svp.on_stop_pinging = self.pause
+        self.svp.on_terminate = self._terminate
+
+        self._start_metrics()
+        try:
+            self._transport_in, _ = await self._loop.create_datagram_endpoint(
+                lambda: _SvpProtocol(self), sock=self._init_sock_in())
+            self._transport_out, self._output = await self._loop.create_datagram_endpoint(
+                _OutputProtocol, sock=self._init_sock_out())
+            logger.debug("started -> in %s, out %s:%s, pacing: %s"
+                         % (self.port_in, self.ip_out, self.port_out, self._pacing.name))
+            self._ready.set()
+
+            await self._replay()
+            logger.debug("playlist completed")
+            await self._loop.create_future()  # keep serving the SVP requests
+
+        finally:
+            self._stop_metrics()
+            for reply in list(self._replies):
+                reply.cancel()
+            if self._transport_in is not None:
+                self._transport_in.close()
+                self._transport_in = None
+            if self._transport_out is not None:
+                self._transport_out.close()
+                self._transport_out = None
+            logger.debug("ends")
+
+    def _init_sock_in(self) -> socket.socket:
+        sock_in = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock_in.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock_in.bind(("0.0.0.0", self.port_in))
+        return sock_in
+
+    def _init_sock_out(self) -> socket.socket:
+        sock_out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock_out.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 ** 16)
+        return sock_out
+
+    async def _replay(self) -> None:
+        timer = self.timer
+        datagrams = self._reader.datagrams()
+        pending = self._loop.run_in_executor(None, self._read, datagrams)
+        try:
+            while True:
+                try:
+                    batch = await pending
+
+                except Exception as e:
+                    logger.error("troubles in reading datagrams -> %s" % e)
+                    return
+
+                if len(batch) == 0:
+                    self.playlist.finish()
+                    return
+                pending = self._loop.run_in_executor(None, self._read, datagrams)
+
+                for item in batch:
+                    if isinstance(item, FileMark):
+                        self.playlist.move(loop=item.loop, file_index=item.file_index, path=item.path)
+                        continue
+
+                    dg_id, dg_time, dg_data, dg_offset = item
+                    if not self._pinging.is_set():
+                        await self._pinging.wait()
+                        self._pacer.reset()
+                    if timer:
+                        start = time.perf_counter_ns()
+                    deadline = self._pacer.schedule(dg_time)
+                    delay = deadline - time.perf_counter()
+                    if delay > 0.0:
+                        await asyncio.sleep(delay)
+                    elif not self._output.writable:
+                        await self._output.drain()
+                    self._pacer.record(deadline)
+                    if timer:
+                        start = timer.record("pace", start)
+
+                    packets = self.replay.packets(dg_id, dg_data, dg_time)
+                    if timer:
+                        start = timer.record("handle", start)
+                    for packet in packets:
+                        self._send(packet)
+                    if timer:
+                        timer.record("send", start)
+                    self.playlist.offset = dg_offset
+
+                # let the loop serve the other events, even when replaying as fast as possible
+                await asyncio.sleep(0)
+
+        finally:
+            if not pending.done():
+                await asyncio.wait([pending])
+            datagrams.close()
+
+    def pause(self) -> None:
+        """Pause the replay (stop pinging), from the loop"""
+        self.replay.stop_pinging()
+        self._pinging.clear()
+
+    def resume(self) -> None:
+        """Resume the replay (start pinging), from the loop"""
+        self.replay.start_pinging()
+        self._pinging.set()
+
+    def _terminate(self) -> None:
+        logger.info("terminating on request")
+        self.terminated.set()
+        self._task.cancel()
+
+    def _read(self, datagrams: Iterator[Union[FileMark, CachedDatagram]]) -> List[Union[FileMark, CachedDatagram]]:
+        """read the next batch of datagrams (in the executor)"""
+        batch = list()
+        for item in datagrams:
+            batch.append(item)
+            if len(batch) == self.read_batch:
+                break
+        return batch
+
+    def _send(self, data: bytes, address: Optional[Address] = None) -> None:
+        if address is None:
+            address = (self.ip_out, self.port_out)
+        self._transport_out.sendto(data, address)
+        self.packets += 1
+        self.bytes += len(data)
+
+    def reply(self, plan: ReplyPlan, address: Optional[Address] = None) -> None:
+        """schedule the datagrams of a reply plan"""
+        if len(plan) == 0:
+            return
+        reply = self._loop.create_task(self._reply(plan, address, time.perf_counter()))
+        self._replies.add(reply)
+        reply.add_done_callback(self._replies.discard)
+
+    async def _reply(self, plan: ReplyPlan, address: Optional[Address], requested: float) -> None:
+        for delay, data in plan:
+            if delay > 0.0:
+                await asyncio.sleep(delay)
+            if self._transport_out is None:
+                return
+            self._send(data, address)
+            self.svp.reply_latency.observe(time.perf_counter() - requested)
+        if self.verbose:
+            logger.debug("data sent")
+
+    def _call_soon(self, callback, *args) -> None:
+        if self._loop is None:
+            raise RuntimeError("the simulator is not running")
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def set_timing(self, timing: float) -> None:
+        logger.debug('new timing: %s' % timing)
+        self._call_soon(setattr, self._pacer, "timing", timing)
+
+    def set_speed(self, speed: float) -> None:
+        """set the speed factor used when pacing by timestamps (0.0 is as fast as possible)"""
+        logger.debug('new speed: %s' % speed)
+        self._call_soon(self._set_speed, speed)
+
+    def _set_speed(self, speed: float) -> None:
+        self._pacer.speed = speed
+        self._pacer.reset()
+
+    def send_fake_profile(self) -> None:
+        if self.svp:
+            self._call_soon(lambda: self.reply(self.svp.fake_profile_plan()))
+
+    def send_latest_profile(self) -> None:
+        if self.svp:
+            self._call_soon(lambda: self.reply(self.svp.latest_profile_plan()))
+
+    def _timers(self) -> List[StageTimer]:
+        timers = list()
+        if self._reader and self._reader.timer:
+            timers.append(self._reader.timer)
+        if self.timer:
+            timers.append(self.timer)
+        return timers
+
+    def stats(self) -> dict:
+        """machine-readable counters"""
+        stats = dict()
+        if self.playlist:
+            stats.update({
+                "loop": self.playlist.loop,
+                "file_index": self.playlist.file_index,
+                "offset": self.playlist.offset,
+                "finished": self.playlist.finished,
+                "pinging": self.replay.pinging,
+                "datagrams": self._pacer.count,
+                "lag_resets": self._pacer.lag_resets,
+                "packets": self.packets,
+                "bytes": self.bytes,
+            })
+        if self.svp:
+            stats["ssp_replies"] = self.svp.ssp_count
+        return stats
+
+    def metrics(self) -> str:
+        """the counters in the Prometheus text format"""
+        from hyo2.kng.lib.metrics import MetricsWriter
+
+        writer = MetricsWriter()
+        if self.playlist:
+            self._reader.metrics(writer)
+            self.replay.metrics(writer)
+            self._pacer.metrics(writer)
+            writer.counter("packets_sent", "UDP packets sent", self.packets)
+            writer.counter("bytes_sent", "Bytes sent", self.bytes)
+            if self._output:
+                writer.counter("send_errors", "Failed transmissions", self._output.errors)
+            writer.gauge("playlist_loop", "Current loop of the playlist", self.playlist.loop)
+            writer.gauge("playlist_file_index", "Current file of the playlist", self.playlist.file_index)
+        if self.svp:
+            self.svp.metrics(writer)
+        return writer.render()
+
+    def info(self) -> str:
+        msg = str()
+        if self.playlist:
+            msg += self.playlist.info()
+            msg += self.replay.info()
+            msg += self._pacer.info()
+            msg += "Output (asyncio):\n"
+            msg += "- packets: %d\n" % self.packets
+            msg += "- bytes: %d\n" % self.bytes
+        msg += "\n"
+        msg += self.store.info()
+        if self.svp:
+            msg += self.svp.info()
+            msg += self.router.info()
+        return msg
@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class _Stage:
+    __slots__ = ["count", "total", "max", "buckets"]
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0  # [ns]
+        self.max = 0  # [ns]
+        self.buckets = [0] * 65  # by power of 2 of the duration [ns]
+
+    def percentile(self, q: float) -> int:
+        """the upper bound [ns] of the bucket holding the passed quantile, capped at the maximum"""
+        rank = q * self.count
+        total = 0
+        for index, count in enumerate(self.buckets):
+            total += count
+            if (count > 0) and (total >= rank):
+                return min(2 ** index, self.max)
+        return 0
+
+
+class StageTimer:
+    """Durations of the stages of a hot path, accumulated in histograms with power of 2 buckets
+
+    A timer is written by a single thread, so it does not lock. The instrumented code keeps the timer in a local
+    variable that is None when disabled, so that the disabled path only costs a test:
+
+        timer = self.timer
+        if timer:
+            start = time.perf_counter_ns()
+        ...
+        if timer:
+            start = timer.record("send", start)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._stages = dict()  # by stage name
+
+    def record(self, stage: str, start: int) -> int:
+        """account for a stage started at the passed time [ns], and return the current time [ns]"""
+        now = time.perf_counter_ns()
+        duration = now - start
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = _Stage()
+            self._stages[stage] = stats
+        stats.count += 1
+        stats.total += duration
+        if duration > stats.max:
+            stats.max = duration
+        stats.buckets[duration.bit_length()] += 1
+        return now
+
+    def to_dict(self) -> dict:
+        stages = dict()
+        for name, stats in list(self._stages.items()):
+            stages[name] = {
+                "count": stats.count,
+                "total_ms": stats.total / 1e6,
+                "mean_us": stats.total / stats.count / 1e3,
+                "p50_us": stats.percentile(0.5) / 1e3,
+                "p99_us": stats.percentile(0.99) / 1e3,
+                "max_us": stats.max / 1e3,
+                "buckets_ns": {str(2 ** index): count for index, count in enumerate(stats.buckets) if count > 0},
+            }
+        return stages
+
+
+def timings(timers: Iterable[StageTimer]) -> dict:
+    """the stage timings, by timer"""
+    return {timer.name: timer.to_dict() for timer in timers}
+
+
+def dump_timings(timers: Iterable[StageTimer], path: str) -> None:
+    with open(path, "w") as fod:
+        json.dump(timings(timers), fod, indent=2)
+    logger.debug("stage timings dumped to %s" % path)
+
+
+def timings_summary(timers: Iterable[StageTimer]) -> str:
+    lines = list()
+    lines.append("%-20s %10s %12s %10s %10s %10s %10s"
+                 % ("stage", "count", "total [ms]", "mean [us]", "p50 [us]", "p99 [us]", "max [us]"))
+    for name, stages in timings(timers).items():
+        for stage, stats in stages.items():
+            lines.append("%-20s %10d %12.3f %10.3f %10.3f %10.3f %10.3f"
+                         % ("%s/%s" % (name, stage), stats["count"], stats["total_ms"], stats["mean_us"],
+                            stats["p50_us"], stats["p99_us"], stats["max_us"]))
+    return "\n".join(lines)
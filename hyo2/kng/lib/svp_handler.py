@@ -0,0 +1,409 @@
+import collections
+import datetime
+import functools
+import hashlib
+import logging
+import struct
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.kng_snn import KngSnn
+from hyo2.kng.lib.metrics import Histogram
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from hyo2.kng.lib.metrics import MetricsWriter
+
+logger = logging.getLogger(__name__)
+
+ReplyPlan = List[Tuple[float, bytes]]  # delay from the previous reply [s], reply data
+
+
+class SvpHandler:
+    """Protocol logic of the SVP interaction, independent of the transport
+
+    The handling of a request returns a reply plan: the list of datagrams to send, each one with its delay from the
+    previous one, so that the caller decides how to wait (sleeping in a thread, or scheduling a timer).
+
+    The SIS 5 control commands are forwarded to the engine callbacks: $KSSIS,458 and $KSSIS,457 start and pause the
+    replay (pinging), $KSSIS,24 terminates the emulator. $KSSIS,997 (detection of sounders) is answered with a
+    $KSSIS,12 message carrying the emulated sounder name.
+
+    NumPy is only imported when a profile is first encoded.
+    """
+
+    encoding_cache_size = 32  # encoded received profiles, by content hash
+
+    def __init__(self, store: DatagramStore, use_sis5: bool = False, debug: bool = False,
+                 sounder_name: Optional[str] = None) -> None:
+        self.debug = debug
+        self.use_sis5 = use_sis5
+        self.sounder_name = sounder_name  # None to derive it from the latest installation datagram
+
+        self.store = store
+
+        # control callbacks, set by the engine
+        self.on_start_pinging = None  # type: Optional[Callable[[], None]]
+        self.on_stop_pinging = None  # type: Optional[Callable[[], None]]
+        self.on_terminate = None  # type: Optional[Callable[[], None]]
+
+        self.r20_count = 0
+        self.ssp_count = 0
+        self.snn_count = 0
+        self.snn_rejected_count = 0
+        self.k454_count = 0
+        self.k997_count = 0
+        self.k458_count = 0
+        self.k457_count = 0
+        self.k24_count = 0
+
+        self._encoded = collections.OrderedDict()  # encoded profiles, by profile key (LRU)
+        self.encoding_hits = 0
+        self.encoding_misses = 0
+
+        # from the request to the transmission of each reply datagram, observed by the engines
+        self.reply_latency = Histogram()
+
+    def handle(self, data: str) -> ReplyPlan:
+        """plan the reply to a received request"""
+        if len(data) < 6:
+            logger.debug("Too short data: %s" % data)
+            return list()
+        if self.debug:
+            logger.debug("received: %s" % data.strip())
+
+        if self.use_sis5:
+            return self._sis_5(data)
+        return self._sis_4(data)
+
+    def _sis_5(self, data: str) -> ReplyPlan:
+
+        if data[0:10] == "$KSSIS,454":
+
+            if self.debug:
+                logger.debug("got KSIS,454 request!")
+            self.k454_count += 1
+
+            if self.store.ssp.latest is None:
+                return self.fake_profile_plan()
+
+            return self.latest_profile_plan()
+
+        elif data[0:4] == "$MVS":
+            # the big assumption here is that we have received a valid Snn profile
+
+            if self.debug and (len(data) > 8):
+                logger.debug("received %s" % data[:6])
+            self.snn_count += 1
+
+            return self.received_profile_plan(data)
+
+        elif data[0:7] == "$KSSIS,":
+            return self._kssis(data.strip().split(",")[1])
+
+        logger.warning('Received unknown message: %s' % data[:9])
+        return list()
+
+    def _kssis(self, command: str) -> ReplyPlan:
+
+        if command == "997":
+            if self.debug:
+                logger.debug("got KSSIS,997 request!")
+            self.k997_count += 1
+            return [(0.0, ("$KSSIS,12,%s" % self.emulated_sounder()).encode())]
+
+        elif command == "458":
+            if self.debug:
+                logger.debug("got KSSIS,458 request!")
+            self.k458_count += 1
+            self._notify(self.on_start_pinging)
+
+        elif command == "457":
+            if self.debug:
+                logger.debug("got KSSIS,457 request!")
+            self.k457_count += 1
+            self._notify(self.on_stop_pinging)
+
+        elif command == "24":
+            if self.debug:
+                logger.debug("got KSSIS,24 request!")
+            self.k24_count += 1
+            self._notify(self.on_terminate)
+
+        else:
+            logger.warning('Received unknown command: $KSSIS,%s' % command)
+
+        return list()
+
+    @staticmethod
+    def _notify(callback: Optional[Callable[[], None]]) -> None:
+        if callback is None:
+            logger.info("command not supported by the engine")
+            return
+        callback()
+
+    def emulated_sounder(self) -> str:
+        """the configured sounder name, or the echo sounder model of the latest installation datagram"""
+        if self.sounder_name:
+            return self.sounder_name
+
+        installation = self.store.installation.latest
+        if (installation is not None) and (len(installation) >= 12):
+            return "EM%d" % struct.unpack_from("<H", installation, 10)[0]
+        return "EM"
+
+    def _sis_4(self, data: str) -> ReplyPlan:
+
+        if data[0] == '$' and data[3:6] == "R20":
+
+            if self.debug:
+                logger.debug("got IUR request!")
+            self.r20_count += 1
+
+            if self.store.ssp.latest is None:
+                return self.fake_profile_plan()
+
+            return self.latest_profile_plan()
+
+        elif data[0:4] == "$MVS":
+            # the big assumption here is that we have received a valid Snn profile
+
+            if self.debug and (len(data) > 8):
+                logger.debug("received %s" % data[:6])
+            self.snn_count += 1
+
+            return self.received_profile_plan(data)
+
+        logger.warning('Received unknown message: %s' % data[:9])
+        return list()
+
+    # profile points, encoded at once from the depth and sound speed arrays
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sis5_ssp_point_dtype() -> "np.dtype":
+        import numpy as np
+        return np.dtype([('depth', '<f4'), ('sound_speed', '<f4'), ('padding', '<u4'),
+                         ('temperature', '<f4'), ('salinity', '<f4')])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def sis4_ssp_point_dtype() -> "np.dtype":
+        import numpy as np
+        return np.dtype([('depth', '<u4'), ('sound_speed', '<u4')])
+
+    def fake_profile_plan(self) -> ReplyPlan:
+        """plan the reply with a made-up profile"""
+        import numpy as np
+
+        date = None
+        secs = None
+
+        # If we're running but haven't received an SVP yet, then we build a fake one to send back.
+        # Useful in testing the Server mode since the library establishes comm's before starting to serve
+        num_entries = 8
+        depths = np.zeros(num_entries)
+        speeds = np.zeros(num_entries)
+        depths[0] = 0.0
+        speeds[0] = 1537.63
+        depths[1] = 50.0
+        speeds[1] = 1537.52
+        depths[2] = 100.0
+        speeds[2] = 1529.96
+        depths[3] = 300.0
+        speeds[3] = 1521.80
+        depths[4] = 800.0
+        speeds[4] = 1486.73
+        depths[5] = 1400.0
+        speeds[5] = 1444.99
+        depths[6] = 1600.0
+        speeds[6] = 1447.25
+        depths[7] = 12000.0
+        speeds[7] = 1500.0
+        if self.debug:
+            logger.debug("made up a fake profile")
+
+        if self.use_sis5:
+            ssp = self._create_sis5_ssp(depths=depths, speeds=speeds, date=date, secs=secs)
+        else:
+            ssp = self._create_sis4_ssp(depths=depths, speeds=speeds, date=date, secs=secs)
+        return self._ssp_plan(ssp)
+
+    def latest_profile_plan(self) -> ReplyPlan:
+        """plan the reply with the latest installation, runtime and profile datagrams"""
+        plan = list()  # type: ReplyPlan
+        delay = 0.0
+
+        # First send the Installation parameters
+        installation = self.store.installation.latest
+        if installation is not None:
+            plan.append((delay, installation))
+            delay = 0.5
+
+        # Second send the Runtime parameters
+        runtime = self.store.runtime.latest
+        if runtime is not None:
+            plan.append((delay, runtime))
+            delay = 0.5
+
+        # Third send the SVP ...
+        ssp = self.store.ssp.latest
+        if ssp is not None:
+            plan.append((delay + 1.5, ssp))
+            self.ssp_count += 1
+        else:
+            logger.warning('No profiles received. Try again!')
+
+        return plan
+
+    def received_profile_plan(self, data: str) -> ReplyPlan:
+        """plan the reply with the profile received as Snn datagram"""
+        # the clients resend the same profile, so the encoding is cached by content hash (LRU)
+        key = hashlib.blake2b(data.encode(), digest_size=16).digest()
+        ssp = self._encoded.get(key)
+        if ssp is not None:
+            self._encoded.move_to_end(key)
+            self.encoding_hits += 1
+            return self._ssp_plan(ssp)
+        self.encoding_misses += 1
+
+        snn = KngSnn(verbose=self.debug)
+        flag = snn.parse(data)
+        if flag != KngSnn.Flags.VALID:
+            logger.warning("unable to parse received profile -> %s" % flag.name)
+            self.snn_rejected_count += 1
+            return list()
+
+        if self.use_sis5:
+            ssp = self._create_sis5_ssp(depths=snn.depths, speeds=snn.speeds, date="%d" % snn.date, secs=snn.secs,
+                                        temperatures=snn.temperatures, salinities=snn.salinities)
+        else:
+            ssp = self._create_sis4_ssp(depths=snn.depths, speeds=snn.speeds, date=snn.date, secs=snn.secs)
+
+        self._encoded[key] = ssp
+        if len(self._encoded) > self.encoding_cache_size:
+            self._encoded.popitem(last=False)
+        return self._ssp_plan(ssp)
+
+    def _ssp_plan(self, ssp: bytes) -> ReplyPlan:
+        if self.debug:
+            logger.debug("sending data: %s" % repr(ssp))
+        if self.store.ssp.latest != ssp:
+            self.store.ssp.put(ssp)
+        self.ssp_count += 1
+        return [(1.5, ssp)]
+
+    def _create_sis5_ssp(self, depths: "np.ndarray", speeds: "np.ndarray",
+                         date: Optional[str] = None, secs: Optional[int] = None,
+                         temperatures: Optional["np.ndarray"] = None,
+                         salinities: Optional["np.ndarray"] = None) -> bytes:
+        import numpy as np
+
+        if self.debug:
+            logger.debug('creating a SIS5 binary ssp')
+
+        common_hdr_fmt = "<I4cBBHII"
+        dg_hdr_fmt = "<2H4BIdd"
+        common_ftr_fmt = "<I"
+
+        dg_date = 334582200
+        if date:
+            try:
+                date_object = datetime.datetime.strptime(date, "%Y%m%d").replace(tzinfo=datetime.timezone.utc)
+                dg_date = int(date_object.timestamp())
+                if secs:
+                    dg_date += secs
+            except Exception as e:
+                logger.warning('Unable to interpret the timestamp: %s and %s -> %s'
+                               % (date, secs, e))
+
+        dg_length = struct.calcsize(common_hdr_fmt) + struct.calcsize(dg_hdr_fmt) + \
+            depths.size * self.sis5_ssp_point_dtype().itemsize + struct.calcsize(common_ftr_fmt)
+
+        # -- header                        length,       datagram id,
+        svp = struct.pack(common_hdr_fmt, dg_length, b'#', b'S', b'V', b'P',
+                          # version, system id, echosounder id, time sec, nanosec
+                          1, 1, 302, dg_date, 0)
+
+        # logger.debug("%s, %s, %s" % (type(struct.calcsize(dg_hdr_fmt)), type(int(depths.size)), type(dg_date)))
+        # -- dg header                      bytes common part,      nr samples,      sensor format,
+        svp += struct.pack(dg_hdr_fmt, struct.calcsize(dg_hdr_fmt), int(depths.size),
+                           ord('S'), ord('0'), ord('0'), ord(' '),
+                           # time sec, latitude, longitude
+                           dg_date, 43.13555, -70.9395
+                           )
+
+        # -- dg points                     depth, sound speed, pad, temp, sal
+        points = np.zeros(depths.size, dtype=self.sis5_ssp_point_dtype())
+        points['depth'] = depths
+        points['sound_speed'] = speeds
+        if temperatures is not None:
+            points['temperature'] = np.nan_to_num(temperatures)
+        if salinities is not None:
+            points['salinity'] = np.nan_to_num(salinities)
+
+        # -- footer
+        return b"".join((svp, points.tobytes(), struct.pack(common_ftr_fmt, dg_length)))
+
+    def _create_sis4_ssp(self, depths: "np.ndarray", speeds: "np.ndarray",
+                         date: Optional[int] = None, secs: Optional[int] = None) -> bytes:
+        import numpy as np
+
+        if self.debug:
+            logger.debug('creating a SIS4 binary ssp')
+
+        d_res = 1  # depth resolution
+        # TODO: improve it with the received metadata
+        now = datetime.datetime.utcnow()
+        if not date:
+            date = int(now.strftime("%Y%m%d"))
+        if not isinstance(date, int):
+            date = int(date)
+        if not secs:
+            secs = (now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+        if not isinstance(secs, int):
+            secs = int(secs)
+
+        # -- header
+        # logger.debug("types: %s %s %s %s" % (type(date), type(secs), type(depths.size), type(d_res)))
+        svp = struct.pack("<BBHIIHHIIHH", 2, 0x55, 122, date, secs * 1000, 1, 123, date, secs, depths.size, d_res)
+
+        # -- body
+        pairs = np.empty(depths.size, dtype=self.sis4_ssp_point_dtype())
+        pairs['depth'] = np.trunc(depths * d_res / 0.01)
+        pairs['sound_speed'] = np.trunc(speeds * 10)
+
+        # -- footer
+        footer = struct.pack("<BH", 3, 0)  # Not bothering with checksum since SVP Editor ignores it anyway
+
+        return b"".join((svp, pairs.tobytes(), footer))
+
+    def metrics(self, writer: "MetricsWriter") -> None:
+        requests = [("R20", self.r20_count), ("Snn", self.snn_count)]
+        if self.use_sis5:
+            requests += [("KSSIS_454", self.k454_count), ("KSSIS_997", self.k997_count),
+                         ("KSSIS_458", self.k458_count), ("KSSIS_457", self.k457_count), ("KSSIS_24", self.k24_count)]
+        for kind, count in requests:
+            writer.counter("svp_requests", "SVP requests received", count, {"type": kind})
+        writer.counter("svp_snn_rejected", "Snn profiles rejected by the parser", self.snn_rejected_count)
+        writer.counter("svp_profiles_sent", "Sound speed profiles sent", self.ssp_count)
+        writer.counter("svp_encoding_cache_hits", "Received profiles served by the encoding cache",
+                       self.encoding_hits)
+        writer.counter("svp_encoding_cache_misses", "Received profiles encoded", self.encoding_misses)
+        writer.histogram("svp_reply_latency_seconds", "From the request to the transmission of a reply datagram",
+                         self.reply_latency)
+
+    def info(self) -> str:
+        msg = "Received Datagrams:\n"
+        msg += "- R20: %d\n" % self.r20_count
+        msg += "- K454: %d\n" % self.k454_count
+        msg += "- Snn: %d (rejected: %d)\n" % (self.snn_count, self.snn_rejected_count)
+        if self.use_sis5:
+            msg += "- K997/458/457/24: %d/%d/%d/%d\n" \
+                   % (self.k997_count, self.k458_count, self.k457_count, self.k24_count)
+        msg += "Reacted Datagrams:\n"
+        msg += "- ssp: %d\n" % self.ssp_count
+        msg += "Profile encoding cache:\n"
+        msg += "- hits/misses: %d/%d\n" % (self.encoding_hits, self.encoding_misses)
+        return msg
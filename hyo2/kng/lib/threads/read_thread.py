@@ -0,0 +1,77 @@
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+from hyo2.kng.lib.replay_reader import ReplayReader
+
+logger = logging.getLogger(__name__)
+
+
+class ReadThread(threading.Thread):
+    """Read ahead the replayed datagrams into a bounded queue
+
+    The queue decouples the disk I/O from the transmission. The end of the playlist (or a failure) is
+    signaled by putting None in the queue.
+    """
+
+    def __init__(self, reader: ReplayReader, queue_size: int = 1024, target: Optional[object] = None,
+                 name: str = "READ") -> None:
+        threading.Thread.__init__(self, target=target, name=name)
+        self.reader = reader
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # the reader waiting on a full queue means that the sender is the bottleneck
+        self.full_count = 0
+        self.full_time = 0.0
+
+        self.shutdown = threading.Event()
+
+    def run(self) -> None:
+        logger.debug("%s started -> queue size: %d" % (self.name, self.queue.maxsize))
+
+        datagrams = self.reader.datagrams()
+        try:
+            for item in datagrams:
+                if not self._put(item):
+                    break
+
+        except Exception as e:
+            logger.error("troubles in reading datagrams -> %s" % e)
+
+        finally:
+            datagrams.close()
+            self._put(None)
+
+        logger.debug("%s ends" % self.name)
+
+    def _put(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+
+        except queue.Full:
+            self.full_count += 1
+
+        start = time.perf_counter()
+        try:
+            while not self.shutdown.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+
+                except queue.Full:
+                    continue
+            return False
+
+        finally:
+            self.full_time += time.perf_counter() - start
+
+    def stop(self) -> None:
+        """Stop the thread"""
+        self.shutdown.set()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
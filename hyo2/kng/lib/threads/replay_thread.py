@@ -1,13 +1,24 @@
 import logging
-import os
+import queue
 import socket
 import threading
 import time
 from threading import Lock
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from hyo2.kng.lib.kng_all import KngAll
+from hyo2.kng.lib.datagram_counters import DatagramCounters
+from hyo2.kng.lib.datagram_store import DatagramStore
 from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.playlist import Playlist
+from hyo2.kng.lib.replay_handler import ReplayHandler
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+from hyo2.kng.lib.replay_reader import FileMark, ReplayReader
+from hyo2.kng.lib.stage_timer import StageTimer
+from hyo2.kng.lib.threads.read_thread import ReadThread
+from hyo2.kng.lib.udp_sender import UdpSender
+
+if TYPE_CHECKING:
+    from hyo2.kng.lib.metrics import MetricsWriter
 
 logger = logging.getLogger(__name__)
 
@@ -17,66 +28,49 @@ class ReplayThread(threading.Thread):
 
     To check who is listening on port 4001: netstat -a -n -o | find "4001"
     then to know the process name: tasklist /fi "pid eq 2216"
+
+    The datagrams are read ahead by a ReadThread into a bounded queue, so this thread only paces and transmits.
     """
 
-    class Sis:
-        def __init__(self):
-            self.installation = list()  # type: List[bytes]
-            self.runtime = list()  # type: List[bytes]
-            self.ssp = list()  # type: List[bytes]
-            self.lists_lock = threading.Lock()
-
-    class Sis4:
-        def __init__(self):
-            self.surface_ssp_count = 0
-            self.nav_count = 0
-            self.installation_count = 0
-            self.runtime_count = 0
-            self.ssp_count = 0
-            self.svp_input_count = 0
-            self.xyz88_count = 0
-            self.range_angle78_count = 0
-            self.seabed_image89_count = 0
-            self.watercolumn_count = 0
-            self.bist_count = 0
-
-    class Sis5:
-        def __init__(self):
-            self.iip_count = 0  # Installation parameters and sensor setup datagram
-            self.iop_count = 0  # Runtime parameters as chosen by operator datagram
-            self.mrz_count = 0  # Multibeam (M) raw range (R) and depth(Z) datagram
-            self.spo_count = 0  # Sensor (S) data for position (PO) datagram
-            self.ssm_count = 0  # Sound Speed Manager (SSM) datagram
-            self.svp_count = 0  # Sensor (S) data from sound velocity (V) profile (P) or CTD datagram
-
-    def __init__(self, installation: List[bytes], runtime: List[bytes], ssp: List[bytes], lists_lock: threading.Lock,
-                 files: List[str], replay_timing: float = 1.0, port_out: int = 26103,
+    def __init__(self, store: DatagramStore, files: List[str], replay_timing: float = 1.0, port_out: int = 26103,
                  ip_out: str = "localhost", target: Optional[object] = None, name: str = "REP", use_sis5: bool = False,
-                 debug: bool = False, replay_ssm: bool = True, replay_mrz: bool = True):
+                 debug: bool = False, replay_ssm: bool = True, replay_mrz: bool = True,
+                 pacing: ReplayPacer.Modes = ReplayPacer.Modes.FIXED, replay_speed: float = 1.0,
+                 batch_size: int = 1, max_packet_size: int = KngKmall.max_udp_size, cache_budget: int = 0,
+                 loops: Optional[int] = None, shuffle: bool = False, queue_size: int = 1024, merge: bool = False,
+                 instrument: bool = False):
         threading.Thread.__init__(self, target=target, name=name)
         self.debug = debug
 
         self.port_out = port_out
         self.ip_out = ip_out
         self.use_sis5 = use_sis5
-        self._replay_ssm = replay_ssm
-        self._replay_mrz = replay_mrz
-        self._replay_timing = replay_timing
-        self.files = files
+        self._handler = ReplayHandler(store=store, use_sis5=use_sis5, replay_ssm=replay_ssm, replay_mrz=replay_mrz,
+                                      max_packet_size=max_packet_size)
+        self._pacer = ReplayPacer(mode=pacing, timing=replay_timing, speed=replay_speed)
+        self.playlist = Playlist(files=self._handler.supported_files(files), loops=loops, shuffle=shuffle,
+                                 merge=merge)
 
         self.sock_in = None
         self.sock_out = None
+        self.batch_size = batch_size
+        self.batch_window = 0.001  # datagrams due within this window are sent in the same batch
+        self._sender = None  # type: Optional[UdpSender]
 
-        self.sis = ReplayThread.Sis()
-        self.sis.installation = installation
-        self.sis.runtime = runtime
-        self.sis.ssp = ssp
-        self.sis.lists_lock = lists_lock
+        # optional per-stage timings: queue (wait for a read-ahead datagram), pace, handle (packets), send
+        self.timer = StageTimer(name) if instrument else None
+        self._reader = ReplayReader(playlist=self.playlist, dg_ids=self._handler.filtered_ids(),
+                                    cache_budget=cache_budget, verbose=debug,
+                                    timer=StageTimer("%s-READ" % name) if instrument else None)
+        self.queue_size = queue_size
+        self._read_thread = None  # type: Optional[ReadThread]
 
-        self.sis4 = ReplayThread.Sis4()
-        self.sis5 = ReplayThread.Sis5()
+        # the sender waiting on an empty queue means that the storage is the bottleneck
+        self.stall_count = 0
+        self.stall_time = 0.0
 
-        self.dg_counter = None
+        self._pinging = threading.Event()
+        self._pinging.set()
 
         self.shutdown = threading.Event()
         self._lock = Lock()
@@ -86,13 +80,26 @@ class ReplayThread(threading.Thread):
     def replay_timing(self):
         if not self._external_lock:
             raise RuntimeError("Accessing resources without locking them!")
-        return self._replay_timing
+        return self._pacer.timing
 
     @replay_timing.setter
     def replay_timing(self, value):
         if not self._external_lock:
             raise RuntimeError("Modifying resources without locking them!")
-        self._replay_timing = value
+        self._pacer.timing = value
+
+    @property
+    def replay_speed(self):
+        if not self._external_lock:
+            raise RuntimeError("Accessing resources without locking them!")
+        return self._pacer.speed
+
+    @replay_speed.setter
+    def replay_speed(self, value):
+        if not self._external_lock:
+            raise RuntimeError("Modifying resources without locking them!")
+        self._pacer.speed = value
+        self._pacer.reset()
 
     def lock_data(self):
         self._lock.acquire()
@@ -111,23 +118,34 @@ class ReplayThread(threading.Thread):
             self.sock_out = None
 
     def run(self):
-        logger.debug("%s started -> out %s:%s, timing: %s"
-                     % (self.name, self.ip_out, self.port_out, self._replay_timing))
+        logger.debug("%s started -> out %s:%s, pacing: %s, timing: %s, speed: %s"
+                     % (self.name, self.ip_out, self.port_out, self._pacer.mode.name, self._pacer.timing,
+                        self._pacer.speed))
 
         self.init_sockets()
-        while True:
-            if self.shutdown.is_set():
-                self._close_sockets()
-                break
-            self.interaction()
-            time.sleep(1)
-            logger.debug("sleep")
+        self.interaction()
+        if not self.shutdown.is_set():
+            logger.debug("playlist completed")
+        self.shutdown.wait()
+        self._close_sockets()
 
         logger.debug("%s ends" % self.name)
 
+    def pause(self) -> None:
+        """Pause the replay (stop pinging)"""
+        self._handler.stop_pinging()
+        self._pinging.clear()
+
+    def resume(self) -> None:
+        """Resume the replay (start pinging)"""
+        self._handler.start_pinging()
+        self._pinging.set()
+
     def stop(self):
         """Stop the thread"""
         self.shutdown.set()
+        if self._read_thread:
+            self._read_thread.stop()
 
     def init_sockets(self):
         """Initialize UDP sockets"""
@@ -138,237 +156,163 @@ class ReplayThread(threading.Thread):
         logger.debug("sock_out > buffer %sKB" %
                      (self.sock_out.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) / 1024))
 
-    def interaction(self):
-        # logger.debug("reading files")
-
-        self.dg_counter = 0
+        self._sender = UdpSender(sock=self.sock_out, ip_out=self.ip_out, port_out=self.port_out,
+                                 batch_size=self.batch_size)
+        logger.debug("sock_out > %s" % self._sender.mode)
 
-        for fp in self.files:
-            if self.shutdown.is_set():
-                self._close_sockets()
-                break
+    def interaction(self):
+        self._read_thread = ReadThread(reader=self._reader, queue_size=self.queue_size, name="%s-READ" % self.name)
+        self._read_thread.start()
+
+        timer = self.timer
+        try:
+            while not self.shutdown.is_set():
+                if timer:
+                    start = time.perf_counter_ns()
+                item = self._next()
+                if timer:
+                    start = timer.record("queue", start)
+                if item is None:
+                    if not self.shutdown.is_set():
+                        self.playlist.finish()
+                    break
 
-            fp_ext = os.path.splitext(fp)[-1].lower()
-            if self.use_sis5:
-                if fp_ext not in [".kmall"]:
-                    logger.info("SIS 5 mode -> skipping unsupported file extension: %s" % fp)
-                    continue
-            else:
-                if fp_ext not in [".all", ".wcd"]:
-                    logger.info("SIS 4 mode -> skipping unsupported file extension: %s" % fp)
+                if isinstance(item, FileMark):
+                    if self._sender:
+                        self._sender.flush()
+                    self.playlist.move(loop=item.loop, file_index=item.file_index, path=item.path)
                     continue
 
-            try:
-                f = open(fp, 'rb')
-                f_sz = os.path.getsize(fp)
-
-            except (OSError, IOError):
-                raise RuntimeError("unable to open %s" % fp)
+                dg_id, dg_time, dg_data, dg_offset = item
+                if not self._pinging.is_set():
+                    if not self._wait_pinging():
+                        continue
+                    if timer:  # the pause is not a stage
+                        start = time.perf_counter_ns()
+                if not self._pace(dg_time):
+                    continue
+                if timer:
+                    start = timer.record("pace", start)
+
+                packets = self._handler.packets(dg_id, dg_data, dg_time)
+                if timer:
+                    start = timer.record("handle", start)
+                for packet in packets:
+                    self._sender.add(packet)
+                if timer:
+                    timer.record("send", start)
+                self.playlist.offset = dg_offset
+
+            if self._sender and not self.shutdown.is_set():
+                self._sender.flush()
+
+        finally:
+            self._read_thread.stop()
+            self._read_thread.join()
+
+    def _wait_pinging(self) -> bool:
+        """wait for the replay to be resumed, return False on shutdown"""
+        if self._sender:
+            self._sender.flush()
+        while not self.shutdown.is_set():
+            if self._pinging.wait(0.1):
+                with self._lock:
+                    self._pacer.reset()
+                return True
+        return False
 
-            logger.debug("open file: %s [%iKB]" % (fp, (f_sz / 1024)))
+    def _next(self):
+        """return the next read-ahead item, None at the end of the playlist or on shutdown"""
+        try:
+            return self._read_thread.queue.get_nowait()
 
-            while True:
+        except queue.Empty:
+            self.stall_count += 1
 
-                if self.shutdown.is_set():
-                    self._close_sockets()
-                    break
+        # flush the pending batch rather than holding it while waiting for the storage
+        if self._sender:
+            self._sender.flush()
 
-                if self.use_sis5:
-                    break_loop = self._sis_5(f, f_sz)
-                else:
-                    break_loop = self._sis_4(f, f_sz)
-                if break_loop:
-                    break
+        start = time.perf_counter()
+        try:
+            while not self.shutdown.is_set():
+                try:
+                    return self._read_thread.queue.get(timeout=0.1)
 
-                if f.tell() >= f_sz:
-                    # end of file
-                    logger.debug("EOF")
-                    break
+                except queue.Empty:
+                    continue
+            return None
 
-            f.close()
-            if self.debug:
-                logger.debug("data loaded > datagrams: %s" % self.dg_counter)
-            self.files.append(fp)
-
-    def _sis_5(self, f, f_sz) -> bool:
-        # guardian to avoid to read beyond the EOF
-        if (f.tell() + 16) > f_sz:
-            if self.debug:
-                logger.debug("EOF")
-            return True
-
-        base = KngKmall(verbose=True)
-        ret = base.read(f, f_sz)
-        # logger.info(ret)
-        if ret == KngKmall.Flags.UNEXPECTED_EOF:
-
-            logger.warning("troubles in reading file > SKIP (reason: unexpected EOF)")
-            return True
-
-        elif ret == KngKmall.Flags.CORRUPTED_END_DATAGRAM:
-
-            f.seek(-(base.length + 3), 1)
-            logger.warning("troubles in reading final datagram part > REALIGN to position: %s" % f.tell())
-
-        elif ret == KngKmall.Flags.VALID:
-
-            self.dg_counter += 1
-
-        else:
-            raise RuntimeError("unknown return %s from KngKmall" % ret)
-
-        # Read and send only the desired datagrams:
-        # - b'#IIP': 'Installation parameters and sensor setup'
-        # - b'#IOP': 'Runtime parameters as chosen by operator'
-        # - b'#SPO': 'Sensor (S) data for position (PO)'
-        # - b'#MRZ': 'Multibeam (M) raw range (R) and depth(Z) datagram'
-        # - b'#SVP': 'Sensor (S) data from sound velocity (V) profile (P) or CTD'
-        # - b'#SSM': 'Sound (S) Speed (S) Manager (M)'
-        filtered_datagrams = [b'#IIP', b'#IOP', b'#SVP']
-        if self._replay_mrz:
-            filtered_datagrams.append(b'#SPO')
-            filtered_datagrams.append(b'#MRZ')
-        if self._replay_ssm:
-            filtered_datagrams.append(b'#SSM')
-        if base.id not in filtered_datagrams:
-            return False
-
-        if base.length > 65507:
-            logger.info("%s > skipping dg %s (length: %sB) > datagram split not implemented"
-                        % (base.dg_time, base.id, base.length))
-            return False
-
-        logger.debug("%s > sending dg %s (length: %sB)" % (base.dg_time, base.id, base.length))
-        f.seek(-base.length, 1)
-        dg_data = f.read(base.length)
-
-        # Stores a few datagrams of interest in data lists:
-        with self.sis.lists_lock:
-            if base.id == b'#IIP':
-                self.sis.installation.clear()
-                self.sis.installation.append(dg_data)
-                self.sis5.iip_count += 1
-            elif base.id == b'#IOP':
-                self.sis.runtime.clear()
-                self.sis.runtime.append(dg_data)
-                self.sis5.iop_count += 1
-            elif base.id == b'#SPO':
-                self.sis5.spo_count += 1
-            elif base.id == b'#MRZ':
-                self.sis5.mrz_count += 1
-            elif base.id == b'#SVP':
-                self.sis.ssp.clear()
-                self.sis.ssp.append(dg_data)
-                self.sis5.svp_count += 1
-            elif base.id == b'#SSM':
-                self.sis5.ssm_count += 1
-
-        self.sock_out.sendto(dg_data, (self.ip_out, self.port_out))
+        finally:
+            self.stall_time += time.perf_counter() - start
 
+    def _pace(self, dg_time: float) -> bool:
+        """wait for the transmission time of the next datagram, return False on shutdown"""
         with self._lock:
-            time.sleep(self._replay_timing)
+            deadline = self._pacer.schedule(dg_time)
 
-        return False
+        if self.batch_size == 1:
+            return self._pacer.wait_until(deadline, self.shutdown)
 
-    def _sis_4(self, f, f_sz) -> bool:
-        # guardian to avoid to read beyond the EOF
-        if (f.tell() + 16) > f_sz:
-            if self.debug:
-                logger.debug("EOF")
-            return True
-
-        base = KngAll(verbose=True)
-        ret = base.read(f, f_sz)
-        if ret == KngAll.Flags.MISSING_FIRST_STX:
-
-            if self.debug:
-                logger.warning("troubles in reading file > SKIP")
-            return True
-
-        elif ret == KngAll.Flags.CORRUPTED_START_DATAGRAM:
-
-            f.seek(-15, 1)  # +1 byte from initial header position
-            logger.warning("troubles in reading initial datagram part > REALIGN to position: %s" % f.tell())
-            return False
-
-        elif ret == KngAll.Flags.UNEXPECTED_EOF:
-
-            logger.warning("troubles in reading file > SKIP (reason: unexpected EOF)")
-            return True
-
-        elif ret == KngAll.Flags.CORRUPTED_END_DATAGRAM:
-
-            f.seek(-(base.length + 3), 1)
-            logger.warning("troubles in reading final datagram part > REALIGN to position: %s" % f.tell())
-
-        elif ret == KngAll.Flags.VALID:
-
-            self.dg_counter += 1
-
-        else:
-            raise RuntimeError("unknown return %s from KngAll" % ret)
-
-        # Read and send only the desired datagrams:
-        # - position (0x50)
-        # - XYZ88 (0x58)
-        # - sound speed profile (0x55)
-        # - runtime parameters (0x52)
-        # - installation parameters (0x49)
-        # - range/angle (0x4e) for coverage modeling.
-        # - seabed imagery (0x59)
-        # - watercolumn (0x6b)
-        if base.id in [0x4e, 0x49, 0x50, 0x52, 0x55, 0x58, 0x59, 0x6b]:
-            logger.debug("%s %s > sending dg #%s(%s) (length: %sB)"
-                         % (base.date, base.time, hex(base.id), base.id, base.length))
-            f.seek(-base.length, 1)
-            dg_data = f.read(base.length)
-
-            # Stores a few datagrams of interest in data lists:
-            with self.sis.lists_lock:
-                if base.id == 0x49:
-                    self.sis.installation.clear()
-                    self.sis.installation.append(dg_data)
-                    self.sis4.installation_count += 1
-                elif base.id == 0x4e:
-                    self.sis4.range_angle78_count += 1
-                elif base.id == 0x50:
-                    self.sis4.nav_count += 1
-                elif base.id == 0x52:
-                    self.sis.runtime.clear()
-                    self.sis.runtime.append(dg_data)
-                    self.sis4.runtime_count += 1
-                elif base.id == 0x55:
-                    self.sis.ssp.clear()
-                    self.sis.ssp.append(dg_data)
-                    self.sis4.ssp_count += 1
-                elif base.id == 0x58:
-                    self.sis4.xyz88_count += 1
-                elif base.id == 0x6b:
-                    self.sis4.watercolumn_count += 1
-
-            self.sock_out.sendto(dg_data, (self.ip_out, self.port_out))
-
-            with self._lock:
-                time.sleep(self._replay_timing)
+        # the pending batch is flushed only when the next datagram is not due within the batch window
+        if not self._pacer.is_due(deadline, self.batch_window):
+            self._sender.flush()
+        return self._pacer.wait_until(deadline, self.shutdown, window=self.batch_window)
 
-        return False
+    @property
+    def counters(self) -> DatagramCounters:
+        """the per-id counters of the replayed datagrams (snapshot them to read)"""
+        return self._handler.counters
+
+    def timers(self) -> List[StageTimer]:
+        """the stage timers, empty when not instrumented"""
+        return [timer for timer in (self._reader.timer, self.timer) if timer is not None]
+
+    def stats(self) -> dict:
+        """machine-readable replay counters"""
+        stats = {
+            "loop": self.playlist.loop,
+            "file_index": self.playlist.file_index,
+            "offset": self.playlist.offset,
+            "finished": self.playlist.finished,
+            "pinging": self._handler.pinging,
+            "datagrams": self._pacer.count,
+            "lag_resets": self._pacer.lag_resets,
+            "sender_stalls": self.stall_count,
+        }
+        if self._read_thread:
+            stats["queue_depth"] = self._read_thread.depth
+        if self._sender:
+            stats["packets"] = self._sender.packets
+            stats["bytes"] = self._sender.bytes
+            stats["errors"] = self._sender.errors
+        return stats
+
+    def metrics(self, writer: "MetricsWriter") -> None:
+        self._reader.metrics(writer)
+        self._handler.metrics(writer)
+        self._pacer.metrics(writer)
+        if self._sender:
+            writer.counter("packets_sent", "UDP packets sent by the replay", self._sender.packets)
+            writer.counter("bytes_sent", "Bytes sent by the replay", self._sender.bytes)
+            writer.counter("send_errors", "Failed transmissions of the replay", self._sender.errors)
+        if self._read_thread:
+            writer.gauge("read_queue_depth", "Datagrams read ahead of the transmission", self._read_thread.depth)
+        writer.counter("sender_stalls", "Waits of the sender on an empty read queue", self.stall_count)
+        writer.gauge("playlist_loop", "Current loop of the playlist", self.playlist.loop)
+        writer.gauge("playlist_file_index", "Current file of the playlist", self.playlist.file_index)
 
     def info(self) -> str:
-        msg = "Transmitted datagrams:\n"
-
-        if self.use_sis5:
-            msg += "- IIP: %d\n" % self.sis5.iip_count
-            msg += "- IOP: %d\n" % self.sis5.iop_count
-            msg += "- MRZ: %d\n" % self.sis5.mrz_count
-            msg += "- SPO: %d\n" % self.sis5.spo_count
-            msg += "- SSM: %d\n" % self.sis5.ssm_count
-            msg += "- SVP: %d\n" % self.sis5.svp_count
-        else:
-            msg += "- Raw: %d\n" % self.sis4.range_angle78_count
-            msg += "- Nav: %d\n" % self.sis4.nav_count
-            msg += "- Xyz: %d\n" % self.sis4.xyz88_count
-            msg += "- Ssp: %d\n" % self.sis4.ssp_count
-            msg += "- Runtime: %d\n" % self.sis4.runtime_count
-            msg += "- Wcd: %d\n" % self.sis4.watercolumn_count
-
+        msg = self.playlist.info()
+        msg += self._handler.info()
+        msg += self._pacer.info()
+        msg += "Read-ahead:\n"
+        if self._read_thread:
+            msg += "- queue: %d/%d\n" % (self._read_thread.depth, self.queue_size)
+            msg += "- reader waits: %d (%.3f s)\n" % (self._read_thread.full_count, self._read_thread.full_time)
+        msg += "- sender stalls: %d (%.3f s)\n" % (self.stall_count, self.stall_time)
+        if self._sender:
+            msg += self._sender.info()
+        if self._reader.cache.enabled:
+            msg += self._reader.cache.info()
         return msg
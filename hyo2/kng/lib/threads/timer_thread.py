@@ -0,0 +1,70 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TimerThread(threading.Thread):
+    """Run the scheduled callbacks at their time, in order, on a single thread
+
+    It lets a handler reply after a delay without sleeping, so that it keeps servicing the new requests.
+    """
+
+    def __init__(self, target: Optional[object] = None, name: str = "TIMER") -> None:
+        threading.Thread.__init__(self, target=target, name=name, daemon=True)
+        self._events = list()  # heap of (time, order, callback, args)
+        self._counter = itertools.count()  # keep the scheduling order for events with the same time
+        self._cond = threading.Condition()
+
+        self.shutdown = threading.Event()
+
+    def schedule(self, delay: float, callback: Callable, *args) -> None:
+        """run the callback with the passed arguments after the delay [s]"""
+        with self._cond:
+            heapq.heappush(self._events, (time.monotonic() + delay, next(self._counter), callback, args))
+            self._cond.notify()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._events)
+
+    def cancel_all(self) -> None:
+        with self._cond:
+            self._events.clear()
+            self._cond.notify()
+
+    def run(self) -> None:
+        logger.debug("%s started" % self.name)
+
+        while not self.shutdown.is_set():
+            with self._cond:
+                if len(self._events) == 0:
+                    self._cond.wait()
+                    continue
+
+                delay = self._events[0][0] - time.monotonic()
+                if delay > 0.0:
+                    self._cond.wait(delay)
+                    continue
+
+                _, _, callback, args = heapq.heappop(self._events)
+
+            try:
+                callback(*args)
+
+            except Exception as e:
+                logger.error("troubles in running %s -> %s" % (callback, e))
+
+        logger.debug("%s ends" % self.name)
+
+    def stop(self) -> None:
+        """Stop the thread, dropping the pending events"""
+        with self._cond:
+            self.shutdown.set()
+            self._events.clear()
+            self._cond.notify()
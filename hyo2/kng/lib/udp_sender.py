@@ -0,0 +1,169 @@
+import ctypes
+import ctypes.util
+import logging
+import socket
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IoVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+class UdpSender:
+    """Transmit UDP datagrams in batches
+
+    The datagrams are collected up to the batch size, then flushed. On Linux, a batch is flushed with a single
+    sendmmsg() system call. Elsewhere (or when sendmmsg is not available), the batch is sent with a sendto() loop.
+    """
+
+    _libc_sendmmsg = None
+    _libc_checked = False
+
+    def __init__(self, sock: socket.socket, ip_out: str, port_out: int, batch_size: int = 1,
+                 use_sendmmsg: bool = True) -> None:
+        self.sock = sock
+        self.address = (ip_out, port_out)
+        self.batch_size = max(1, batch_size)
+
+        self._batch = list()  # packets waiting for the next flush
+
+        # statistics
+        self.packets = 0
+        self.bytes = 0
+        self.errors = 0
+        self.flushes = 0
+        self._start = None  # time of the first flush [s]
+
+        self._sendmmsg = None
+        if use_sendmmsg and (self.batch_size > 1):
+            self._sendmmsg = self._load_sendmmsg()
+        if self._sendmmsg is not None:
+            self._init_mmsg()
+
+    @classmethod
+    def _load_sendmmsg(cls):
+        if not cls._libc_checked:
+            cls._libc_checked = True
+            if sys.platform.startswith("linux"):
+                try:
+                    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                    cls._libc_sendmmsg = libc.sendmmsg
+                    cls._libc_sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                                                   ctypes.c_int]
+                    cls._libc_sendmmsg.restype = ctypes.c_int
+                except (OSError, AttributeError) as e:
+                    logger.info("sendmmsg not available -> %s" % e)
+        return cls._libc_sendmmsg
+
+    def _init_mmsg(self) -> None:
+        ip, port = socket.getaddrinfo(self.address[0], self.address[1], socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        sock_addr = struct.pack("=H", socket.AF_INET) + struct.pack("!H", port) + socket.inet_aton(ip) + bytes(8)
+        self._sock_addr = ctypes.create_string_buffer(sock_addr, len(sock_addr))
+
+        self._iovs = (_IoVec * self.batch_size)()
+        self._msgs = (_MMsgHdr * self.batch_size)()
+        for i in range(self.batch_size):
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._sock_addr)
+            hdr.msg_namelen = len(sock_addr)
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+
+    @property
+    def mode(self) -> str:
+        if self._sendmmsg is not None:
+            return "sendmmsg"
+        return "sendto"
+
+    @property
+    def pending(self) -> int:
+        return len(self._batch)
+
+    def add(self, data: bytes) -> None:
+        """queue a datagram, flushing the batch when full"""
+        self._batch.append(data)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """transmit the queued datagrams"""
+        if len(self._batch) == 0:
+            return
+        if self._start is None:
+            self._start = time.perf_counter()
+
+        if self._sendmmsg is not None:
+            self._flush_sendmmsg()
+        else:
+            self._flush_sendto()
+        self.flushes += 1
+        self._batch.clear()
+
+    def _flush_sendto(self) -> None:
+        for data in self._batch:
+            try:
+                self.sock.sendto(data, self.address)
+            except OSError as e:
+                self.errors += 1
+                logger.debug("unable to send %dB -> %s" % (len(data), e))
+                continue
+            self.packets += 1
+            self.bytes += len(data)
+
+    def _flush_sendmmsg(self) -> None:
+        nr_msgs = len(self._batch)
+        buffers = [ctypes.c_char_p(data) for data in self._batch]  # no copy, alive until the end of the call
+        for i, data in enumerate(self._batch):
+            self._iovs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+            self._iovs[i].iov_len = len(data)
+
+        fd = self.sock.fileno()
+        sent = 0
+        while sent < nr_msgs:
+            ret = self._sendmmsg(fd, ctypes.byref(self._msgs[sent]), nr_msgs - sent, 0)
+            if ret < 0:
+                # the failing datagram is dropped, then the rest of the batch is retried
+                self.errors += 1
+                logger.debug("unable to send %dB -> errno %d" % (len(self._batch[sent]), ctypes.get_errno()))
+                sent += 1
+                continue
+            for i in range(sent, sent + ret):
+                self.packets += 1
+                self.bytes += len(self._batch[i])
+            sent += ret
+
+    def rate(self) -> float:
+        """the achieved packets per second since the first flush"""
+        if self._start is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._start
+        if elapsed <= 0.0:
+            return 0.0
+        return self.packets / elapsed
+
+    def info(self) -> str:
+        msg = "Output (%s, batch: %d):\n" % (self.mode, self.batch_size)
+        msg += "- packets: %d [%.1f pkt/s]\n" % (self.packets, self.rate())
+        msg += "- bytes: %d\n" % self.bytes
+        msg += "- errors: %d\n" % self.errors
+        return msg
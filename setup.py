@@ -59,6 +59,8 @@ setup(
             "SISEmu = hyo2.kng.app.sis_emu.__main__:main",
         ],
         "console_scripts": [
+            "SISEmuCli = hyo2.kng.lib.cli:main",
+            "SISEmuReceiver = hyo2.kng.lib.kng_receiver:main",
         ],
     },
     test_suite="tests",
@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from hyo2.kng.lib import cli
+from tests.test_kng_index import kmall_datagram
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        with open(self.path, "wb") as fod:
+            for i in range(20):
+                fod.write(kmall_datagram(b"#MRZ", time_sec=1708128000 + i))
+
+        self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rx.bind(("127.0.0.1", 0))
+        self.port_out = self.rx.getsockname()[1]
+
+    def tearDown(self):
+        self.rx.close()
+        shutil.rmtree(self.folder)
+
+    def run_cli(self, argv):
+        out = StringIO()
+        with redirect_stdout(out):
+            ret = cli.main(argv)
+        self.assertEqual(ret, 0)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_flags(self):
+        lines = self.run_cli(["--engine", "async", "--port-in", "0", "--port-out", str(self.port_out),
+                              "--ip-out", "127.0.0.1", "--timing", "0.001", "--loops", "2", "--exit-at-end",
+                              "--stats-interval", "0.1", "--duration", "10", self.path])
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(lines[-1]["event"], "final")
+        self.assertTrue(lines[-1]["finished"])
+        self.assertEqual(lines[-1]["datagrams"], 40)
+        self.assertEqual(lines[-1]["packets"], 40)
+        self.assertIn("packets_rate", lines[0])
+
+    def test_config(self):
+        config = os.path.join(self.folder, "session.json")
+        with open(config, "w") as fod:
+            json.dump({"files": [self.path], "engine": "async", "port_in": 0, "port_out": self.port_out,
+                       "ip_out": "127.0.0.1", "pacing": "timestamp", "speed": 0.0, "loops": 1,
+                       "exit_at_end": True, "stats_interval": 0.1, "duration": 10.0}, fod)
+
+        # the flags take precedence over the config file
+        lines = self.run_cli(["-c", config, "--loops", "3"])
+        self.assertEqual(lines[-1]["datagrams"], 60)
+
+    def test_settings(self):
+        config = os.path.join(self.folder, "session.toml")
+        with open(config, "w") as fod:
+            fod.write('files = ["a.kmall"]\nport_out = 16103\nno_ssm = true\n')
+
+        try:
+            settings = cli.parse_args(["-c", config, "--speed", "2"])
+
+        except RuntimeError:  # TOML not available
+            return
+
+        self.assertEqual(settings["files"], ["a.kmall"])
+        self.assertEqual(settings["port_out"], 16103)
+        self.assertTrue(settings["no_ssm"])
+        self.assertEqual(settings["speed"], 2.0)
+        self.assertEqual(settings["port_in"], cli.defaults["port_in"])
+
+    def test_create_sis(self):
+        config = os.path.join(self.folder, "session.json")
+        with open(config, "w") as fod:
+            json.dump({"reply_mode": "table", "routes": {"10.0.0.2": ["10.0.0.2", "16104"]}}, fod)
+
+        sis = cli.create_sis(cli.parse_args(["-c", config, "--max-packet-size", "1400", self.path]))
+        self.assertEqual(sis._max_packet_size, 1400)
+        self.assertEqual(sis._routes, {"10.0.0.2": ("10.0.0.2", 16104)})
+        sis = cli.create_sis(cli.parse_args([self.path]))
+        self.assertEqual(sis._max_packet_size, cli.defaults["max_packet_size"])
+
+    def test_unknown_key(self):
+        config = os.path.join(self.folder, "session.json")
+        with open(config, "w") as fod:
+            json.dump({"prot_out": 16103}, fod)
+
+        with self.assertRaises(RuntimeError):
+            cli.parse_args(["-c", config])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCli))
+    return s
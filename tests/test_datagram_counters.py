@@ -0,0 +1,83 @@
+import threading
+import unittest
+
+from hyo2.kng.lib.datagram_counters import DatagramCounters
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.replay_handler import ReplayHandler
+
+
+class TestDatagramCounters(unittest.TestCase):
+
+    def test_add(self):
+        counters = DatagramCounters(capacity=2)
+        counters.add(b'#MRZ', 100, 10.0)
+        counters.add(b'#MRZ', 50, 11.0)
+        counters.add(b'#SKM', 70, 12.0, sent=False, oversized=True)
+        for dg_id in range(10):  # beyond the initial capacity
+            counters.add(dg_id, 1, 0.5, corrupted=True)
+
+        snapshot = counters.snapshot()
+        self.assertEqual(list(snapshot)[:3], [b'#MRZ', b'#SKM', 0])
+        self.assertEqual(snapshot[b'#MRZ'].count, 2)
+        self.assertEqual(snapshot[b'#MRZ'].bytes, 150)
+        self.assertEqual(snapshot[b'#MRZ'].last_time, 11.0)
+        self.assertEqual(snapshot[b'#SKM'].count, 0)
+        self.assertEqual(snapshot[b'#SKM'].skipped, 1)
+        self.assertEqual(snapshot[b'#SKM'].oversized, 1)
+        self.assertEqual(snapshot[9].corrupted, 1)
+        self.assertEqual(counters.get(b'#SPO').count, 0)
+
+    def test_consistent_snapshots(self):
+        counters = DatagramCounters()
+        done = threading.Event()
+
+        def send():
+            for _ in range(100000):
+                counters.add(b'#MRZ', 10, 1.0)
+                counters.add(b'#SPO', 10, 1.0)
+            done.set()
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        while not done.is_set():
+            snapshot = counters.snapshot()
+            mrz = snapshot.get(b'#MRZ')
+            spo = snapshot.get(b'#SPO')
+            if spo is None:
+                continue
+            self.assertEqual(mrz.bytes, 10 * mrz.count)
+            self.assertIn(mrz.count - spo.count, [0, 1])
+        sender.join()
+        self.assertEqual(counters.get(b'#SPO').count, 100000)
+
+    def test_replay_handler(self):
+        generator = KngGenerator()
+        handler = ReplayHandler(store=DatagramStore(), use_sis5=True, max_packet_size=1000)
+
+        mrz = generator.kmall_datagram(b'#MRZ', 10.0, body=bytes(3000))
+        self.assertGreater(len(handler.packets(b'#MRZ', mrz, 10.0)), 1)
+        skm = generator.kmall_datagram(b'#SKM', 10.0, body=bytes(3000))
+        self.assertEqual(handler.packets(b'#SKM', skm, 10.0), list())
+        handler.packets(b'#SPO', mrz[:-1], 11.0)
+
+        snapshot = handler.counters.snapshot()
+        self.assertEqual(snapshot[b'#MRZ'].count, 1)
+        self.assertEqual(snapshot[b'#MRZ'].bytes, len(mrz))
+        self.assertEqual(snapshot[b'#MRZ'].oversized, 1)
+        self.assertEqual(snapshot[b'#SKM'].skipped, 1)
+        self.assertEqual(snapshot[b'#SPO'].corrupted, 1)
+        self.assertIn("- MRZ: 1 ", handler.info())
+        self.assertIn("- IIP: 0\n", handler.info())
+
+        handler = ReplayHandler(store=DatagramStore(), use_sis5=False)
+        xyz = generator.all_datagram(0x58, 10.0)[4:]  # the length field is not transmitted
+        handler.packets(0x58, xyz, 10.0)
+        self.assertEqual(handler.counters.get(0x58).corrupted, 0)
+        self.assertIn("- Xyz: 1 ", handler.info())
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDatagramCounters))
+    return s
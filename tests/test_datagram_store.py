@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from hyo2.kng.lib.datagram_store import DatagramSlot, DatagramStore
+
+
+class TestDatagramStore(unittest.TestCase):
+
+    def test_slot(self):
+        slot = DatagramSlot(history=3)
+        self.assertIsNone(slot.latest)
+        for i in range(5):
+            slot.put(b"%d" % i)
+        self.assertEqual(slot.latest, b"4")
+        self.assertEqual(slot.snapshot(), (b"2", b"3", b"4"))
+        self.assertEqual(len(slot), 3)
+        self.assertEqual(slot.count, 5)
+
+    def test_latest_only(self):
+        slot = DatagramSlot(history=1)
+        slot.put(b"a")
+        slot.put(b"b")
+        self.assertEqual(slot.snapshot(), (b"b", ))
+
+    def test_concurrent_snapshots(self):
+        slot = DatagramSlot(history=8)
+        done = threading.Event()
+
+        def writer():
+            for i in range(20000):
+                slot.put(b"%d" % i)
+            done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        while not done.is_set():
+            items = [int(item) for item in slot.snapshot()]
+            self.assertEqual(items, list(range(items[0], items[0] + len(items))) if items else [])
+        thread.join()
+        self.assertEqual(slot.count, 20000)
+
+    def test_info(self):
+        store = DatagramStore(history=4)
+        store.ssp.put(b"svp")
+        self.assertIn("ssp: 1/4 (total: 1)", store.info())
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDatagramStore))
+    return s
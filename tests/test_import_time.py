@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+class TestImportTime(unittest.TestCase):
+    """Guard the startup of the library against heavy imports"""
+
+    budget = 0.5  # cumulative import time [s], generous to not fail on slow machines
+    heavy = ("numpy", "hyo2.abc2", "PySide6")
+
+    @staticmethod
+    def import_times(module: str) -> dict:
+        """cumulative import time [s] of each module imported by the passed one (python -X importtime)"""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+        ret = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module],
+                             capture_output=True, text=True, env=env, check=True)
+        times = dict()
+        for line in ret.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            try:
+                times[name.strip()] = int(cumulative) / 1e6
+
+            except ValueError:  # the table header
+                continue
+        return times
+
+    def check(self, module: str) -> None:
+        times = self.import_times(module)
+        self.assertIn(module, times)
+        for name in times:
+            self.assertFalse(name.startswith(self.heavy), "%s imports %s" % (module, name))
+        self.assertLess(times[module], self.budget)
+
+    def test_sis(self):
+        self.check("hyo2.kng.lib.sis")
+
+    def test_sis_async(self):
+        self.check("hyo2.kng.lib.sis_async")
+
+    def test_cli(self):
+        self.check("hyo2.kng.lib.cli")
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestImportTime))
+    return s
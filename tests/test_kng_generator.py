@@ -0,0 +1,91 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from hyo2.kng.lib.kng_all import KngAll
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.kng_scanner import KngScanner
+
+
+class TestKngGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def read_all(path, reader_class):
+        file_size = os.path.getsize(path)
+        flags = list()
+        with open(path, "rb") as fid:
+            while fid.tell() < file_size:
+                flags.append(reader_class().read(fid, file_size))
+        return flags
+
+    def test_all(self):
+        path = os.path.join(self.folder, "test.all")
+        self.assertEqual(KngGenerator().write(path, count=30), 30)
+
+        flags = self.read_all(path, KngAll)
+        self.assertEqual(len(flags), 30)
+        self.assertTrue(all(flag == KngAll.Flags.VALID for flag in flags))
+
+        with open(path, "rb") as fid:
+            data = fid.read()
+        length = struct.unpack_from("<I", data)[0]
+        checksum = struct.unpack_from("<H", data, 4 + length - 2)[0]
+        self.assertEqual(checksum, sum(data[5:4 + length - 3]) & 0xFFFF)
+
+        scanned = KngScanner(path=path).scan()
+        self.assertEqual(list(scanned["id"][:3]), KngGenerator.all_header_ids)
+
+    def test_kmall(self):
+        path = os.path.join(self.folder, "test.kmall")
+        mix = {b'#SPO': 2, b'#MRZ': 1, b'#SSM': 1}
+        self.assertEqual(KngGenerator(ping_rate=10.0).write(path, count=43, mix=mix), 43)
+
+        flags = self.read_all(path, KngKmall)
+        self.assertEqual(len(flags), 43)
+        self.assertTrue(all(flag == KngKmall.Flags.VALID for flag in flags))
+
+        scanned = KngScanner(path=path).scan()
+        ids = list(scanned["id"])
+        self.assertEqual(ids[:3], KngGenerator.kmall_header_ids)
+        self.assertEqual(ids[3:7], [b'#SPO', b'#SPO', b'#MRZ', b'#SSM'])
+        self.assertEqual(ids.count(b'#MRZ'), 10)
+
+    def test_size(self):
+        path = os.path.join(self.folder, "test.kmall")
+        KngGenerator().write(path, size=2 ** 20)
+        self.assertGreaterEqual(os.path.getsize(path), 2 ** 20)
+        self.assertLess(os.path.getsize(path), 2 ** 20 + 2 ** 16)
+
+    def test_deterministic(self):
+        paths = [os.path.join(self.folder, "test_%d.all" % count) for count in range(3)]
+        KngGenerator(seed=5).write(paths[0], count=20)
+        KngGenerator(seed=5).write(paths[1], count=20)
+        KngGenerator(seed=6).write(paths[2], count=20)
+
+        data = list()
+        for path in paths:
+            with open(path, "rb") as fid:
+                data.append(fid.read())
+        self.assertEqual(data[0], data[1])
+        self.assertNotEqual(data[0], data[2])
+
+    def test_invalid(self):
+        with self.assertRaises(RuntimeError):
+            KngGenerator().write(os.path.join(self.folder, "test.txt"), count=1)
+        with self.assertRaises(RuntimeError):
+            KngGenerator().write(os.path.join(self.folder, "test.all"))
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngGenerator))
+    return s
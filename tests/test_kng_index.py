@@ -0,0 +1,83 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from hyo2.kng.lib.kng_index import KngIndex
+
+
+def all_datagram(dg_id: int, body: bytes = b"\x00" * 8, date: int = 20240217, time: int = 1000) -> bytes:
+    length = 12 + len(body) + 3
+    return struct.pack("<IBBHII", length, 2, dg_id, 2040, date, time) + body + struct.pack("<BH", 3, 0)
+
+
+def kmall_datagram(dg_id: bytes, body: bytes = b"\x00" * 8, time_sec: int = 1708128000) -> bytes:
+    length = 20 + len(body) + 4
+    return struct.pack("<I4sBBHII", length, dg_id, 1, 40, 2040, time_sec, 500000000) + body + \
+        struct.pack("<I", length)
+
+
+class TestKngIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_all(self):
+        path = self._write("test.all", all_datagram(0x49) + all_datagram(0x50, time=2000) + all_datagram(0x58))
+        index = KngIndex(path=path)
+        index.load_or_build()
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.decode_id(index.entries["id"][1]), 0x50)
+        self.assertAlmostEqual(float(index.entries["timestamp"][1] - index.entries["timestamp"][0]), 1.0)
+
+        with open(path, "rb") as f:
+            entry = index.select([0x50])[0]
+            f.seek(int(entry["offset"]))
+            self.assertEqual(f.read(int(entry["length"])), all_datagram(0x50, time=2000)[4:])
+
+    def test_all_realign(self):
+        path = self._write("test.all", all_datagram(0x49) + b"\x01\x02\x03" + all_datagram(0x50))
+        index = KngIndex(path=path)
+        index.build()
+        self.assertEqual([index.decode_id(code) for code in index.entries["id"]], [0x49, 0x50])
+
+    def test_kmall(self):
+        path = self._write("test.kmall", kmall_datagram(b"#IIP") + kmall_datagram(b"#MRZ"))
+        index = KngIndex(path=path)
+        index.load_or_build()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(index.select([b"#MRZ"])), 1)
+        self.assertAlmostEqual(float(index.entries["timestamp"][0]), 1708128000.5)
+
+    def test_sidecar(self):
+        path = self._write("test.kmall", kmall_datagram(b"#IIP") + kmall_datagram(b"#MRZ"))
+        index = KngIndex(path=path)
+        index.load_or_build()
+        self.assertTrue(os.path.exists(index.sidecar_path))
+
+        loaded = KngIndex(path=path)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.entries.tobytes(), index.entries.tobytes())
+
+        with open(path, "ab") as f:
+            f.write(kmall_datagram(b"#SPO"))
+        self.assertFalse(index.is_valid())
+        self.assertFalse(KngIndex(path=path).load())
+        index.load_or_build()
+        self.assertEqual(len(index), 3)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngIndex))
+    return s
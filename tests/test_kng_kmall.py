@@ -0,0 +1,39 @@
+import struct
+import unittest
+
+from hyo2.kng.lib.kng_kmall import KngKmall
+from tests.test_kng_index import kmall_datagram
+
+
+class TestKngKmall(unittest.TestCase):
+
+    def test_is_partitioned(self):
+        self.assertTrue(KngKmall.is_partitioned(b"#MRZ"))
+        self.assertTrue(KngKmall.is_partitioned(b"#MWC"))
+        self.assertFalse(KngKmall.is_partitioned(b"#SVP"))
+
+    def test_partition(self):
+        body = struct.pack("<HH", 1, 1) + bytes(range(256)) * 10
+        dg_data = kmall_datagram(b"#MRZ", body=body)
+        parts = KngKmall.partition(dg_data, max_size=1000)
+        self.assertEqual(len(parts), 3)
+
+        rejoined = b""
+        for dgm_num, part in enumerate(parts):
+            self.assertLessEqual(len(part), 1000)
+            self.assertEqual(struct.unpack("<I", part[:4])[0], len(part))
+            self.assertEqual(struct.unpack("<I", part[-4:])[0], len(part))
+            self.assertEqual(part[4:20], dg_data[4:20])
+            self.assertEqual(struct.unpack("<HH", part[20:24]), (3, dgm_num + 1))
+            rejoined += part[24:-4]
+        self.assertEqual(rejoined, body[4:])
+
+    def test_partition_single(self):
+        dg_data = kmall_datagram(b"#MRZ", body=struct.pack("<HH", 1, 1) + bytes(100))
+        self.assertEqual(KngKmall.partition(dg_data), [dg_data])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngKmall))
+    return s
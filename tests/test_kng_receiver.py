@@ -0,0 +1,120 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.kng_kmall import KngKmall
+from hyo2.kng.lib.kng_receiver import KngReceiver
+from hyo2.kng.lib.replay_handler import ReplayHandler
+from hyo2.kng.lib.sis_async import SisAsync
+
+
+class TestKngReceiver(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.generator = KngGenerator(ping_rate=100.0, body_sizes={b'#MRZ': 100000})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write_kmall(self) -> str:
+        path = os.path.join(self.folder, "test.kmall")
+        self.generator.write(path, count=7)  # 2 #MRZ
+        return path
+
+    def test_replay(self):
+        path = os.path.join(self.folder, "test.kmall")
+        self.generator.write(path, count=3 + 2 * 20)  # header datagrams and 20 pings of #SPO and #MRZ (2 parts)
+
+        with KngReceiver(port=0, ip="127.0.0.1", timing=0.001) as receiver:
+            receiver.expect([path], dg_ids=ReplayHandler.replayed_ids(use_sis5=True))
+            sis = SisAsync(port_in=0, port_out=receiver.port, ip_out="127.0.0.1", replay_timing=0.001, loops=1,
+                           use_sis5=True)
+            sis.set_files([path])
+            sis.start()
+            try:
+                self.assertTrue(receiver.wait(3 + 20 * 3))
+
+            finally:
+                sis.stop()
+
+        stats = receiver.stats()
+        self.assertEqual(stats["expected"], 43)
+        self.assertEqual(stats["missing"], dict())
+        self.assertEqual(stats["gaps"], 0)
+        self.assertEqual(stats["ids"]["#MRZ"]["packets"], 40)
+        self.assertEqual(stats["ids"]["#MRZ"]["datagrams"], 20)
+        self.assertEqual(stats["packets"], sis.packets)
+        self.assertIn("jitter_ms", stats)
+
+    def test_expect(self):
+        path = os.path.join(self.folder, "test.kmall")
+        self.generator.write(path, count=3 + 3 * 4, mix={b'#SPO': 1, b'#MRZ': 1, b'#SKM': 1})
+
+        receiver = KngReceiver()
+        receiver.expect([path], loops=2)  # the #SKM datagrams are not replayed
+        self.assertEqual(receiver.expected, {b'#IIP': 2, b'#IOP': 2, b'#SVP': 2, b'#SPO': 8, b'#MRZ': 8})
+        receiver.expect([path], replay_mrz=False)
+        self.assertEqual(receiver.expected, {b'#IIP': 1, b'#IOP': 1, b'#SVP': 1})
+        receiver.expect([path], dg_ids=[b'#SKM'])
+        self.assertEqual(receiver.expected, {b'#SKM': 4})
+
+    def test_kmall_gaps(self):
+        receiver = KngReceiver()
+        receiver.expect([self._write_kmall()])
+
+        parts = KngKmall.partition(self.generator.kmall_datagram(b'#MRZ', self.generator.start), max_size=40000)
+        self.assertEqual(len(parts), 3)
+        receiver.handle(parts[0], 0.0)
+        receiver.handle(parts[2], 0.1)  # the second part is lost
+        for part in parts:
+            receiver.handle(part, 0.2)
+
+        stats = receiver.stats()
+        self.assertEqual(stats["ids"]["#MRZ"]["gaps"], 1)
+        self.assertEqual(stats["ids"]["#MRZ"]["datagrams"], 1)
+        self.assertEqual(stats["missing"]["#MRZ"], 1)
+
+    def test_all_gaps(self):
+        receiver = KngReceiver(use_sis5=False, timing=0.1)
+        for counter in [1, 2, 5, 6, 0, 1]:  # 3 and 4 are lost, then a new loop
+            receiver.handle(self.generator.all_datagram(0x58, self.generator.start, counter=counter)[4:],
+                            counter * 0.1)
+        receiver.handle(b"\x02", 1.0)
+
+        stats = receiver.stats()
+        self.assertEqual(stats["ids"]["0x58"]["gaps"], 2)
+        self.assertEqual(stats["malformed"], 1)
+        self.assertEqual(stats["requested_rate"], 10.0)
+
+    def test_all_no_ping_counter(self):
+        receiver = KngReceiver(use_sis5=False)
+        for counter in [1, 5, 2, 9]:  # not ping counters (e.g., the line number of the installation parameters)
+            for dg_id in [0x49, 0x50, 0x52, 0x55]:
+                receiver.handle(self.generator.all_datagram(dg_id, self.generator.start, counter=counter)[4:], 0.0)
+        receiver.handle(self.generator.all_datagram(0x6b, self.generator.start, counter=7)[4:], 0.0)
+        receiver.handle(self.generator.all_datagram(0x6b, self.generator.start, counter=7)[4:], 0.0)
+
+        stats = receiver.stats()
+        self.assertEqual(stats["gaps"], 0)
+        self.assertEqual(stats["ids"]["0x49"]["datagrams"], 4)
+
+    def test_socket(self):
+        with KngReceiver(port=0, ip="127.0.0.1") as receiver:
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            data = self.generator.kmall_datagram(b'#SPO', time.time())
+            for _ in range(5):
+                tx.sendto(data, ("127.0.0.1", receiver.port))
+            tx.close()
+            self.assertTrue(receiver.wait(5))
+        self.assertEqual(receiver.stats()["ids"]["#SPO"]["datagrams"], 5)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngReceiver))
+    return s
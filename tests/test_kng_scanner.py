@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hyo2.kng.lib.kng_scanner import KngScanner
+from tests.test_kng_index import all_datagram, kmall_datagram
+
+
+class TestKngScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_all(self):
+        path = self._write("test.all", all_datagram(0x49) + all_datagram(0x50, time=2000))
+        scanned = KngScanner(path=path).scan()
+        self.assertEqual(len(scanned), 2)
+        self.assertTrue(scanned["valid"].all())
+        self.assertEqual(list(scanned["id"]), [0x49, 0x50])
+        self.assertEqual(int(scanned["offset"][1]), len(all_datagram(0x49)))
+        self.assertEqual(int(scanned["time"][1]), 2000)
+        self.assertEqual(int(scanned["model"][0]), 2040)
+
+    def test_all_corrupted(self):
+        path = self._write("test.all", all_datagram(0x49) + b"\x01\x02\x03\x04" + all_datagram(0x50))
+        scanned = KngScanner(path=path).scan()
+        self.assertEqual(list(scanned["valid"]), [True, False, True])
+        self.assertEqual(list(scanned["id"][scanned["valid"]]), [0x49, 0x50])
+
+    def test_all_missing_first_stx(self):
+        path = self._write("test.all", b"\x00" * 32)
+        self.assertEqual(len(KngScanner(path=path).scan()), 0)
+
+    def test_tiny(self):
+        for name, data in [("test.all", b"\x00\x00\x00\x00"), ("test.all", b"\x00\x00\x00\x00\x02" + b"\x00" * 10),
+                           ("test.kmall", b"\x18\x00\x00\x00#MRZ" + b"\x00" * 10)]:
+            self.assertEqual(len(KngScanner(path=self._write(name, data)).scan()), 0)
+
+    def test_kmall(self):
+        path = self._write("test.kmall", kmall_datagram(b"#IIP") + b"\x00\x01" + kmall_datagram(b"#MRZ"))
+        scanned = KngScanner(path=path).scan()
+        self.assertEqual(list(scanned["valid"]), [True, False, True])
+        self.assertEqual(list(scanned["id"][scanned["valid"]]), [b"#IIP", b"#MRZ"])
+        self.assertEqual(int(scanned["time_nanosec"][0]), 500000000)
+        self.assertEqual(int(scanned["sounder_id"][2]), 2040)
+
+    def test_truncated(self):
+        path = self._write("test.kmall", kmall_datagram(b"#IIP") + kmall_datagram(b"#MRZ")[:-8])
+        scanned = KngScanner(path=path).scan()
+        self.assertEqual(list(scanned["id"]), [b"#IIP"])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngScanner))
+    return s
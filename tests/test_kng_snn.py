@@ -0,0 +1,54 @@
+import functools
+import operator
+import unittest
+
+from hyo2.kng.lib.kng_snn import KngSnn
+
+
+def snn_datagram(depths, speeds, temps, sals, checksum: bool = True) -> str:
+    msg = '$MVS01,00000,%04d,%s' % (len(depths), "123456,17,02,2024,")
+    for i in range(len(depths)):
+        msg += "%.2f,%1f,%s,%s,\r\n" % (depths[i], speeds[i], temps[i], sals[i])
+    msg += "1020.30,N,3020.10,W,0.0,test comment,"
+    if checksum:
+        msg += "*%02x" % functools.reduce(operator.xor, map(ord, msg[1:]))
+    return msg + "\\\r\n"
+
+
+class TestKngSnn(unittest.TestCase):
+
+    def test_valid(self):
+        data = snn_datagram([0.0, 2.6, 24.6], [1539.5, 1543.2, 1543.4], [27.29, 28.94, ""], [34.85, 34.84, ""])
+        snn = KngSnn()
+        self.assertEqual(snn.parse(data), KngSnn.Flags.VALID)
+        self.assertEqual(snn.id, "S01")
+        self.assertEqual(snn.nr_samples, 3)
+        self.assertEqual(snn.date, 20240217)
+        self.assertEqual(snn.secs, 12 * 3600 + 34 * 60 + 56)
+        self.assertEqual(list(snn.depths), [0.0, 2.6, 24.6])
+        self.assertEqual(list(snn.speeds), [1539.5, 1543.2, 1543.4])
+        self.assertEqual(snn.temperatures[1], 28.94)
+        self.assertNotEqual(snn.salinities[2], snn.salinities[2])  # missing value
+
+    def test_without_checksum(self):
+        data = snn_datagram([0.0, 10.0], [1500.0, 1501.0], ["", ""], ["", ""], checksum=False)
+        self.assertEqual(KngSnn().parse(data), KngSnn.Flags.VALID)
+
+    def test_bad_checksum(self):
+        data = snn_datagram([0.0, 10.0], [1500.0, 1501.0], [10.0, 9.0], [35.0, 35.0])
+        self.assertEqual(KngSnn().parse(data.replace("1501", "1502")), KngSnn.Flags.BAD_CHECKSUM)
+
+    def test_malformed(self):
+        self.assertEqual(KngSnn().parse("$MVS01,00000,abcd,123456,17,02,2024,"), KngSnn.Flags.MALFORMED_HEADER)
+        self.assertEqual(KngSnn().parse("$MVS01,00000,0002,126056,17,02,2024,"), KngSnn.Flags.MALFORMED_HEADER)
+        self.assertEqual(KngSnn().parse("$MVS01,00000,0002,123456,17,02,2024,0.0,1500,,,"),
+                         KngSnn.Flags.MALFORMED_SAMPLES)
+        self.assertEqual(KngSnn().parse("$MVS01,00000,0001,123456,17,02,2024,0.0,abc,,,"),
+                         KngSnn.Flags.MALFORMED_SAMPLES)
+        self.assertEqual(KngSnn().parse("$MVS01,CALC,..."), KngSnn.Flags.UNSUPPORTED)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestKngSnn))
+    return s
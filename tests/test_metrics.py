@@ -0,0 +1,167 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.metrics import Histogram, MetricsServer, MetricsWriter
+from hyo2.kng.lib.sis import Sis
+from hyo2.kng.lib.sis_async import SisAsync
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        KngGenerator(ping_rate=100.0).write(self.path, count=3 + 2 * 10)
+
+        self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rx.bind(("127.0.0.1", 0))
+        self.rx.settimeout(5.0)
+
+    def tearDown(self):
+        self.rx.close()
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def scrape(port: int) -> str:
+        with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % port, timeout=5.0) as response:
+            return response.read().decode()
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=[0.1, 1.0])
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1.0, 3), (float("inf"), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_writer(self):
+        writer = MetricsWriter()
+        writer.counter("datagrams_sent", "Datagrams transmitted", 3, {"id": writer.id_label(b'#MRZ')})
+        writer.counter("datagrams_sent", "Datagrams transmitted", 4, {"id": writer.id_label(0x58)})
+        writer.gauge("pacing_requested_rate", "Requested rate", float("inf"))
+        writer.histogram("latency_seconds", "Latency", Histogram(buckets=[1.0]))
+        text = writer.render()
+
+        self.assertEqual(text.count("# TYPE kng_datagrams_sent_total counter"), 1)
+        self.assertIn('kng_datagrams_sent_total{id="#MRZ"} 3.0', text)
+        self.assertIn('kng_datagrams_sent_total{id="0x58"} 4.0', text)
+        self.assertIn("kng_pacing_requested_rate +Inf", text)
+        self.assertIn('kng_latency_seconds_bucket{le="+Inf"} 0.0', text)
+        self.assertIn("kng_latency_seconds_count 0.0", text)
+
+    def test_server(self):
+        server = MetricsServer(collect=lambda: "kng_up 1.0\n", port=0)
+        server.start()
+        try:
+            self.assertEqual(self.scrape(server.port), "kng_up 1.0\n")
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen("http://127.0.0.1:%d/other" % server.port, timeout=5.0)
+
+        finally:
+            server.stop()
+        self.assertEqual(server.scrapes, 1)
+
+    def check_engine(self, sis_class):
+        sis = sis_class(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001,
+                        loops=1, sounder_name="EM2040", metrics_port=0)
+        sis.set_files([self.path])
+        sis.start()
+        try:
+            for _ in range(23):
+                self.rx.recvfrom(2 ** 16)
+
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            tx.sendto(b"$KSSIS,997", ("127.0.0.1", self.port_in(sis)))
+            tx.close()
+            data, _ = self.rx.recvfrom(2 ** 16)
+            self.assertEqual(data, b"$KSSIS,12,EM2040")
+            time.sleep(0.05)
+
+            text = self.scrape(sis.metrics_server.port)
+
+        finally:
+            sis.stop()
+        self.assertIsNone(sis.metrics_server)
+
+        self.assertIn('kng_datagrams_read_total{id="#MRZ"} 10.0', text)
+        self.assertIn('kng_datagrams_sent_total{id="#MRZ"} 10.0', text)
+        self.assertIn('kng_svp_requests_total{type="KSSIS_997"} 1.0', text)
+        self.assertIn("kng_svp_reply_latency_seconds_count 1.0", text)
+        self.assertIn("kng_pacing_lag_seconds ", text)
+        self.assertIn("kng_send_errors_total 0.0", text)
+
+    @staticmethod
+    def port_in(sis) -> int:
+        if isinstance(sis, SisAsync):
+            return sis._transport_in.get_extra_info("sockname")[1]
+        for _ in range(100):
+            if sis.t_svp.sock_in is not None:
+                break
+            time.sleep(0.01)
+        return sis.t_svp.sock_in.getsockname()[1]
+
+    def test_sis(self):
+        self.check_engine(Sis)
+
+    def test_terminate(self):
+        path = os.path.join(self.folder, "timings.json")
+        sis = Sis(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001,
+                  metrics_port=0, instrument_path=path)
+        sis.set_files([self.path])
+        sis.start()
+        self.rx.recvfrom(2 ** 16)
+
+        with self.assertLogs("hyo2.kng.lib.sis", level="INFO") as logs:
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            tx.sendto(b"$KSSIS,24", ("127.0.0.1", self.port_in(sis)))
+            tx.close()
+            self.assertTrue(sis.terminated.wait(5.0))
+
+            # the terminate command stops the simulator as the application does
+            stoppers = [threading.Thread(target=sis.stop) for _ in range(4)]
+            for stopper in stoppers:
+                stopper.start()
+            sis.stop()
+            for stopper in stoppers:
+                stopper.join()
+
+        self.assertIsNone(sis.metrics_server)
+        self.assertFalse(sis.t_replay.is_alive())
+        self.assertEqual(len([record for record in logs.output if "stage timings" in record]), 1)
+        self.assertTrue(os.path.exists(path))
+
+    def test_sis_async(self):
+        self.check_engine(SisAsync)
+
+    def test_busy_port(self):
+        busy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        busy.bind(("127.0.0.1", 0))
+        busy.listen(1)
+        try:
+            for sis_class in [Sis, SisAsync]:
+                sis = sis_class(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1",
+                                replay_timing=0.001, loops=1, metrics_port=busy.getsockname()[1])
+                sis.set_files([self.path])
+                with self.assertRaises(OSError):
+                    sis.start()
+                sis.stop()
+
+        finally:
+            busy.close()
+        # the simulators did not start replaying
+        self.assertIsNone(sis.metrics_server)
+        self.assertEqual(threading.active_count(), 1)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMetrics))
+    return s
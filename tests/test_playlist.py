@@ -0,0 +1,44 @@
+import itertools
+import unittest
+
+from hyo2.kng.lib.playlist import Playlist
+
+
+class TestPlaylist(unittest.TestCase):
+
+    def test_loops(self):
+        playlist = Playlist(files=["a", "b"], loops=2)
+        self.assertEqual(list(playlist), [(0, 0, "a"), (0, 1, "b"), (1, 0, "a"), (1, 1, "b")])
+
+    def test_forever(self):
+        playlist = Playlist(files=["a", "b", "c"])
+        self.assertEqual(list(itertools.islice(playlist, 10))[-1], (3, 0, "a"))
+        self.assertEqual(len(playlist), 3)
+
+    def test_cursor(self):
+        playlist = Playlist(files=["a", "b"], loops=2)
+        playlist.move(loop=1, file_index=1, path="b")
+        playlist.offset = 1024
+        self.assertIn("loop: 2/2", playlist.info())
+        self.assertIn("offset: 1024", playlist.info())
+        playlist.finish()
+        self.assertTrue(playlist.finished)
+        self.assertEqual(playlist.loop, 2)
+
+    def test_shuffle(self):
+        files = ["f%d" % i for i in range(20)]
+        playlist = Playlist(files=files, loops=3, shuffle=True, seed=0)
+        paths = [path for _, _, path in playlist]
+        for loop in range(3):
+            self.assertEqual(sorted(paths[loop * 20:(loop + 1) * 20]), sorted(files))
+        self.assertNotEqual(paths[:20], files)
+
+    def test_empty(self):
+        playlist = Playlist(files=[])
+        self.assertEqual(list(playlist), [])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPlaylist))
+    return s
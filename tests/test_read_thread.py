@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hyo2.kng.lib.playlist import Playlist
+from hyo2.kng.lib.replay_reader import FileMark, ReplayReader
+from hyo2.kng.lib.threads.read_thread import ReadThread
+from tests.test_kng_index import all_datagram, kmall_datagram
+
+
+class TestReadThread(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        with open(self.path, "wb") as fod:
+            for i in range(10):
+                fod.write(kmall_datagram(b"#MRZ", time_sec=1708128000 + i))
+                fod.write(kmall_datagram(b"#SKM", time_sec=1708128000 + i))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_read_ahead(self):
+        playlist = Playlist(files=[self.path], loops=2)
+        reader = ReplayReader(playlist=playlist, dg_ids=[b"#MRZ"])
+        thread = ReadThread(reader=reader, queue_size=4)
+        thread.start()
+
+        items = list()
+        while True:
+            item = thread.queue.get(timeout=5.0)
+            if item is None:
+                break
+            items.append(item)
+        thread.join()
+
+        marks = [item for item in items if isinstance(item, FileMark)]
+        self.assertEqual([(mark.loop, mark.file_index) for mark in marks], [(0, 0), (1, 0)])
+        datagrams = [item for item in items if not isinstance(item, FileMark)]
+        self.assertEqual(len(datagrams), 20)
+        self.assertTrue(all(dg_id == b"#MRZ" for dg_id, _, _, _ in datagrams))
+        self.assertGreater(thread.full_count, 0)
+
+    def test_merge(self):
+        other = os.path.join(self.folder, "other.kmall")
+        with open(other, "wb") as fod:
+            for i in range(5):
+                fod.write(kmall_datagram(b"#MRZ", time_sec=1708128000 + 2 * i + 1))
+
+        playlist = Playlist(files=[self.path, other], loops=2, merge=True)
+        reader = ReplayReader(playlist=playlist, dg_ids=[b"#MRZ"])
+        items = list(reader.datagrams())
+
+        marks = [item for item in items if isinstance(item, FileMark)]
+        self.assertEqual([mark.loop for mark in marks], [0, 1])
+        times = [item[1] for item in items[1:16]]
+        self.assertEqual(len(times), 15)
+        self.assertEqual(times, sorted(times))
+        self.assertIn("2 merged", playlist.info())
+
+    def test_empty_loop(self):
+        empty = os.path.join(self.folder, "empty.kmall")
+        open(empty, "wb").close()
+
+        for merge in [False, True]:
+            # no replayed datagrams in a loop: the playlist ends rather than looping forever
+            for files, dg_ids in [([empty], [b"#MRZ"]), ([self.path, empty], [b"#SPO"])]:
+                playlist = Playlist(files=files, loops=None, merge=merge)
+                reader = ReplayReader(playlist=playlist, dg_ids=dg_ids)
+                items = list(reader.datagrams())
+                self.assertTrue(all(isinstance(item, FileMark) for item in items))
+                self.assertEqual({item.loop for item in items}, {0})
+
+    def test_unindexable_file(self):
+        tiny = os.path.join(self.folder, "tiny.all")
+        with open(tiny, "wb") as fod:
+            fod.write(b"\x00\x00\x00")
+        folder = os.path.join(self.folder, "folder.all")  # the index build fails
+        os.mkdir(folder)
+        good = os.path.join(self.folder, "good.all")
+        with open(good, "wb") as fod:
+            for i in range(3):
+                fod.write(all_datagram(0x58, time=1000 * i))
+
+        for merge in [False, True]:
+            playlist = Playlist(files=[tiny, folder, good], loops=1, merge=merge)
+            reader = ReplayReader(playlist=playlist, dg_ids=[0x58])
+            items = list(reader.datagrams())
+            datagrams = [item for item in items if not isinstance(item, FileMark)]
+            self.assertEqual(len(datagrams), 3)
+
+    def test_stop(self):
+        playlist = Playlist(files=[self.path])
+        reader = ReplayReader(playlist=playlist, dg_ids=[b"#MRZ"])
+        thread = ReadThread(reader=reader, queue_size=2)
+        thread.start()
+        thread.stop()
+        thread.join(timeout=5.0)
+        self.assertFalse(thread.is_alive())
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestReadThread))
+    return s
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hyo2.kng.lib.playlist import Playlist
+from hyo2.kng.lib.replay_cache import ReplayCache
+from hyo2.kng.lib.replay_reader import FileMark, ReplayReader
+from tests.test_kng_index import kmall_datagram
+
+
+class TestReplayCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        self._write(count=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, count: int, body: bytes = b"\x00" * 8) -> None:
+        with open(self.path, "wb") as fod:
+            for i in range(count):
+                fod.write(kmall_datagram(b"#MRZ", body=body, time_sec=1708128000 + i))
+
+    @staticmethod
+    def _read(reader: ReplayReader) -> list:
+        return [item for item in reader.datagrams() if not isinstance(item, FileMark)]
+
+    def test_fit(self):
+        reader = ReplayReader(playlist=Playlist(files=[self.path], loops=3), dg_ids=[b"#MRZ"], cache_budget=2 ** 20)
+        datagrams = self._read(reader)
+        self.assertEqual(len(datagrams), 30)
+        self.assertEqual(datagrams[:10], datagrams[10:20])
+        self.assertEqual((reader.cache.hits, reader.cache.misses), (2, 1))
+        self.assertGreater(reader.cache.size, 0)
+
+    def test_streamed(self):
+        reader = ReplayReader(playlist=Playlist(files=[self.path], loops=2), dg_ids=[b"#MRZ"], cache_budget=100)
+        self.assertEqual(len(self._read(reader)), 20)
+        self.assertEqual(reader.cache.hits, 0)
+        self.assertEqual(reader.cache.size, 0)
+
+    def test_incomplete_read(self):
+        reader = ReplayReader(playlist=Playlist(files=[self.path], loops=1), dg_ids=[b"#MRZ"], cache_budget=2 ** 20)
+        datagrams = reader.datagrams()
+        for _ in range(3):
+            next(datagrams)
+        self.assertGreater(reader.cache.size, 0)  # reserved while reading
+        datagrams.close()
+        self.assertEqual(reader.cache.size, 0)
+        self.assertIsNone(reader.cache.get((self.path, (b"#MRZ", ))))
+
+    def test_file_changed(self):
+        reader = ReplayReader(playlist=Playlist(files=[self.path], loops=1), dg_ids=[b"#MRZ"], cache_budget=2 ** 20)
+        self.assertEqual(len(self._read(reader)), 10)
+        size = reader.cache.size
+
+        self._write(count=5, body=b"\x01" * 8)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        reader.playlist = Playlist(files=[self.path], loops=2)
+        datagrams = self._read(reader)
+        self.assertEqual(len(datagrams), 10)
+        self.assertTrue(all(data[20:28] == b"\x01" * 8 for _, _, data, _ in datagrams))
+        self.assertEqual(reader.cache.size, size // 2)  # the outdated entry is released
+        self.assertEqual(reader.cache.hits, 1)
+
+    def test_outdated_reservation(self):
+        cache = ReplayCache(budget=1000)
+        self.assertTrue(cache.reserve("key", data_size=800, nr_items=0, version=1))
+        self.assertFalse(cache.reserve("other", data_size=800, nr_items=0, version=1))
+        self.assertTrue(cache.reserve("key", data_size=700, nr_items=0, version=2))
+        self.assertEqual(cache.size, 700)
+        cache.put("key", [])
+        self.assertEqual(cache.get("key", version=2), [])
+        self.assertIsNone(cache.get("key", version=3))
+        self.assertEqual(cache.size, 0)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestReplayCache))
+    return s
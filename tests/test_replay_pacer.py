@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from hyo2.kng.lib.replay_pacer import ReplayPacer
+
+
+class TestReplayPacer(unittest.TestCase):
+
+    def test_fixed(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.FIXED, timing=10.0)
+        first = pacer.schedule(0.0)
+        self.assertAlmostEqual(pacer.schedule(100.0) - first, 10.0, places=2)
+
+    def test_fixed_catch_up(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.FIXED, timing=0.001, max_lag=0.5)
+        first = pacer.schedule(0.0)
+        time.sleep(0.05)
+        self.assertAlmostEqual(pacer.schedule(0.0) - first, 0.001)  # late, but still chained
+        pacer.max_lag = 0.01
+        self.assertGreater(pacer.schedule(0.0) - first, 0.04)  # re-anchored
+        self.assertEqual(pacer.lag_resets, 1)
+
+    def test_rates(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.FIXED, timing=0.001)
+        shutdown = threading.Event()
+        for _ in range(20):
+            self.assertTrue(pacer.wait_until(pacer.schedule(0.0), shutdown))
+        self.assertEqual(pacer.count, 20)
+        self.assertAlmostEqual(pacer.requested_rate(), 1000.0)
+        self.assertGreater(pacer.achieved_rate(), 500.0)
+
+    def test_timestamp(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.TIMESTAMP, speed=2.0)
+        first = pacer.schedule(1000.0)
+        self.assertAlmostEqual(pacer.schedule(1004.0) - first, 2.0, places=2)
+
+    def test_timestamp_rebase(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.TIMESTAMP, speed=1.0, max_gap=10.0)
+        first = pacer.schedule(1000.0)
+        self.assertLess(pacer.schedule(900.0) - first, 1.0)  # backward
+        self.assertLess(pacer.schedule(2000.0) - first, 1.0)  # gap
+
+    def test_as_fast_as_possible(self):
+        pacer = ReplayPacer(mode=ReplayPacer.Modes.TIMESTAMP, speed=0.0)
+        first = pacer.schedule(1000.0)
+        self.assertLess(pacer.schedule(1005.0) - first, 1.0)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestReplayPacer))
+    return s
@@ -0,0 +1,40 @@
+import unittest
+
+from hyo2.kng.lib.reply_router import ReplyRouter
+
+
+class TestReplyRouter(unittest.TestCase):
+
+    def test_fixed(self):
+        router = ReplyRouter(ip_out="10.0.0.1", port_out=16103)
+        self.assertEqual(router.route(("10.0.0.2", 5000)), ("10.0.0.1", 16103))
+        self.assertEqual(router.route(), ("10.0.0.1", 16103))
+
+    def test_sender(self):
+        router = ReplyRouter(ip_out="10.0.0.1", port_out=16103, mode=ReplyRouter.Modes.SENDER)
+        self.assertEqual(router.route(("10.0.0.2", 5000)), ("10.0.0.2", 5000))
+        self.assertEqual(router.route(("10.0.0.3", 5001)), ("10.0.0.3", 5001))
+        self.assertEqual(router.route(), ("10.0.0.1", 16103))
+        self.assertEqual(len(router.clients), 2)
+
+    def test_table(self):
+        routes = {"10.0.0.2:5000": ("10.0.0.2", 16104), "10.0.0.3": ("10.0.0.3", 16105)}
+        router = ReplyRouter(ip_out="10.0.0.1", port_out=16103, mode=ReplyRouter.Modes.TABLE, routes=routes)
+        self.assertEqual(router.route(("10.0.0.2", 5000)), ("10.0.0.2", 16104))
+        self.assertEqual(router.route(("10.0.0.2", 5001)), ("10.0.0.1", 16103))
+        self.assertEqual(router.route(("10.0.0.3", 5002)), ("10.0.0.3", 16105))
+        self.assertIn("10.0.0.2:5000 -> 1 requests", router.info())
+
+    def test_max_clients(self):
+        router = ReplyRouter(ip_out="10.0.0.1", port_out=16103, max_clients=2)
+        router.route(("10.0.0.2", 5000))
+        router.route(("10.0.0.3", 5000))
+        router.route(("10.0.0.2", 5000))
+        router.route(("10.0.0.4", 5000))  # the least recent client (10.0.0.3) is dropped
+        self.assertEqual(list(router.clients.items()), [(("10.0.0.2", 5000), 2), (("10.0.0.4", 5000), 1)])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestReplyRouter))
+    return s
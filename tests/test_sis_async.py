@@ -0,0 +1,111 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from hyo2.kng.lib.sis_async import SisAsync
+from tests.test_kng_index import kmall_datagram
+
+
+class TestSisAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        with open(self.path, "wb") as fod:
+            for i in range(50):
+                fod.write(kmall_datagram(b"#MRZ", time_sec=1708128000 + i))
+
+        self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rx.bind(("127.0.0.1", 0))
+        self.rx.settimeout(5.0)
+
+    def tearDown(self):
+        self.rx.close()
+        shutil.rmtree(self.folder)
+
+    def test_replay(self):
+        sis = SisAsync(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001,
+                       loops=2)
+        sis.set_files([self.path])
+        sis.start()
+        try:
+            for _ in range(100):
+                data, _ = self.rx.recvfrom(2 ** 16)
+                self.assertEqual(data[4:8], b"#MRZ")
+
+            # the end of the playlist is detected by the next read
+            for _ in range(100):
+                if sis.playlist.finished:
+                    break
+                time.sleep(0.01)
+
+        finally:
+            start = time.perf_counter()
+            sis.stop()
+            self.assertLess(time.perf_counter() - start, 1.0)
+
+        self.assertTrue(sis.playlist.finished)
+        self.assertEqual(sis.replay.counters.get(b'#MRZ').count, 100)
+
+    def test_control(self):
+        sis = SisAsync(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001,
+                       sounder_name="EM124_101")
+        sis.set_files([self.path])
+        sis.start()
+        try:
+            port_in = sis._transport_in.get_extra_info("sockname")[1]
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.rx.recvfrom(2 ** 16)
+
+            tx.sendto(b"$KSSIS,457,EM124_101", ("127.0.0.1", port_in))
+            self._drain()
+            tx.sendto(b"$KSSIS,997", ("127.0.0.1", port_in))
+            data, _ = self.rx.recvfrom(2 ** 16)
+            self.assertEqual(data, b"$KSSIS,12,EM124_101")
+            self.assertFalse(sis.replay.pinging)
+
+            tx.sendto(b"$KSSIS,458,EM124_101", ("127.0.0.1", port_in))
+            data, _ = self.rx.recvfrom(2 ** 16)
+            self.assertEqual(data[4:8], b"#MRZ")
+            self.assertIsNotNone(sis.replay.start_latency)
+
+            tx.sendto(b"$KSSIS,24", ("127.0.0.1", port_in))
+            self.assertTrue(sis.terminated.wait(5.0))
+            tx.close()
+
+        finally:
+            sis.stop()
+
+    def _drain(self):
+        self.rx.settimeout(0.1)
+        try:
+            while True:
+                self.rx.recvfrom(2 ** 16)
+
+        except socket.timeout:
+            pass
+
+        finally:
+            self.rx.settimeout(5.0)
+
+    def test_start_failure(self):
+        busy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        busy.bind(("0.0.0.0", 0))
+        try:
+            sis = SisAsync(port_in=busy.getsockname()[1], port_out=self.rx.getsockname()[1], ip_out="127.0.0.1")
+            sis.set_files([self.path])
+            with self.assertRaises(OSError):
+                sis.start()
+            sis.stop()
+
+        finally:
+            busy.close()
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSisAsync))
+    return s
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from hyo2.kng.lib.kng_generator import KngGenerator
+from hyo2.kng.lib.sis import Sis
+from hyo2.kng.lib.sis_async import SisAsync
+from hyo2.kng.lib.stage_timer import StageTimer, timings_summary
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.kmall")
+        KngGenerator(ping_rate=100.0).write(self.path, count=3 + 2 * 10)
+
+        self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rx.bind(("127.0.0.1", 0))
+        self.rx.settimeout(5.0)
+
+    def tearDown(self):
+        self.rx.close()
+        shutil.rmtree(self.folder)
+
+    def test_record(self):
+        timer = StageTimer("TEST")
+        now = timer.record("send", 0)
+        self.assertGreater(now, 0)
+        for duration in [1000, 3000, 5000]:
+            timer.record("send", timer.record("handle", now) - duration)
+
+        stages = timer.to_dict()
+        self.assertEqual(stages["send"]["count"], 4)
+        self.assertEqual(stages["handle"]["count"], 3)
+        self.assertGreaterEqual(stages["handle"]["max_us"], 0.0)
+        self.assertGreaterEqual(stages["send"]["p50_us"], 2.048)
+        self.assertLessEqual(stages["send"]["p50_us"], 8.192)
+        self.assertEqual(sum(stages["send"]["buckets_ns"].values()), 4)
+
+        summary = timings_summary([timer])
+        self.assertIn("TEST/send", summary)
+        self.assertIn("TEST/handle", summary)
+
+    def check_engine(self, sis_class, read_name, stages):
+        path = os.path.join(self.folder, "timings.json")
+        sis = sis_class(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001,
+                        loops=1, instrument_path=path)
+        sis.set_files([self.path])
+        sis.start()
+        try:
+            for _ in range(23):
+                self.rx.recvfrom(2 ** 16)
+
+        finally:
+            sis.stop()
+
+        with open(path) as fid:
+            timings = json.load(fid)
+        self.assertEqual(timings, json.loads(json.dumps(sis.timings())))
+        self.assertEqual(timings[read_name]["read"]["count"], 23)
+        self.assertEqual(timings[read_name]["index"]["count"], 1)
+        for stage in stages:
+            self.assertEqual(timings[stage[0]][stage[1]]["count"], 23)
+
+    def test_sis(self):
+        self.check_engine(Sis, "REP-READ", [("REP", "pace"), ("REP", "handle"), ("REP", "send")])
+
+    def test_sis_async(self):
+        self.check_engine(SisAsync, "READ", [("LOOP", "pace"), ("LOOP", "handle"), ("LOOP", "send")])
+
+    def test_disabled(self):
+        sis = Sis(port_in=0, port_out=self.rx.getsockname()[1], ip_out="127.0.0.1", replay_timing=0.001, loops=1)
+        sis.set_files([self.path])
+        sis.start()
+        try:
+            self.rx.recvfrom(2 ** 16)
+
+        finally:
+            sis.stop()
+        self.assertIsNone(sis.t_replay.timer)
+        self.assertEqual(sis.timings(), dict())
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStageTimer))
+    return s
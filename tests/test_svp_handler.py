@@ -0,0 +1,121 @@
+import os
+import struct
+import time
+import unittest
+
+import numpy as np
+
+from hyo2.kng.lib.datagram_store import DatagramStore
+from hyo2.kng.lib.svp_handler import SvpHandler
+from tests.test_kng_snn import snn_datagram
+
+
+class TestSvpHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DatagramStore()
+        self.store.installation.put(b"IIP")
+        self.store.runtime.put(b"IOP")
+        self.handler = SvpHandler(store=self.store, use_sis5=True)
+
+    def test_fake_profile(self):
+        plan = self.handler.handle("$KSSIS,454,")
+        self.assertEqual(len(plan), 1)
+        self.assertEqual(plan[0][0], 1.5)
+        self.assertEqual(plan[0][1][4:8], b"#SVP")
+        self.assertEqual(self.store.ssp.snapshot(), (plan[0][1], ))
+        self.assertEqual(self.handler.k454_count, 1)
+
+    def test_latest_profile(self):
+        self.store.ssp.put(b"SVP")
+        plan = self.handler.handle("$KSSIS,454,")
+        self.assertEqual(plan, [(0.0, b"IIP"), (0.5, b"IOP"), (2.0, b"SVP")])
+        self.assertEqual(self.handler.ssp_count, 1)
+
+    def test_received_profile(self):
+        plan = self.handler.handle(snn_datagram([0.0, 10.0], [1500.0, 1501.0], [10.0, 9.0], [35.0, 34.0]))
+        self.assertEqual(len(plan), 1)
+        svp = plan[0][1]
+        self.assertEqual(struct.unpack("<H", svp[22:24])[0], 2)
+        self.assertEqual(struct.unpack("<2fI2f", svp[-24:-4]), (10.0, 1501.0, 0, 9.0, 34.0))
+        self.assertEqual(self.handler.snn_count, 1)
+
+        self.assertEqual(self.handler.handle("$MVS01,00000,0002,"), [])
+        self.assertEqual(self.handler.snn_rejected_count, 1)
+
+    @unittest.skipUnless(hasattr(time, "tzset"), "requires time.tzset")
+    def test_received_profile_time(self):
+        tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+        try:
+            plan = self.handler.handle(snn_datagram([0.0, 10.0], [1500.0, 1501.0], [10.0, 9.0], [35.0, 34.0]))
+
+        finally:
+            if tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = tz
+            time.tzset()
+
+        svp = plan[0][1]
+        self.assertEqual(struct.unpack("<I", svp[12:16])[0], 1708173296)  # 2024-02-17 12:34:56 UTC
+        self.assertEqual(struct.unpack("<I", svp[28:32])[0], 1708173296)
+
+    def test_encoding_cache(self):
+        data = snn_datagram([0.0, 10.0], [1500.0, 1501.0], [10.0, 9.0], [35.0, 34.0])
+        first = self.handler.handle(data)
+        for _ in range(5):
+            self.assertEqual(self.handler.handle(data), first)
+        self.assertEqual((self.handler.encoding_hits, self.handler.encoding_misses), (5, 1))
+        self.assertEqual(len(self.store.ssp), 1)
+
+        for i in range(self.store.ssp.history + SvpHandler.encoding_cache_size):
+            self.handler.handle(snn_datagram([0.0, 11.0 + i], [1500.0, 1501.0], [10.0, 9.0], [35.0, 34.0]))
+        self.assertEqual(len(self.store.ssp), self.store.ssp.history)
+        self.handler.handle(data)
+        self.assertEqual(self.handler.encoding_misses, self.store.ssp.history + SvpHandler.encoding_cache_size + 2)
+
+    def test_control(self):
+        calls = list()
+        self.handler.on_start_pinging = lambda: calls.append("start")
+        self.handler.on_stop_pinging = lambda: calls.append("stop")
+        self.handler.on_terminate = lambda: calls.append("terminate")
+        self.assertEqual(self.handler.handle("$KSSIS,457,EM124_101"), [])
+        self.assertEqual(self.handler.handle("$KSSIS,458,EM124_101"), [])
+        self.assertEqual(self.handler.handle("$KSSIS,24"), [])
+        self.assertEqual(calls, ["stop", "start", "terminate"])
+
+        self.assertEqual(self.handler.handle("$KSSIS,997"), [(0.0, b"$KSSIS,12,EM")])
+        self.store.installation.put(b"\x00\x00\x00\x00#IIP\x00\x00\x7c\x00")
+        self.assertEqual(self.handler.emulated_sounder(), "EM124")
+
+    def test_unknown(self):
+        self.assertEqual(self.handler.handle("$ABCDE,1"), [])
+        self.assertEqual(self.handler.handle("$A"), [])
+
+    def test_sis4(self):
+        handler = SvpHandler(store=DatagramStore(), use_sis5=False)
+        plan = handler.handle("$PSR20,")
+        self.assertEqual(len(plan), 1)
+        self.assertEqual(plan[0][1][1], 0x55)
+        self.assertEqual(handler.r20_count, 1)
+
+    def test_encoding(self):
+        depths = np.linspace(0.0, 6000.123, 1000)
+        speeds = np.linspace(1540.17, 1480.03, 1000)
+
+        svp = self.handler._create_sis5_ssp(depths=depths, speeds=speeds)
+        self.assertEqual(struct.unpack("<I", svp[:4])[0], len(svp))
+        points = b"".join(struct.pack("<2fI2f", d, s, 0, 0.0, 0.0) for d, s in zip(depths, speeds))
+        self.assertEqual(svp[-4 - len(points):-4], points)
+
+        svp = self.handler._create_sis4_ssp(depths=depths, speeds=speeds)
+        pairs = b"".join(struct.pack("<II", int(d / 0.01), int(s * 10)) for d, s in zip(depths, speeds))
+        self.assertEqual(svp[-3 - len(pairs):-3], pairs)
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSvpHandler))
+    return s
@@ -0,0 +1,48 @@
+import threading
+import time
+import unittest
+
+from hyo2.kng.lib.threads.timer_thread import TimerThread
+
+
+class TestTimerThread(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = TimerThread()
+        self.timer.start()
+
+    def tearDown(self):
+        self.timer.stop()
+        self.timer.join()
+
+    def test_order(self):
+        calls = list()
+        done = threading.Event()
+        self.timer.schedule(0.04, calls.append, "c")
+        self.timer.schedule(0.02, calls.append, "b")
+        self.timer.schedule(0.0, calls.append, "a")
+        self.timer.schedule(0.04, done.set)
+        self.assertTrue(done.wait(2.0))
+        self.assertEqual(calls, ["a", "b", "c"])
+
+    def test_delay(self):
+        done = threading.Event()
+        start = time.monotonic()
+        self.timer.schedule(0.05, done.set)
+        self.assertTrue(done.wait(2.0))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_stop(self):
+        calls = list()
+        self.timer.schedule(10.0, calls.append, "late")
+        self.assertEqual(self.timer.pending, 1)
+        self.timer.stop()
+        self.timer.join(timeout=1.0)
+        self.assertFalse(self.timer.is_alive())
+        self.assertEqual(calls, [])
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestTimerThread))
+    return s
@@ -0,0 +1,41 @@
+import socket
+import unittest
+
+from hyo2.kng.lib.udp_sender import UdpSender
+
+
+class TestUdpSender(unittest.TestCase):
+
+    def setUp(self):
+        self.sock_in = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock_in.bind(("127.0.0.1", 0))
+        self.sock_in.settimeout(1.0)
+        self.sock_out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.sock_in.close()
+        self.sock_out.close()
+
+    def _check(self, sender: UdpSender):
+        datagrams = [bytes([i]) * (i + 1) for i in range(10)]
+        for data in datagrams:
+            sender.add(data)
+        sender.flush()
+        self.assertEqual(sender.pending, 0)
+        self.assertEqual(sender.packets, len(datagrams))
+        self.assertEqual(sender.bytes, sum(len(data) for data in datagrams))
+        self.assertEqual([self.sock_in.recvfrom(2 ** 16)[0] for _ in datagrams], datagrams)
+
+    def test_batch(self):
+        self._check(UdpSender(sock=self.sock_out, ip_out="127.0.0.1", port_out=self.sock_in.getsockname()[1],
+                              batch_size=4))
+
+    def test_sendto(self):
+        self._check(UdpSender(sock=self.sock_out, ip_out="127.0.0.1", port_out=self.sock_in.getsockname()[1],
+                              batch_size=4, use_sendmmsg=False))
+
+
+def suite():
+    s = unittest.TestSuite()
+    s.addTests(unittest.TestLoader().loadTestsFromTestCase(TestUdpSender))
+    return s